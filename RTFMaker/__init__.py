@@ -20,5 +20,7 @@ __version__ = '0.1.14'
 __author__ = 'Liang Chen'
 
 from .core import RTFDocument
+from .core import CompiledStyleSheet
+from .core import Fragment
 
 # -*- coding:utf-8 -*-
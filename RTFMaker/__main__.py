@@ -0,0 +1,292 @@
+"""
+__main__.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+batch converter of saved HTML pages, for example:
+
+    python -m RTFMaker -c config.json -o out/ -j 4 pages/ extra.html
+
+the config file (JSON, or YAML when PyYAML is installed) looks like:
+
+    {
+        "tag_set": [ {"data-rtf-extract": "page-title"}, ... ],
+        "css_font_def": { "large-font": "font-family:Arial;font-size:11pt;" },
+        "options": { "add.na": true }
+    }
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import time
+
+HTML_EXTENSIONS = ('.html', '.htm')
+RTF_EXTENSION = '.rtf'
+
+
+# errors of a config file that can not be used, see `_config_error`;
+CONFIG_ERRORS = (ValueError, RuntimeError, IOError, OSError)
+
+
+def _load_config(path, **kwargs):
+    """
+    @param path JSON or YAML config file (string)
+    @param tag_set.required whether the config has to give the tag set (boolean)
+
+    @note a malformed file raises `ValueError`, a YAML file without PyYAML
+    installed raises `RuntimeError`
+
+    @rtype dict
+    """
+    with open(path, 'r') as fh:
+        content = fh.read()
+    if os.path.splitext(path)[1].lower() in ('.yml', '.yaml'):
+        try:
+            import yaml
+        except ImportError:
+            _msg = 'PyYAML is required to read a YAML file'
+            raise RuntimeError(_msg)
+        try:
+            config = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            _msg = 'malformed YAML: {e}'.format(e=e)
+            raise ValueError(_msg)
+    else:
+        import json
+        config = json.loads(content)
+    if not isinstance(config, dict):
+        _msg = 'a mapping is expected'
+        raise ValueError(_msg)
+    if kwargs.get('tag_set.required', True) and not isinstance(config.get('tag_set', None), list):
+        _msg = "'tag_set' (list) is required"
+        raise ValueError(_msg)
+    css_font_def = config.get('css_font_def', None)
+    if isinstance(css_font_def, list):
+        # JSON/YAML have no tuples;
+        config['css_font_def'] = [ tuple(i) for i in css_font_def ]
+    return config
+
+
+def _config_error(path, error):
+    """print the error of the config file
+
+    @return the exit code (integer)
+    """
+    print('error: invalid config file: {p}: {e}'.format(p=path, e=error), file=sys.stderr)
+    return 2
+
+
+def _find_inputs(paths, out_dir=None, **kwargs):
+    """
+    @param paths HTML files and directories (list)
+    @param out_dir output directory, next to the input when omitted (string)
+
+    @return list of (input path, output path)
+    """
+    def _out_path(in_path, root):
+        name = os.path.splitext(os.path.relpath(in_path, root))[0] + RTF_EXTENSION
+        if out_dir is None:
+            return os.path.join(root, name)
+        return os.path.join(out_dir, name)
+
+    ret = list()
+    for a_path in paths:
+        if os.path.isdir(a_path):
+            for dir_path, dir_names, file_names in os.walk(a_path):
+                dir_names.sort()
+                for a_name in sorted(file_names):
+                    if os.path.splitext(a_name)[1].lower() in HTML_EXTENSIONS:
+                        in_path = os.path.join(dir_path, a_name)
+                        ret.append((in_path, _out_path(in_path, a_path)))
+        else:
+            ret.append((a_path, _out_path(a_path, os.path.dirname(a_path) or os.curdir)))
+    return ret
+
+
+def _is_up_to_date(in_path, out_path, since=0):
+    """
+    @param since the output is outdated when older than this (float)
+    """
+    try:
+        out_mtime = os.path.getmtime(out_path)
+    except OSError:
+        return False
+    return out_mtime >= max(os.path.getmtime(in_path), since)
+
+
+# translator and compiled stylesheet of the worker process;
+_WORKER = dict()
+
+
+def _prepare_worker(config):
+    """set up the translator and compile the stylesheet of the process,
+    the errors of the config are raised
+
+    @param config 'css_font_def', 'options' and the optional 'tag_set' (dict)
+    """
+    from .htmlconv import get_html_translator
+    translator = get_html_translator(object)()
+    options = dict(config.get('options', None) or {})
+    options['css_font_def'] = config.get('css_font_def', None)
+    options['stylesheet'] = translator.compile_stylesheet(**dict(options))
+    options.pop('css_font_def')
+    _WORKER.clear()
+    _WORKER['translator'] = translator
+    _WORKER['tag_set'] = config.get('tag_set', None)
+    _WORKER['options'] = options
+
+
+def _init_worker(config):
+    """initializer of the worker processes, an error is kept and reported
+    by each job: the pool would replace a worker that fails here forever
+
+    @param config the config checked by `_prepare_worker` in the parent process (dict)
+    """
+    try:
+        _prepare_worker(config)
+    except Exception as e:
+        _WORKER.clear()
+        _WORKER['error'] = 'worker not started, {c}: {m}'.format(c=e.__class__.__name__, m=e)
+
+
+def _get_worker():
+    """
+    @return the translator, the tag set and the options of the process (dict)
+    """
+    if 'error' in _WORKER:
+        raise RuntimeError(_WORKER['error'])
+    if len(_WORKER) == 0:
+        _msg = 'worker not started'
+        raise RuntimeError(_msg)
+    return _WORKER
+
+
+def _convert(job):
+    """
+    @param job (input path, output path)
+
+    @return (input path, input size, output size, error message)
+    """
+    in_path, out_path = job
+    try:
+        worker = _get_worker()
+        with open(in_path, 'rb') as fh:
+            raw_html = fh.read()
+        out_folder = os.path.dirname(out_path)
+        if out_folder and not os.path.isdir(out_folder):
+            try:
+                os.makedirs(out_folder)
+            except OSError:
+                # created by another worker in the meantime;
+                if not os.path.isdir(out_folder):
+                    raise
+        # never leave a partial output that looks up to date;
+        tmp_path = '{p}.{pid}.tmp'.format(p=out_path, pid=os.getpid())
+        try:
+            worker['translator'].translate_to_file(
+                raw_html, worker['tag_set'], tmp_path, **dict(worker['options'])
+            )
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            os.rename(tmp_path, out_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return (in_path, len(raw_html), os.path.getsize(out_path), None)
+    except Exception as e:
+        return (in_path, 0, 0, '{c}: {m}'.format(c=e.__class__.__name__, m=e))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='python -m RTFMaker',
+        description='convert saved HTML pages into RTF documents',
+    )
+    parser.add_argument('inputs', nargs='+', help='HTML files or directories')
+    parser.add_argument('-c', '--config', required=True, help='JSON or YAML file with tag_set and css_font_def')
+    parser.add_argument('-o', '--output', default=None, help='output directory, next to the input by default')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('-f', '--force', action='store_true', help='convert the inputs that are up to date too')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print errors and the summary')
+    args = parser.parse_args(argv)
+
+    try:
+        config = _load_config(args.config)
+        # an invalid config fails here once, before any worker is started;
+        _prepare_worker(config)
+    except CONFIG_ERRORS as e:
+        return _config_error(args.config, e)
+    all_jobs = _find_inputs(args.inputs, out_dir=args.output)
+    if args.force:
+        jobs = all_jobs
+    else:
+        config_mtime = os.path.getmtime(args.config)
+        jobs = [ i for i in all_jobs if not _is_up_to_date(i[0], i[1], config_mtime) ]
+
+    cnt_done = 0
+    cnt_error = 0
+    bytes_in = 0
+    bytes_out = 0
+    time_start = time.time()
+    if len(jobs) > 0:
+        if args.jobs > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(args.jobs, len(jobs)), _init_worker, (config,))
+            results = pool.imap_unordered(_convert, jobs)
+        else:
+            pool = None
+            results = (_convert(i) for i in jobs)
+        try:
+            for in_path, in_size, out_size, error in results:
+                if error is not None:
+                    cnt_error += 1
+                    print('error: {p}: {e}'.format(p=in_path, e=error), file=sys.stderr)
+                    continue
+                cnt_done += 1
+                bytes_in += in_size
+                bytes_out += out_size
+                if not args.quiet:
+                    print(in_path)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    elapsed = max(time.time() - time_start, 1e-6)
+
+    print(
+        '{d} converted, {s} skipped, {e} failed in {t:.2f}s: '
+        '{fps:.1f} files/s, {mbps:.2f} MB/s in, {mbps_out:.2f} MB/s out'.format(
+            d=cnt_done,
+            s=len(all_jobs) - len(jobs),
+            e=cnt_error,
+            t=elapsed,
+            fps=cnt_done / elapsed,
+            mbps=bytes_in / elapsed / (1024.0 * 1024.0),
+            mbps_out=bytes_out / elapsed / (1024.0 * 1024.0),
+        )
+    )
+    return 1 if cnt_error > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+#--eof--#
@@ -0,0 +1,288 @@
+"""
+aio.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+asyncio entry points, the CPU-bound work runs in a thread or process
+executor so that the event loop is never blocked.
+
+@note this module requires Python 3
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import weakref
+
+
+class StageCancelled(Exception):
+    """raised inside of the worker to stop a cancelled job between stages"""
+    pass
+
+
+def _stage_guard(cancel_event, callback=None):
+    """
+    @param cancel_event set when the job is cancelled
+    @param callback the stage callback given by the caller, called after the check (callable)
+    """
+    def _check(stage):
+        if cancel_event is not None and cancel_event.is_set():
+            raise StageCancelled(stage)
+        if callback is not None:
+            callback(stage)
+    return _check
+
+
+_TRANSLATOR_CACHE = dict()
+
+
+def _get_translator(base_cls):
+    """one translator class per base class, in each worker"""
+    translator_cls = _TRANSLATOR_CACHE.get(base_cls, None)
+    if translator_cls is None:
+        from .htmlconv import get_html_translator
+        translator_cls = get_html_translator(base_cls)
+        _TRANSLATOR_CACHE[base_cls] = translator_cls
+    return translator_cls
+
+
+def _render_job(cancel_event, kwargs, document):
+    kwargs = dict(kwargs)
+    kwargs['callback.stage'] = _stage_guard(cancel_event, kwargs.get('callback.stage', None))
+    return document.to_string(**kwargs)
+
+
+def _translate_job(cancel_event, kwargs, base_cls, raw_html, tag_set):
+    kwargs = dict(kwargs)
+    kwargs['callback.stage'] = _stage_guard(cancel_event, kwargs.get('callback.stage', None))
+    return _get_translator(base_cls)().translate(raw_html, tag_set, **kwargs)
+
+
+def _discard_result(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class _ChunkSink(object):
+    """file-like object that hands the written data (bytes) over to the event loop in chunks"""
+
+    def __init__(self, loop, queue, chunk_size, cancel_event):
+        self._loop = loop
+        self._queue = queue
+        self._chunk_size = chunk_size
+        self._cancel_event = cancel_event
+        self._cache = list()
+        self._size = 0
+
+    def _put(self, item):
+        # blocks the worker while the queue is full;
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        future.result()
+
+    def write(self, data):
+        if self._cancel_event.is_set():
+            raise StageCancelled('write')
+        self._cache.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._size > 0:
+            chunk = b''.join(self._cache)
+            self._cache = list()
+            self._size = 0
+            self._put(chunk)
+
+
+class AsyncRenderer(object):
+    """run translation and rendering from coroutines
+
+    @note with a process executor, documents and arguments are pickled
+    into the worker processes, and the translator is created in the worker
+    from `base_cls`
+    """
+
+    _DONE = object()
+
+    def __init__(self, executor=None, max_concurrency=4, **kwargs):
+        """
+        @param executor thread or process pool, the default executor of the loop when omitted (`concurrent.futures.Executor`)
+        @param max_concurrency maximum number of jobs running at the same time (integer)
+        """
+        assert max_concurrency >= 1, 'invalid concurrency limit'
+        self._executor = executor
+        self._max_concurrency = max_concurrency
+        # semaphore of each event loop, a semaphore can not be shared by loops;
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._manager = None
+
+    @property
+    def uses_processes(self):
+        return isinstance(self._executor, concurrent.futures.ProcessPoolExecutor)
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        ret = self._semaphores.get(loop, None)
+        if ret is None:
+            ret = asyncio.Semaphore(self._max_concurrency)
+            self._semaphores[loop] = ret
+        return ret
+
+    async def _start(self, func, *args):
+        """wait for a free slot, then start the job in the executor; the
+        slot is given back when the job ends, not when the caller stops
+        waiting for it, a cancelled job runs until its next stage
+
+        @return the future of the job
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            ret = loop.run_in_executor(self._executor, func, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+        ret.add_done_callback(lambda _future: semaphore.release())
+        return ret
+
+    def _new_cancel_event(self):
+        if self.uses_processes:
+            if self._manager is None:
+                import multiprocessing
+                self._manager = multiprocessing.Manager()
+            return self._manager.Event()
+        return threading.Event()
+
+    async def _run(self, func, kwargs, *args):
+        """run the job in the executor, stop it at the next stage when cancelled"""
+        cancel_event = self._new_cancel_event()
+        future = await self._start(func, cancel_event, kwargs, *args)
+        try:
+            # the job itself is not cancelled, it has to end first;
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            future.add_done_callback(_discard_result)
+            raise
+
+    async def render_async(self, document, **kwargs):
+        """
+        render the document, same as `RTFDocument.to_string`
+
+        @param document (`RTFMaker.RTFDocument`)
+
+        @rtype string
+        """
+        return await self._run(_render_job, kwargs, document)
+
+    async def translate_async(self, raw_html, tag_set, base_cls=object, **kwargs):
+        """
+        translate the HTML page, same as `HTMLRTF.translate`
+
+        @param raw_html (string)
+        @param tag_set (list)
+        @param base_cls the base class for the translator class (class/type)
+
+        @rtype string
+        """
+        return await self._run(_translate_job, kwargs, base_cls, raw_html, tag_set)
+
+    async def iter_render(self, document, chunk_size=65536, max_pending=4, **kwargs):
+        """
+        render the document and yield the output chunk by chunk, while it is
+        being written; closing the iterator early stops the rendering
+
+        @param document (`RTFMaker.RTFDocument`)
+        @param chunk_size minimum size of the chunks (integer)
+        @param max_pending maximum number of chunks waiting to be consumed (integer)
+        """
+        if self.uses_processes:
+            # the writer cannot stream across processes, render first;
+            output = await self.render_async(document, **kwargs)
+            for i in range(0, len(output), chunk_size):
+                yield output[i:i+chunk_size]
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=max_pending)
+        cancel_event = threading.Event()
+        sink = _ChunkSink(loop, queue, chunk_size, cancel_event)
+        kwargs = dict(kwargs)
+        kwargs['callback.stage'] = _stage_guard(cancel_event, kwargs.get('callback.stage', None))
+
+        def _job():
+            try:
+                document._write(sink, **kwargs)
+                sink.flush()
+            finally:
+                if not cancel_event.is_set():
+                    sink._put(self._DONE)
+
+        future = await self._start(_job)
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _pending = await asyncio.wait(
+                    (getter, future), return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter not in done:
+                    getter.cancel()
+                    # the job failed before finishing the output;
+                    await asyncio.shield(future)
+                    break
+                chunk = getter.result()
+                if chunk is self._DONE:
+                    break
+                yield chunk
+            await asyncio.shield(future)
+        finally:
+            if not future.done():
+                cancel_event.set()
+                # the job ends with `StageCancelled`, nobody is waiting for it;
+                future.add_done_callback(_discard_result)
+                # unblock the worker waiting for room in the queue;
+                while not queue.empty():
+                    queue.get_nowait()
+
+    def close(self):
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+_DEFAULT_RENDERER = None
+
+
+def _default_renderer():
+    global _DEFAULT_RENDERER
+    if _DEFAULT_RENDERER is None:
+        _DEFAULT_RENDERER = AsyncRenderer()
+    return _DEFAULT_RENDERER
+
+
+async def render_async(document, **kwargs):
+    """render the document in the default executor of the running loop"""
+    return await _default_renderer().render_async(document, **kwargs)
+
+
+async def translate_async(raw_html, tag_set, base_cls=object, **kwargs):
+    """translate the HTML page in the default executor of the running loop"""
+    return await _default_renderer().translate_async(raw_html, tag_set, base_cls=base_cls, **kwargs)
+
+
+#--eof--#
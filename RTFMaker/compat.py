@@ -0,0 +1,78 @@
+"""
+compat.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+the names that differ between Python 2 and Python 3, and the encoding of
+the RTF stream; RTF is 7-bit ASCII, the output is always bytes.
+"""
+
+import codecs
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    unicode = unicode
+    basestring = basestring
+else:
+    unicode = str
+    basestring = str
+
+RTF_ENCODING = 'ascii'
+# error handler writing the characters outside of ASCII as \uN? escapes;
+RTF_ERRORS = 'rtf.escape'
+
+
+def unicode_escape(c):
+    """
+    @param c a character outside of ASCII (string)
+
+    @return the RTF escape, a pair of escapes for the characters outside of
+    the basic multilingual plane (string)
+    """
+    code = ord(c)
+    if code > 0xffff:
+        code -= 0x10000
+        units = (0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff))
+    else:
+        units = (code,)
+    # \uN takes a signed 16-bit number;
+    return ''.join([ '\\u%d?' % (i if i < 32768 else i - 65536) for i in units ])
+
+
+def _rtf_escape(error):
+    if not isinstance(error, UnicodeEncodeError):
+        raise error
+    ret = u''.join([ unicode_escape(c) for c in error.object[error.start:error.end] ])
+    return (ret, error.end)
+
+
+codecs.register_error(RTF_ERRORS, _rtf_escape)
+
+
+def to_bytes(text):
+    """
+    @param text piece of the RTF stream (string)
+
+    @rtype bytes
+    """
+    if isinstance(text, bytes):
+        return text
+    return text.encode(RTF_ENCODING, RTF_ERRORS)
+
+
+#--eof--#
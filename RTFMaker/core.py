@@ -19,6 +19,523 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import absolute_import
 
+from . import elements
+from .compat import unicode, basestring
+
+class _RenderContext(object):
+    """render-scoped style information
+
+    keeps the stylesheet under construction and the styles resolved for the
+    elements, so that rendering never writes into the document or elements;
+
+    a context can be derived from another one, the derived context shares
+    the style pools with its origin until it registers a new style (copy on
+    write), so the origin is never changed.
+    """
+
+    def __init__(self):
+        from PyRTF.Styles import TextStyle, ParagraphStyle
+        from PyRTF.PropertySets import Font
+        from .utils import StyleSet
+
+        self.fonts = StyleSet(Font)
+        self.text_styles = StyleSet(TextStyle)
+        self.paragraph_styles = StyleSet(ParagraphStyle)
+        self.default_p_style = None
+        # CSS font directives -> paragraph style;
+        self.font_styles = dict()
+        # numbering format of the levels of each RTF list, list N is at N-1;
+        self.lists = list()
+        # list element -> (parsed list, RTF list number of each outermost list);
+        self.list_refs = dict()
+        # table element -> (parsed cells, cell style, header style, footer style);
+        self.table_refs = dict()
+        # (name of the paragraph style, modifier) -> the derived paragraph style;
+        self.variants = dict()
+        # file name or SHA-1 of the data -> image data (`RTFMaker.utils.RImage`);
+        self.images = dict()
+        self.style_sheet = None
+        self._shared = False
+
+    def derive(self):
+        """create a context on top of this one
+
+        @rtype `_RenderContext`
+        """
+        ret = self.__class__.__new__(self.__class__)
+        ret.__dict__.update(self.__dict__)
+        # the origin's list elements never show up in the derived context;
+        ret.list_refs = dict()
+        ret.table_refs = dict()
+        ret.images = dict()
+        ret._shared = True
+        return ret
+
+    @property
+    def is_shared(self):
+        """whether the style pools are still the ones of the origin context"""
+        return self._shared
+
+    def _own(self):
+        if self._shared:
+            self.fonts = self.fonts.copy()
+            self.text_styles = self.text_styles.copy()
+            self.paragraph_styles = self.paragraph_styles.copy()
+            self.font_styles = dict(self.font_styles)
+            self.variants = dict(self.variants)
+            self.lists = list(self.lists)
+            self.style_sheet = None
+            self._shared = False
+
+    def add_style(self, font=None, text_style=None, paragraph_style=None):
+        """register style objects that are not registered yet"""
+        self._own()
+        if font is not None:
+            self.fonts.add(font)
+        if text_style is not None:
+            self.text_styles.add(text_style)
+        if paragraph_style is not None:
+            self.paragraph_styles.add(paragraph_style)
+
+    def add_list(self, formats, shared=False):
+        """register an RTF list
+
+        @param formats numbering format of each level (tuple)
+        @param shared whether an identical list registered before can be used (boolean)
+
+        @return the RTF list number (integer)
+        """
+        if shared and formats in self.lists:
+            return self.lists.index(formats) + 1
+        self._own()
+        self.lists.append(formats)
+        return len(self.lists)
+
+    def memorize(self, font, paragraph_style):
+        """
+        @param font CSS font directives (string)
+        @param paragraph_style the resolved paragraph style
+        """
+        self._own()
+        self.font_styles[font] = paragraph_style
+
+    def release(self, element):
+        """drop what was parsed for the element, once it is written
+
+        @param element (`RTFMaker.elements.Element`)
+        """
+        self.list_refs.pop(element, None)
+        self.table_refs.pop(element, None)
+
+    def memorize_variant(self, key, paragraph_style):
+        """
+        @param key (name of the base paragraph style, modifier) (tuple)
+        @param paragraph_style the derived paragraph style
+        """
+        self._own()
+        self.variants[key] = paragraph_style
+
+
+class _Snapshot(object):
+    """prepared rendering of a document
+
+    holds the render context, the document object built from the elements,
+    and, once they are rendered, the text of the header and of the body;
+    a snapshot never changes after it is prepared, so it can be shared by
+    the documents forked from it.
+    """
+
+    def __init__(self, ctx, document, count, base=None, compact=False):
+        """
+        @param ctx render context (`_RenderContext`)
+        @param document (`PyRTF.Elements.Document`)
+        @param count number of elements, including the ones of the base (integer)
+        @param base snapshot of the parent document (`_Snapshot`)
+        @param compact whether the document is written in compact mode (boolean)
+        """
+        self.ctx = ctx
+        self.document = document
+        self.count = count
+        self.base = base
+        self.compact = compact
+        self._header = None
+        self._body = None
+
+    def header(self):
+        """
+        @return (header (bytes), writer state)
+        """
+        ret = self._header
+        if ret is None:
+            if self.base is not None and self.ctx.style_sheet is self.base.ctx.style_sheet:
+                ret = self.base.header()
+            else:
+                from io import BytesIO
+                from .writer import RTFWriter
+                cache = BytesIO()
+                writer = RTFWriter(cache)
+                writer.write_header(self.document, lists=self.ctx.lists)
+                ret = (cache.getvalue(), writer.get_state())
+            self._header = ret
+        return ret
+
+    def _full_header_size(self):
+        """size of the header with all the registered styles, for comparison
+        with the header of a compact document
+        """
+        import copy
+        from io import BytesIO
+        from .writer import RTFWriter
+        full_doc = copy.copy(self.document)
+        full_doc.StyleSheet = self.ctx.style_sheet
+        cache = BytesIO()
+        RTFWriter(cache).write_header(full_doc, lists=self.ctx.lists)
+        return len(cache.getvalue())
+
+    def body(self):
+        """
+        @return (tuple of rendered body pieces (bytes), current paragraph style at the end)
+        """
+        ret = self._body
+        if ret is None:
+            from io import BytesIO
+            cache = BytesIO()
+            writer = self._open_writer(cache)
+            writer.write_elements(self.document.Sections[0])
+            segments = self._base_body()[0] + (cache.getvalue(),)
+            ret = (
+                tuple([ i for i in segments if len(i) ]),
+                writer.get_state()['current.style'],
+            )
+            self._body = ret
+        return ret
+
+    def _base_body(self):
+        """
+        @return (rendered body pieces of the base, with the references
+        renumbered for the header of this snapshot, current paragraph style at the end)
+        """
+        if self.base is None:
+            return ((), None)
+        segments, current_style = self.base.body()
+        if self.ctx.style_sheet is not self.base.ctx.style_sheet:
+            from .writer import remap_tables
+            maps = _get_table_maps(self.base.header()[1], _get_table_numbers(self.header()[1]))
+            segments = tuple([ remap_tables(i, maps) for i in segments ])
+        return (segments, current_style)
+
+    def _open_writer(self, file):
+        """create a writer that continues right after the body of the base
+
+        @param file output stream
+        """
+        from .writer import RTFWriter
+        state = self.header()[1]
+        if self.base is not None:
+            state = dict(state)
+            state['current.style'] = self.base.body()[1]
+        writer = RTFWriter(file, compact=self.compact)
+        writer.set_state(state)
+        return writer
+
+    def write(self, file, report=None):
+        """dump the full document into the file
+
+        @param report filled with the bytes saved by the compact mode (dict)
+        """
+        file.write(self.header()[0])
+        if self._body is None:
+            segments, current_style = self._base_body()
+            writer = self._open_writer(file)
+            for a_segment in segments:
+                writer.write_segment(a_segment, current_style)
+            writer.write_elements(self.document.Sections[0])
+        else:
+            segments, current_style = self._body
+            writer = self._open_writer(file)
+            for a_segment in segments:
+                writer.write_segment(a_segment, current_style)
+        writer.write_trailer()
+        if self.compact and isinstance(report, dict):
+            report.update(writer.saved)
+            report['styles'] = self._full_header_size() - len(self.header()[0])
+            report['bytes.saved'] = report['styles'] + report['resets'] + report['escapes']
+
+
+class CompiledStyleSheet(object):
+    """stylesheet and RTF header compiled once, shared by documents
+
+    created by `RTFDocument.compile_stylesheet`; the styles and the header
+    never change, a document that introduces new styles extends a copy.
+    """
+
+    __slots__ = ('_snapshot',)
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    @property
+    def header(self):
+        """the serialized RTF header (bytes)"""
+        return self._snapshot.header()[0]
+
+    @property
+    def style_names(self):
+        """names of the paragraph styles, in stylesheet order (tuple)"""
+        return tuple(self._snapshot.ctx.paragraph_styles.get_names())
+
+    def __repr__(self):
+        ret = "<compiled RTF stylesheet of {sc} style(s) at {addr}>".format(
+            sc=len(self._snapshot.ctx.paragraph_styles),
+            addr="0x%x"%(id(self)),
+        )
+        return ret
+
+
+class Fragment(object):
+    """rendered document, to be merged with others
+
+    created by `RTFDocument.compile_fragment`; it holds the tables of the
+    header and the rendered body, merging it never builds the elements again.
+    """
+
+    __slots__ = ('_snapshot',)
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    @property
+    def size(self):
+        """size of the rendered body, in bytes (integer)"""
+        return sum([ len(i) for i in self._snapshot.body()[0] ])
+
+    def __repr__(self):
+        ret = "<RTF fragment of {ec} element(s) at {addr}>".format(
+            ec=self._snapshot.count,
+            addr="0x%x"%(id(self)),
+        )
+        return ret
+
+
+def _get_table_numbers(state):
+    """
+    @param state writer state after the header (dict)
+
+    @return the number of each paragraph style ('s'), font ('f') and colour
+    ('cf') by name (dict of dicts)
+    """
+    import re
+
+    ret = {
+        's': dict(),
+        'f': dict([ (k.name, v) for k, v in state['font.map'].items() ]),
+        'cf': dict([ (k.name, v) for k, v in state['colour.map'].items() ]),
+    }
+    for a_style, a_head in state['style.map'].items():
+        ret['s'][a_style.name] = int(re.match(r'\\s(\d+)', a_head).group(1))
+    return ret
+
+
+def _get_table_maps(state, new_numbers):
+    """
+    @param state writer state after the header the body was rendered with (dict)
+    @param new_numbers the return value of `_get_table_numbers` for the new header (dict)
+
+    @return the new number by the old one in each table, for `RTFMaker.writer.remap_tables` (dict)
+    """
+    ret = dict()
+    for a_table, old_numbers in _get_table_numbers(state).items():
+        ret[a_table] = dict([
+            (v, new_numbers[a_table][k]) for k, v in old_numbers.items()
+            if new_numbers[a_table].get(k, v) != v
+        ])
+    return ret
+
+
+class _MergedDocument(object):
+    """the parts written one after another as one document
+
+    the font, colour and style tables are unified by name, the first part
+    comes first; the lists of every part are kept apart so that their
+    numbering does not go on across the parts; the rendered body of each
+    part is written with its references renumbered.
+    """
+
+    BREAK_SECTION = 'section'
+    BREAK_PAGE = 'page'
+
+    def __init__(self, snapshots, part_break=BREAK_SECTION):
+        """
+        @param snapshots prepared rendering of the parts, rendered body included (list of `_Snapshot`)
+        @param part_break what comes between the parts, 'section', 'page' or None (string)
+        """
+        if part_break not in (self.BREAK_SECTION, self.BREAK_PAGE, None):
+            _msg = 'invalid break between the parts: {b!r}'.format(b=part_break)
+            raise ValueError(_msg)
+        if len(snapshots) == 0:
+            _msg = 'no part to merge'
+            raise ValueError(_msg)
+        self.snapshots = snapshots
+        self.part_break = part_break
+
+    def _build_header_document(self):
+        """
+        @return (document of the unified tables, lists, offset of the list numbers of each part)
+        """
+        import copy
+        from PyRTF.Elements import StyleSheet
+        from PyRTF.PropertySets import Font, Colour
+        from PyRTF.Styles import ParagraphStyle
+        from .utils import StyleSet
+
+        fonts = StyleSet(Font)
+        colours = StyleSet(Colour)
+        p_styles = StyleSet(ParagraphStyle)
+        lists = list()
+        list_offsets = list()
+        for a_snapshot in self.snapshots:
+            style_sheet = a_snapshot.document.StyleSheet
+            fonts.add(*style_sheet.Fonts)
+            colours.add(*style_sheet.Colours)
+            p_styles.add(*style_sheet.ParagraphStyles)
+            list_offsets.append(len(lists))
+            lists.extend(a_snapshot.ctx.lists)
+
+        ret = copy.copy(self.snapshots[0].document)
+        ret.StyleSheet = StyleSheet(colours=colours, fonts=fonts)
+        ret.StyleSheet.ParagraphStyles = p_styles
+        return (ret, lists, list_offsets)
+
+    def write(self, file, report=None):
+        """dump the merged document into the file"""
+        from PyRTF.document.section import Section
+        from .writer import RTFWriter, remap_tables
+
+        document, lists, list_offsets = self._build_header_document()
+        writer = RTFWriter(file)
+        writer.write_header(document, lists=lists)
+        new_numbers = _get_table_numbers(writer.get_state())
+        for idx, a_snapshot in enumerate(self.snapshots):
+            if idx > 0 and self.part_break == self.BREAK_SECTION:
+                writer.write_section_break(a_snapshot.document.Sections[0], break_type=Section.PAGE)
+            elif idx > 0 and self.part_break == self.BREAK_PAGE:
+                writer.write_page_break()
+            maps = _get_table_maps(a_snapshot.header()[1], new_numbers)
+            if list_offsets[idx] > 0:
+                maps['ls'] = dict([
+                    (i, i + list_offsets[idx]) for i in range(1, len(a_snapshot.ctx.lists) + 1)
+                ])
+            for a_segment in a_snapshot.body()[0]:
+                writer.write_segment(remap_tables(a_segment, maps), None)
+        writer.write_trailer()
+
+
+class _StreamedDocument(object):
+    """a prepared document followed by elements that come one at a time
+
+    each element is built and written as soon as it comes, then dropped;
+    RTF needs every style in the header, so the body goes into a spool file
+    and the header is written in front of it once the last element is known.
+
+    the spool is checked against the output limit, the deadline and the
+    memory budget of the rendering while it is written, and the element
+    stage is announced before each element, so that a rendering can be
+    stopped in the middle of the body.
+    """
+
+    # body kept in memory before the spool moves to a temporary file, in bytes;
+    SPOOL_SIZE = 1024 * 1024
+    # spooled body copied into the output at a time, in bytes;
+    COPY_SIZE = 65536
+
+    def __init__(self, document, snapshot, element_iter, **kwargs):
+        """
+        @param document the document resolving and building the elements (`RTFDocument`)
+        @param snapshot prepared rendering of the document (`_Snapshot`)
+        @param element_iter (iterable of dict or `RTFMaker.elements.Element`)
+        """
+        self.document = document
+        self.snapshot = snapshot
+        self.element_iter = element_iter
+        self.options = kwargs
+
+    def _write_header(self, ctx, file):
+        """
+        @param ctx render context (`_RenderContext`)
+        @param file output stream
+
+        @return the writer of the header
+        """
+        import copy
+        from .writer import RTFWriter
+
+        header_doc = copy.copy(self.snapshot.document)
+        header_doc.StyleSheet = self.document._attach_style_sheet(ctx)
+        ret = RTFWriter(file)
+        ret.write_header(header_doc, lists=ctx.lists)
+        return ret
+
+    def _wrap_spool(self, spool):
+        """
+        @param spool the spool file of the body
+
+        @return output stream that checks the limits of the rendering
+        """
+        from .limits import get_guard
+        from .memory import KEY_TRACKER
+
+        ret = spool
+        tracker = self.options.get(KEY_TRACKER, None)
+        if tracker is not None:
+            ret = tracker.wrap(ret)
+        guard = get_guard(self.options)
+        if guard is not None:
+            # the body alone, it is counted again with the header in the output;
+            ret = guard.wrap(ret)
+        return ret
+
+    def write(self, file, report=None):
+        """dump the document and the elements into the file"""
+        import shutil
+        from io import BytesIO
+        from tempfile import SpooledTemporaryFile
+        from .writer import RTFWriter
+
+        kwargs = self.options
+        document = self.document
+        builders = document._get_builders()
+        ctx = self.snapshot.ctx.derive()
+        spool = SpooledTemporaryFile(max_size=kwargs.get('stream.spool.size', self.SPOOL_SIZE))
+        try:
+            segments, current_style = self.snapshot.body()
+            body = RTFWriter(self._wrap_spool(spool))
+            body.set_state(self.snapshot.header()[1])
+            for a_segment in segments:
+                body.write_segment(a_segment, current_style)
+            known = (len(ctx.fonts), len(ctx.paragraph_styles))
+            for a_element in self.element_iter:
+                document._notify_stage(document.STAGE_ELEMENT, **kwargs)
+                a_element = elements.make_element(a_element, **kwargs)
+                if a_element is None:
+                    continue
+                document._resolve_element(a_element, ctx, **kwargs)
+                if known != (len(ctx.fonts), len(ctx.paragraph_styles)):
+                    # new styles, the lookup tables are out of date;
+                    state = dict(self._write_header(ctx, BytesIO()).get_state())
+                    state['current.style'] = body.get_state()['current.style']
+                    body.set_state(state)
+                    known = (len(ctx.fonts), len(ctx.paragraph_styles))
+                body.write_elements(document._build_element(a_element, ctx, builders, **kwargs))
+                ctx.release(a_element)
+            document._notify_stage(document.STAGE_WRITE, **kwargs)
+            writer = self._write_header(ctx, file)
+            spool.seek(0)
+            shutil.copyfileobj(spool, file, self.COPY_SIZE)
+            writer.write_trailer()
+        finally:
+            spool.close()
+
+
 class RTFDocument(object):
     """RTF document container"""
 
@@ -41,30 +558,134 @@ class RTFDocument(object):
     MODIFIER_BOLD = 'Bold'
     MODIFIER_ITALIC = 'Italic'
 
+    STAGE_STYLE = 'style'
+    STAGE_ELEMENT = 'element'
+    STAGE_WRITE = 'write'
+
     DEFAULT_EM_WIDTH = 90  # (PyRTF.PropertySets.TabPropertySet.DEFAULT_WIDTH/8)
     DEFAULT_LIST_INDENT = 4
     DEFAULT_LIST_HANGING = 2
+    DEFAULT_LIST_FORMATS = ('bullet',) * 3  # (RTFMaker.utils.RList.LEVEL_BULLET)
 
     def __init__(self, **kwargs):
+        """
+        @param stylesheet precompiled stylesheet to start with (`CompiledStyleSheet`)
+        """
         self._element_cache = list()
-        self._default_p_style = None
-        self._doc = None
+        self._base = None
+        self._snapshot = None
+        stylesheet = kwargs.get('stylesheet', None)
+        if stylesheet is not None:
+            assert isinstance(stylesheet, CompiledStyleSheet), 'invalid stylesheet'
+            self._base = stylesheet._snapshot
+
+    @classmethod
+    def compile_stylesheet(cls, css_font_def=None, **kwargs):
+        """
+        compile the stylesheet and the RTF header once, for the documents
+        created with the `stylesheet` argument
+
+        @note the keyword arguments are the rendering options, same as
+        `to_string`, and the documents should be rendered with the same
+        options
+
+        @param css_font_def CSS font directives, either a dict or a list of
+        (class name, font directives), or a list of font directives
+        @param list_style whether the list item style is included (boolean)
+
+        @rtype `CompiledStyleSheet`
+        """
+        from PyRTF.Constants import Languages
+        from PyRTF.Elements import Document
+        from PyRTF.document.section import Section
+
+        font_list = list()
+        if isinstance(css_font_def, dict):
+            font_list = [ i[1] for i in sorted(css_font_def.items()) ]
+        elif isinstance(css_font_def, (list, tuple)):
+            for a_def in css_font_def:
+                if isinstance(a_def, (list, tuple)):
+                    font_list.append(a_def[1])
+                else:
+                    font_list.append(a_def)
+
+        doc = cls()
+        ctx = doc._new_context(**kwargs)
+        for a_font in font_list:
+            doc._resolve_style(a_font, ctx, **kwargs)
+        if kwargs.get('list_style', True):
+            doc._add_list_style(ctx, **kwargs)
+        ctx = doc._collect_styles(ctx, **kwargs)
+
+        _doc = Document(
+            style_sheet=ctx.style_sheet,
+            default_language=getattr(Languages, doc.DEFAULT_LANGUAGE),
+        )
+        _doc.Sections.append(Section())
+        snapshot = _Snapshot(ctx, _doc, 0)
+        # serialize the header and the (empty) body right away;
+        snapshot.body()
+        return CompiledStyleSheet(snapshot)
 
-    def append(self, element):
+    def append(self, element, **kwargs):
         """
-        add new element to the document
+        add new element to the document, an element of unknown type is skipped
 
-        @param element (dict)
+        @param element (dict or `RTFMaker.elements.Element`)
+        @param use_exc raise `ValueError` on an element of unknown type (boolean)
         """
+        element = elements.make_element(element, **kwargs)
+        if element is None:
+            return None
         self._element_cache.append(element)
+        # drop the outdated rendering;
+        self._snapshot = None
         return None
 
-    def _get_font_style(self, data, **kwargs):
+    def fork(self, **kwargs):
+        """
+        create a new document that starts with all the elements of this one
+
+        the new document shares the resolved styles and the rendered body of
+        this document (copy on write), rendering it only costs the elements
+        appended to it afterwards; elements appended to this document later
+        on are not seen by the new document.
+
+        @note the keyword arguments are the rendering options, same as
+        `to_string`, and the new document should be rendered with the same
+        options
+
+        @rtype `RTFDocument`
+        """
+        # the shared part is kept as it is, compact or not;
+        snapshot = self._prepare(**dict(kwargs, compact=False))
+        # render the shared part once, for all the forked documents;
+        snapshot.body()
+        ret = self.__class__()
+        ret._base = snapshot
+        return ret
+
+    @staticmethod
+    def _notify_stage(stage, **kwargs):
+        """
+        tell the caller that the next stage of rendering is about to start,
+        the callback may raise an exception to abort the rendering
+
+        @param callback.stage function that accepts the name of the stage (callable)
+        """
+        _cb = kwargs.get('callback.stage', None)
+        if callable(_cb):
+            _cb(stage)
+
+    def _get_font_style(self, data, fonts=None, **kwargs):
         """generate font and text style object
 
         @note font definition data is extracted from `PyRTF` package
 
         @param data basic text style information (dict)
+        @param fonts registered fonts, the font of the same name is used
+        when there is one: the font table of `PyRTF` is keyed by the font
+        objects (`RTFMaker.utils.StyleSet`)
 
         @return (string, font_obj, text_style_obj)
         """
@@ -104,7 +725,10 @@ class RTFDocument(object):
             font_short_name,
             _FONT_ARG_HUB[self.DEFAULT_FONT_NAME]
         )
-        font_obj = Font(font_short_name, *font_args)
+        if fonts is not None:
+            font_obj = fonts.get_by_name(font_short_name)
+        if font_obj is None:
+            font_obj = Font(font_short_name, *font_args)
         txt_style_obj = TextStyle(
             TextPropertySet(
                 font=font_obj,
@@ -138,39 +762,80 @@ class RTFDocument(object):
             ret['modifier'] = self.MODIFIER_ITALIC
         return ret
 
-    def _get_bold_style_name(self, name, **kwargs):
-        ret = name
-        style_cache = getattr(self, '_style_cache')
-        assert style_cache is not None, 'style cache unavailable'
+    def _get_style_variant(self, p_style, modifier, ctx, **kwargs):
+        """the paragraph style of the same font and size with the modifier
+        added, it is built and registered the first time it is asked for
 
-        if name.find(self.MODIFIER_BOLD) > -1 :
-            pass
-        else:
-            if name == self.DEFAULT_PSTYLE_NAME:
-                ret = 'ps_{ts}'.format(ts=self._default_p_style.TextStyle.name).replace(self.MODIFIER_REGULAR, self.MODIFIER_BOLD)
-            else:
-                ret = name.replace(self.MODIFIER_REGULAR, self.MODIFIER_BOLD)
-        # append the bold style to stylesheet if it is not included already;
-        new_pstyle = style_cache.ParagraphStyles.get_by_name(ret)
-        if new_pstyle is None:
-            raise NotImplementedError('TODO: construct the new style and append')
-            #from PyRTF.Styles import ParagraphStyle
+        @param p_style the base paragraph style
+        @param modifier `MODIFIER_BOLD` or `MODIFIER_ITALIC` (string)
+        @param ctx render context (`_RenderContext`)
+
+        @rtype `PyRTF.Styles.ParagraphStyle`
+        """
+        key = (p_style.name, modifier)
+        ret = ctx.variants.get(key, None)
+        if ret is None:
+            from PyRTF.Styles import ParagraphStyle
+
+            text_props = p_style.TextStyle.textProps
+            # keep the modifiers of the base style;
+            modifiers = [
+                i for i in (self.MODIFIER_BOLD, self.MODIFIER_ITALIC)
+                if i == modifier or getattr(text_props, i.lower(), False)
+            ]
+            new_font_obj = self._get_font_style(
+                data={
+                    'font': text_props.font.name,
+                    'size': text_props.size // 2,
+                    'modifier': ' '.join(modifiers),
+                },
+                fonts=ctx.fonts,
+                **kwargs
+            )
+            p_style_name = 'ps_{ts}'.format(ts=new_font_obj[0])
+            ret = ctx.paragraph_styles.get_by_name(p_style_name)
+            if ret is None:
+                ret = ParagraphStyle(p_style_name, new_font_obj[2])
+                ctx.add_style(new_font_obj[1], new_font_obj[2], ret)
+            ctx.memorize_variant(key, ret)
         return ret
 
-    def _collect_styles(self, **kwargs):
-        """get all the registered styles
+    def _resolve_style(self, font, ctx, **kwargs):
+        """map the CSS font directives to a registered paragraph style
 
-        @rtype `PyRTF.Elements.StyleSheet`
+        @note the result is memorized in the render context, and the style is
+        registered into the context when it is seen for the first time
+
+        @param font CSS font directives (string or None)
+        @param ctx render context (`_RenderContext`)
+
+        @rtype `PyRTF.Styles.ParagraphStyle`
         """
-        from PyRTF.Elements import StyleSheet
-        from PyRTF.Styles import TextStyle, ParagraphStyle
-        from PyRTF.PropertySets import Font
-        from PyRTF.PropertySets import ParagraphPropertySet
-        from .utils import StyleSet
+        if not font:
+            return ctx.default_p_style
+        p_style = ctx.font_styles.get(font, None)
+        if p_style is None:
+            from PyRTF.Styles import ParagraphStyle
+
+            font_arg = self._parse_css_font(font, **kwargs)
+            new_font_obj = self._get_font_style(data=font_arg, fonts=ctx.fonts, **kwargs)
+            p_style_name = 'ps_{ts}'.format(ts=new_font_obj[0])
+            p_style = ctx.paragraph_styles.get_by_name(p_style_name)
+            if p_style is None:
+                p_style = ParagraphStyle(p_style_name, new_font_obj[2])
+                ctx.add_style(new_font_obj[1], new_font_obj[2], p_style)
+            # different directives may end up with the same style;
+            ctx.memorize(font, p_style)
+        return p_style
+
+    def _new_context(self, **kwargs):
+        """create a render context that holds the default style
+
+        @rtype `_RenderContext`
+        """
+        from PyRTF.Styles import ParagraphStyle
 
-        font_set = StyleSet(Font)
-        t_style_set = StyleSet(TextStyle)
-        p_style_set = StyleSet(ParagraphStyle)
+        ctx = _RenderContext()
 
         _default_font_ts = self._get_font_style(
             data={
@@ -183,61 +848,26 @@ class RTFDocument(object):
         f_arial = _default_font_ts[1]
         ts_arial_9pt_regular = _default_font_ts[2]
         ps_normal = ParagraphStyle(self.DEFAULT_PSTYLE_NAME, ts_arial_9pt_regular)
-        self._default_p_style = ps_normal
+        ctx.default_p_style = ps_normal
 
         # insert the default one at the beginning;
-        font_set.add(f_arial)
-        t_style_set.append(ts_arial_9pt_regular)
-        p_style_set.append(ps_normal)
+        ctx.add_style(f_arial, ts_arial_9pt_regular, ps_normal)
+        return ctx
 
-        doc_has_list = False
-        # then go through element list to collect all other styles;
-        for a_element in self._element_cache:
-            # extract style information;
-            e_font = a_element.get(self.KEY_FONT, None)
-            if a_element.get(self.KEY_TYPE, None) == self.ELEMENT_LIST:
-                doc_has_list = True
-            # try to match any registered style;
-            if e_font:
-                font_arg = self._parse_css_font(e_font, **kwargs)
-                new_font_obj = self._get_font_style(data=font_arg, **kwargs)
-                font_set.add(new_font_obj[1])
-                t_style_set.add(new_font_obj[2])
-                p_style = ParagraphStyle(
-                    'ps_{ts}'.format(ts=new_font_obj[0]),
-                    new_font_obj[2]
-                )
-                p_style_set.add(p_style)
-            else:
-                p_style = ps_normal
-            # replace raw style info with internal style cache reference;
-            a_element[self.KEY_STYLE] = p_style.name
-            if a_element.get(self.KEY_TYPE, None) == self.ELEMENT_PARTIAL:
-                for a_sub in a_element[ self.KEY_VALUE ]:
-                    if a_sub is None:
-                        continue
-                    sub_font = a_sub.get(self.KEY_FONT, None)
-                    if sub_font:
-                        sub_font_arg = self._parse_css_font(sub_font, **kwargs)
-                        sub_new_font_obj = self._get_font_style(data=sub_font_arg, **kwargs)
-                        font_set.add(sub_new_font_obj[1])
-                        t_style_set.add(sub_new_font_obj[2])
-                        sub_p_style = ParagraphStyle(
-                            'ps_{ts}'.format(ts=sub_new_font_obj[0]),
-                            sub_new_font_obj[2]
-                        )
-                        p_style_set.add(sub_p_style)
-                    else:
-                        sub_p_style = ps_normal
-                    a_sub[self.KEY_STYLE] = sub_p_style.name
-
-        # put in list style when needed;
-        if doc_has_list:
+    def _add_list_style(self, ctx, **kwargs):
+        """register the paragraph style of list items if it is not registered yet
+
+        @param ctx render context (`_RenderContext`)
+        """
+        from PyRTF.Styles import ParagraphStyle
+        from PyRTF.PropertySets import ParagraphPropertySet
+
+        if ctx.paragraph_styles.get_by_name(self.DEFAULT_LIST_STYLE_NAME) is None:
             list_item_indent = self.DEFAULT_EM_WIDTH * self.DEFAULT_LIST_INDENT
             hanging_indent = -(self.DEFAULT_EM_WIDTH * self.DEFAULT_LIST_HANGING)
             ps_for_list_item = ParagraphStyle(
                 self.DEFAULT_LIST_STYLE_NAME,
-                ts_arial_9pt_regular,
+                ctx.default_p_style.TextStyle,
                 ParagraphPropertySet(
                     space_before=60,
                     space_after=60,
@@ -245,131 +875,605 @@ class RTFDocument(object):
                     left_indent=list_item_indent
                 )
             )
-            p_style_set.append(ps_for_list_item)
+            ctx.add_style(paragraph_style=ps_for_list_item)
+        ctx.add_list(self.DEFAULT_LIST_FORMATS, shared=True)
+
+    def _resolve_list(self, element, ctx, **kwargs):
+        """parse the list element once, and register the RTF lists it needs
+
+        @note bullet lists share the default RTF list unless they nest deeper,
+        every list with numbered levels gets its own one so that the numbering
+        starts over
+
+        @param element (`RTFMaker.elements.List`)
+        @param ctx render context (`_RenderContext`)
+
+        @return (`RTFMaker.utils.RList`, list of RTF list numbers)
+        """
+        ret = ctx.list_refs.get(element, None)
+        if ret is None:
+            from .utils import RList
+
+            # the list item style and the default bullet list always come first,
+            # the items of a list without font take the list item style;
+            self._add_list_style(ctx, **kwargs)
+            if element.font:
+                style_obj = self._resolve_style(element.font, ctx, **kwargs)
+            else:
+                style_obj = ctx.paragraph_styles.get_by_name(self.DEFAULT_LIST_STYLE_NAME)
+            r_list = RList(element.value, style=style_obj)
+            list_ids = list()
+            for formats in r_list.get_formats(**kwargs):
+                shared = RList.LEVEL_DECIMAL not in formats
+                if shared and len(formats) <= len(self.DEFAULT_LIST_FORMATS):
+                    formats = self.DEFAULT_LIST_FORMATS
+                list_ids.append(ctx.add_list(formats, shared=shared))
+            ret = (r_list, list_ids)
+            ctx.list_refs[element] = ret
+        return ret
+
+    def _collect_styles(self, ctx=None, **kwargs):
+        """get all the registered styles
+
+        @param ctx render context to extend, a new one is created when omitted (`_RenderContext`)
+
+        @rtype `_RenderContext`
+        """
+        if ctx is None:
+            ctx = self._new_context(**kwargs)
+
+        # then go through element list to collect all other styles;
+        for a_element in self._element_cache:
+            self._resolve_element(a_element, ctx, **kwargs)
+
+        self._attach_style_sheet(ctx)
+        return ctx
+
+    def _resolve_element(self, element, ctx, **kwargs):
+        """register the styles the element needs
+
+        @param element (`RTFMaker.elements.Element`)
+        @param ctx render context (`_RenderContext`)
+        """
+        self._resolve_style(element.font, ctx, **kwargs)
+        if isinstance(element, elements.List):
+            self._resolve_list(element, ctx, **kwargs)
+        if isinstance(element, elements.Table):
+            self._resolve_table(element, ctx, **kwargs)
+        if isinstance(element, elements.Partial):
+            for a_sub in element.value:
+                if a_sub is None:
+                    continue
+                self._resolve_style(a_sub.font, ctx, **kwargs)
+
+    @staticmethod
+    def _attach_style_sheet(ctx):
+        """
+        @param ctx render context (`_RenderContext`)
+
+        @return the stylesheet of the registered styles (`PyRTF.Elements.StyleSheet`)
+        """
+        from PyRTF.Elements import StyleSheet
 
         # rvalue;
-        _doc_style = StyleSheet(fonts=font_set)
-        # overwrite default values;
-        _doc_style.TextStyle = t_style_set
-        _doc_style.ParagraphStyles = p_style_set
-        return _doc_style
+        if ctx.style_sheet is None:
+            _doc_style = StyleSheet(fonts=ctx.fonts)
+            # overwrite default values;
+            _doc_style.TextStyle = ctx.text_styles
+            _doc_style.ParagraphStyles = ctx.paragraph_styles
+            ctx.style_sheet = _doc_style
+        return ctx.style_sheet
+
+    def _build_paragraph(self, element, ctx, **kwargs):
+        from .utils import RPar
+        style_obj = self._resolve_style(element.font, ctx, **kwargs)
+        ret = RPar(element.value, style=style_obj).getParagraph(**kwargs)
+        return (ret,) if ret else ()
+
+    def _build_partial(self, element, ctx, **kwargs):
+        from .utils import RPar
+        style_obj = self._resolve_style(element.font, ctx, **kwargs)
+        sub_styles = [
+            (self._resolve_style(i.font, ctx, **kwargs) if i is not None else None) for i in element.value
+        ]
+        rp = RPar(None, style=style_obj)
+        rp.append(*element.value, styles=sub_styles)
+        ret = rp.getParagraph(**kwargs)
+        return (ret,) if ret else ()
+
+    def _resolve_table(self, element, ctx, **kwargs):
+        """parse the table element once, and register the bold header style
+        and the italic footer style only when the table has a header or a footer
+
+        @param element (`RTFMaker.elements.Table`)
+        @param ctx render context (`_RenderContext`)
+
+        @return (parsed cells, cell style, header style, footer style)
+        """
+        ret = ctx.table_refs.get(element, None)
+        if ret is None:
+            from .utils import RTable
+
+            cell_s_obj = self._resolve_style(element.font, ctx, **kwargs)
+            cells = RTable(element.value).get_elements(**kwargs)
+            head_s_obj = None
+            if len(cells['head']) > 0:
+                head_s_obj = self._get_style_variant(cell_s_obj, self.MODIFIER_BOLD, ctx, **kwargs)
+            foot_s_obj = None
+            if len(cells['foot']) > 0:
+                foot_s_obj = self._get_style_variant(cell_s_obj, self.MODIFIER_ITALIC, ctx, **kwargs)
+            ret = (cells, cell_s_obj, head_s_obj, foot_s_obj)
+            ctx.table_refs[element] = ret
+        return ret
+
+    def _build_table(self, element, ctx, **kwargs):
+        from .utils import RTable
+        cells, cell_s_obj, head_s_obj, foot_s_obj = self._resolve_table(element, ctx, **kwargs)
+        ret = RTable(cells, style=cell_s_obj, header_style=head_s_obj, foot_style=foot_s_obj).getTable(**kwargs)
+        if not isinstance(ret, tuple):
+            ret = (ret,)
+        return ret
+
+    def _build_list(self, element, ctx, **kwargs):
+        r_list, list_ids = self._resolve_list(element, ctx, **kwargs)
+        return r_list.getList(list_ids=list_ids, **kwargs)
 
-    def _collect_elements(self, **kwargs):
+    def _resolve_image(self, element, ctx, **kwargs):
+        """load the image data once per render, identical pictures share
+        the same data whatever their source is
+
+        @param element (`RTFMaker.elements.Image`)
+        @param ctx render context (`_RenderContext`)
+        @param image.root folder the image files have to be in, relative
+        file names start from it; any file can be read when omitted (string)
+
+        @rtype `RTFMaker.utils.RImage`
+        """
+        import hashlib
+        from .utils import RImage, is_image_data, get_image_path
+
+        value = element.value
+        is_data = is_image_data(value)
+        if is_data:
+            data = value
+        else:
+            ret = ctx.images.get(value, None)
+            if ret is not None:
+                return ret
+            path = value
+            if kwargs.get('image.root', None) is not None:
+                path = get_image_path(value, kwargs['image.root'])
+                if path is None:
+                    _msg = 'image outside of image.root: {v}'.format(v=value)
+                    raise ValueError(_msg)
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        digest = hashlib.sha1(data).hexdigest()
+        ret = ctx.images.get(digest, None)
+        if ret is None:
+            ret = RImage(data, digest=digest)
+            ctx.images[digest] = ret
+        if not is_data:
+            ctx.images[value] = ret
+        return ret
+
+    def _build_image(self, element, ctx, **kwargs):
+        from .utils import RFigure
+        style_obj = self._resolve_style(element.font, ctx, **kwargs)
+        try:
+            image = self._resolve_image(element, ctx, **kwargs)
+        except (IOError, OSError, ValueError):
+            # unreadable file, or not a PNG/JPEG image;
+            if kwargs.get('use_exc', False):
+                raise
+            return ()
+        ret = RFigure(image, style=style_obj, width=element.width, height=element.height).getFigure(**kwargs)
+        return (ret,)
+
+    # element class -> name of the builder method, a builder returns
+    # a sequence of document element objects;
+    ELEMENT_BUILDER_HUB = {
+        elements.Paragraph: '_build_paragraph',
+        elements.Partial: '_build_partial',
+        elements.Table: '_build_table',
+        elements.List: '_build_list',
+        elements.Image: '_build_image',
+    }
+
+    def _collect_elements(self, ctx, **kwargs):
         """get all the elements
 
+        @param ctx render context (`_RenderContext`)
+
         @rtype `PyRTF.document.section.Section`
         """
         from PyRTF.document.section import Section
-        from .utils import RPar, RTable, RList
 
-        def _inject_blankline(element, **kwargs):
-            line = None
-            line_text = kwargs.get('alt.line.text', '')
-            if element.get(self.KEY_ADD_NEWLINE, False):
-                line = RPar(line_text, style=self._default_p_style).getParagraph(**kwargs)
-            return line
+        builders = self._get_builders()
 
         # go through element list and add to section;
         ret = Section()
         for a_element in self._element_cache:
-            e_type = a_element.get(self.KEY_TYPE, None)
-            e_ctx = a_element.get(self.KEY_VALUE, '')
-            e_style = a_element.get(self.KEY_STYLE, None)
-
-            # use captured styles to create document element;
-            element_obj = None
-            if e_type == self.ELEMENT_PARAGRAPH:
-                style_obj = self._style_cache.ParagraphStyles.get_by_name(e_style)
-                element_obj = RPar(e_ctx, style=style_obj).getParagraph(**kwargs)
-            elif e_type == self.ELEMENT_PARTIAL:
-                style_obj = self._style_cache.ParagraphStyles.get_by_name(e_style)
-                rp = RPar(None, style=style_obj)
-                rp.append(*e_ctx)
-                element_obj = rp.getParagraph(**kwargs)
-            elif e_type == self.ELEMENT_TABLE:
-                cell_s_obj = self._style_cache.ParagraphStyles.get_by_name(e_style)
-                head_s_obj = self._style_cache.ParagraphStyles.get_by_name(self._get_bold_style_name(cell_s_obj.name))
-                element_obj = RTable(e_ctx, style=cell_s_obj, header_style=head_s_obj).getTable(**kwargs)
-            elif e_type == self.ELEMENT_LIST:
-                fallback_style_obj = self._style_cache.ParagraphStyles.get_by_name(self.DEFAULT_LIST_STYLE_NAME)
-                # try to use 'e_style', and fall back to default style;
-                style_obj = self._style_cache.ParagraphStyles.get_by_name(e_style, fallback_style_obj)
-                element_obj = RList(e_ctx, style=style_obj).getList(**kwargs)
-            else:
-                pass
-            # push the element object to cache;
-            if element_obj:
-                if e_type == self.ELEMENT_LIST or (e_type == self.ELEMENT_TABLE and isinstance(element_obj, tuple)):
-                    ret.extend(element_obj)
-                else:
-                    ret.append(element_obj)
-                # optional blank line;
-                trailing = _inject_blankline(a_element, **kwargs)
+            ret.extend(self._build_element(a_element, ctx, builders, **kwargs))
+        return ret
+
+    def _get_builders(self):
+        """
+        @return element class -> bound builder method (dict)
+        """
+        return dict([
+            (e_cls, getattr(self, m_name)) for e_cls, m_name in self.ELEMENT_BUILDER_HUB.items()
+        ])
+
+    def _build_element(self, element, ctx, builders, **kwargs):
+        """
+        @param element (`RTFMaker.elements.Element`)
+        @param ctx render context, with the styles of the element registered (`_RenderContext`)
+        @param builders the return value of `_get_builders` (dict)
+
+        @return document element objects, the optional blank line included (list)
+        """
+        from .utils import RPar
+
+        ret = list()
+        builder = builders[type(element)]
+        # use captured styles to create document element;
+        element_objs = builder(element, ctx, **kwargs)
+        if element_objs:
+            ret.extend(element_objs)
+            # optional blank line;
+            if element.append_newline:
+                line_text = kwargs.get('alt.line.text', '')
+                trailing = RPar(line_text, style=ctx.default_p_style).getParagraph(**kwargs)
                 if trailing:
                     ret.append(trailing)
         return ret
 
+    def _prepare(self, **kwargs):
+        """resolve the styles and build the document object
+
+        @note all the intermediate state lives in the returned snapshot, so
+        that neither the document nor its elements are modified by rendering
+
+        @rtype `_Snapshot`
+        """
+        compact = bool(kwargs.get('compact', False))
+        ret = self._snapshot
+        if ret is not None and ret.compact != compact:
+            ret = None
+        if ret is None:
+            from PyRTF.Constants import Languages
+            from PyRTF.Elements import Document
+
+            base = self._base
+            ctx = None
+            count = len(self._element_cache)
+            if base is not None:
+                ctx = base.ctx.derive()
+                count += base.count
+            # capture all the styles;
+            self._notify_stage(self.STAGE_STYLE, **kwargs)
+            ctx = self._collect_styles(ctx, **kwargs)
+            # create document object;
+            _doc = Document(
+                style_sheet=ctx.style_sheet,
+                default_language=getattr(Languages, self.DEFAULT_LANGUAGE),
+            )
+            # parse element objects and add to document;
+            self._notify_stage(self.STAGE_ELEMENT, **kwargs)
+            _sect = self._collect_elements(ctx, **kwargs)
+            if compact and base is not None:
+                # the rendered body of the base does not fit the compact
+                # stylesheet, write all the elements again;
+                _sect = self._merge_base_elements(base, _sect)
+                base = None
+            _doc.Sections.append(_sect)
+            if compact:
+                _doc.StyleSheet = self._compact_style_sheet(ctx, _sect)
+
+            ret = _Snapshot(ctx, _doc, count, base=base, compact=compact)
+            self._snapshot = ret
+        return ret
+
+    @staticmethod
+    def _merge_base_elements(base, section):
+        """
+        @param base snapshot of the parent document (`_Snapshot`)
+        @param section elements of this document (`PyRTF.document.section.Section`)
+
+        @return section of all the elements, from the first base on
+        """
+        from PyRTF.document.section import Section
+
+        chain = list()
+        while base is not None:
+            chain.insert(0, base.document.Sections[0])
+            base = base.base
+        ret = Section()
+        for a_sect in chain:
+            ret.extend(a_sect)
+        ret.extend(section)
+        return ret
+
+    def _compact_style_sheet(self, ctx, section, **kwargs):
+        """the stylesheet of the paragraph styles in use and their fonts
+
+        @note the first paragraph style is always kept, it is the default one
+
+        @param ctx render context (`_RenderContext`)
+        @param section (`PyRTF.document.section.Section`)
+
+        @rtype `PyRTF.Elements.StyleSheet`
+        """
+        from PyRTF.Elements import StyleSheet
+        from PyRTF.Styles import ParagraphStyle
+        from PyRTF.PropertySets import Font
+        from PyRTF.document.paragraph import Paragraph, Table
+        from PyRTF.document.character import Text
+        from .utils import StyleSet
+
+        used_styles = set()
+        used_fonts = set()
+
+        def _walk(items):
+            for item in items:
+                if isinstance(item, Table):
+                    for height, cells in item.Rows:
+                        for a_cell in cells:
+                            _walk(a_cell)
+                elif isinstance(item, Paragraph):
+                    used_styles.add(item.Style)
+                    for a_run in item:
+                        font = getattr(getattr(a_run, 'Properties', None), 'font', None)
+                        if isinstance(a_run, Text) and font is not None:
+                            used_fonts.add(font.name)
+        _walk(section)
+
+        p_styles = StyleSet(ParagraphStyle)
+        for idx, a_style in enumerate(ctx.paragraph_styles):
+            if idx == 0 or a_style in used_styles:
+                p_styles.append(a_style)
+                font = a_style.TextStyle.textProps.font
+                if font is not None:
+                    used_fonts.add(font.name)
+        fonts = StyleSet(Font)
+        for a_font in ctx.fonts:
+            if a_font.name in used_fonts:
+                fonts.append(a_font)
+
+        ret = StyleSheet(colours=ctx.style_sheet.Colours, fonts=fonts)
+        ret.TextStyle = ctx.text_styles
+        ret.ParagraphStyles = p_styles
+        return ret
+
     def _to_rtf(self, **kwargs):
         """convert internal representation of document structure into RTF stream
 
+        @note for a forked document, only the elements appended after forking
+        are in the returned document object
+
         @rtype `PyRTF.Elements.Document`
         """
-        from PyRTF.Constants import Languages
-        from PyRTF.Elements import Document
-
-        # capture all the styles;
-        self._style_cache = self._collect_styles(**kwargs)
-        # create document object;
-        _doc = Document(
-            style_sheet=self._style_cache,
-            default_language=getattr(Languages, self.DEFAULT_LANGUAGE),
-        )
-        # parse element objects and add to document;
-        _sect = self._collect_elements(**kwargs)
-        _doc.Sections.append(_sect)
-
-        return _doc
+        return self._prepare(**kwargs).document
 
     def _write(self, file, **kwargs):
         """dump the full document into the file"""
-        if not self._doc:
-            self._doc = self._to_rtf(**kwargs)
+        return self._write_prepared(file, self._prepare, fingerprint=self._fingerprint, **kwargs)
+
+    def _fingerprint(self):
+        """
+        @return SHA-1 of the elements, and of the rendering of the base (hex string)
+        """
+        from .profiling import fingerprint
+        base = list()
+        if self._base is not None:
+            base = [ self._base.header()[0] ] + list(self._base.body()[0])
+        return fingerprint(base, self._element_cache)
+
+    @classmethod
+    def _write_prepared(cls, file, prepare, fingerprint=None, **kwargs):
+        """
+        @param prepare called with the rendering options, returns the
+        prepared rendering, an object with a `write(file, report)` method (callable)
+        @param fingerprint called for the fingerprint of the input when the
+        profile of a slow rendering is kept (callable)
+        """
+        from .profiling import open_profiler
+
+        profiler, own_profiler, kwargs = open_profiler(kwargs)
+        failed = True
+        try:
+            ret = cls._write_limited(file, prepare, **kwargs)
+            failed = False
+            return ret
+        finally:
+            if own_profiler:
+                profiler.stop(fingerprint, kwargs.get('profile.report', None), failed=failed)
 
-        return self._doc.write(file, **kwargs)
+    @classmethod
+    def _write_limited(cls, file, prepare, **kwargs):
+        from .memory import open_tracker
+        from .limits import open_guard
+
+        tracker, own_tracker, kwargs = open_tracker(kwargs)
+        guard, kwargs = open_guard(kwargs)
+        try:
+            snapshot = prepare(**kwargs)
+            cls._notify_stage(cls.STAGE_WRITE, **kwargs)
+            if tracker is not None:
+                file = tracker.wrap(file)
+            if guard is not None:
+                file = guard.wrap(file)
+            _need_strip = kwargs.get('strip_newline', False)
+            _debug_out = kwargs.get('debug_output', False)
+            _report = kwargs.get('compact.report', None)
+            if not (_need_strip or _debug_out):
+                return snapshot.write(file, report=_report)
+            # post-generation manipulation, applied while the output is written;
+            from .writer import OutputFilter
+            sink = OutputFilter(file, strip_newline=_need_strip, debug_output=_debug_out)
+            snapshot.write(sink, report=_report)
+            sink.finish()
+        finally:
+            if own_tracker:
+                tracker.stop(kwargs.get('memory.report', None))
+
+    def to_file(self, file, **kwargs):
+        """
+        write the full document into the file, without building the whole
+        string in memory
+
+        @param file file name, or file object opened in binary mode (string/file)
+        """
+        if isinstance(file, (basestring, unicode)):
+            with open(file, 'wb') as fh:
+                return self._write(fh, **kwargs)
+        return self._write(file, **kwargs)
 
     def to_string(self, **kwargs):
         """
-        return the string stream of the full document
+        return the RTF stream of the full document, it is 7-bit ASCII and
+        always bytes, the text outside of ASCII is escaped
 
         @param strip_newline whether the newline character needs to be removed from the output (boolean)
+        @param debug_output whether to break the header into lines (boolean)
+        @param compact leave out the unused styles and fonts, the repeated
+        formatting and the long character escapes (boolean)
+        @param compact.report filled with the bytes saved by the compact
+        mode, in total ('bytes.saved') and by 'styles', 'resets' and
+        'escapes' (dict)
+        @param memory.report filled with the peak memory of each stage, see
+        `RTFMaker.memory.MemoryTracker.stop` (dict)
+        @param memory.budget memory allowed for the rendering in bytes, the
+        rendering stops with `RTFMaker.memory.MemoryBudgetError` when it is
+        exceeded; `to_file` keeps less in memory (integer)
+        @param limit.output.bytes size allowed for the RTF stream, and
+        limit.deadline seconds allowed for the rendering, see `RTFMaker.limits` (number)
+        @param profile.threshold keep the `cProfile` dump of the rendering
+        when it takes longer, in seconds; profile.dir and profile.report, see
+        `RTFMaker.profiling` (number)
 
-        @rtype string
+        @rtype bytes
         """
-        _need_strip = kwargs.pop('strip_newline', False)
-        _debug_out = kwargs.pop('debug_output', False)
-
-        from StringIO import StringIO
-        cache = StringIO()
+        from io import BytesIO
+        cache = BytesIO()
         self._write(cache, **kwargs)
-        ret = cache.getvalue()
-        # post-generation manipulation;
-        if _need_strip:
-            ret = ret.replace('\n', '')
-        if _debug_out:
-            _ez_args = [
-                ('}\\paperw',      '}\n\\paperw'),
-                ('footer}{',       'footer}\n{'),
-                ('{\\colortbl',    '\n{\\colortbl'),
-                ('}{\\fonttbl',    '}\n{\\fonttbl'),
-                ('}{\\stylesheet', '}\n{\\stylesheet'),
-            ]
-            for i in _ez_args:
-                ret = ret.replace(*i)
+        return cache.getvalue()
+
+    def _prepare_stream(self, element_iter, **kwargs):
+        snapshot = self._prepare(**kwargs)
+        return _StreamedDocument(self, snapshot, element_iter, **kwargs)
+
+    def stream_to_file(self, element_iter, file, **kwargs):
+        """
+        write the document followed by the elements, each element is built
+        and written as soon as the iterable gives it and dropped right
+        after, nothing is appended to the document
+
+        @note the header needs all the styles, the body is kept in a spool
+        file until the last element is written; the spool counts towards
+        limit.output.bytes and memory.budget, and `callback.stage` is called
+        with the element stage before each element
+
+        @param element_iter (iterable of dict or `RTFMaker.elements.Element`)
+        @param file file name, or file object opened in binary mode (string/file)
+        @param stream.spool.size body kept in memory before it goes to a
+        temporary file, in bytes (integer)
+
+        @note the other keyword arguments are the rendering options, same
+        as `to_string`; the compact mode needs all the elements at once,
+        they are collected before the document is written
+        """
+        if kwargs.get('compact', False):
+            doc = self.fork(**kwargs)
+            for a_element in element_iter:
+                doc.append(a_element, **kwargs)
+            return doc.to_file(file, **kwargs)
+        prepare = lambda **kw: self._prepare_stream(element_iter, **kw)
+        if isinstance(file, (basestring, unicode)):
+            with open(file, 'wb') as fh:
+                return self._write_prepared(fh, prepare, **kwargs)
+        return self._write_prepared(file, prepare, **kwargs)
+
+    def stream(self, element_iter, **kwargs):
+        """
+        same as `stream_to_file`, but the RTF stream is returned
+
+        @rtype bytes
+        """
+        from io import BytesIO
+        cache = BytesIO()
+        self.stream_to_file(element_iter, cache, **kwargs)
+        return cache.getvalue()
+
+    def compile_fragment(self, **kwargs):
+        """
+        render the document once, to be merged with others by `merge`
+
+        @note the keyword arguments are the rendering options, same as `to_string`
+
+        @rtype `Fragment`
+        """
+        snapshot = self._prepare(**kwargs)
+        snapshot.body()
+        return Fragment(snapshot)
+
+    @classmethod
+    def _prepare_merge(cls, parts, **kwargs):
+        snapshots = list()
+        for a_part in parts:
+            if isinstance(a_part, RTFDocument):
+                a_part = a_part.compile_fragment(**kwargs)
+            if not isinstance(a_part, Fragment):
+                _msg = 'invalid part to merge: {p!r}'.format(p=a_part)
+                raise ValueError(_msg)
+            snapshots.append(a_part._snapshot)
+        return _MergedDocument(snapshots, part_break=kwargs.get('merge.break', _MergedDocument.BREAK_SECTION))
+
+    @classmethod
+    def merge(cls, parts, **kwargs):
+        """
+        combine the documents into one RTF stream; the style, font and
+        colour tables are unified, and the rendered body of each part is
+        reused as it is, with its table references renumbered
+
+        @param parts (list of `RTFDocument` or `Fragment`)
+        @param merge.break what comes between the parts: a new section on a
+        new page, with the page settings of the part ('section', the default),
+        a page break ('page'), or nothing (None)
+
+        @note the other keyword arguments are the rendering options, same as
+        `to_string`, they apply to the parts given as documents
+
+        @rtype bytes
+        """
+        from io import BytesIO
+        cache = BytesIO()
+        cls.merge_to_file(parts, cache, **kwargs)
+        return cache.getvalue()
+
+    @classmethod
+    def merge_to_file(cls, parts, file, **kwargs):
+        """
+        same as `merge`, but the RTF stream is written into the file
+
+        @param file file name, or file object opened in binary mode (string/file)
+        """
+        prepare = lambda **kw: cls._prepare_merge(parts, **kw)
+        if isinstance(file, (basestring, unicode)):
+            with open(file, 'wb') as fh:
+                return cls._write_prepared(fh, prepare, **kwargs)
+        return cls._write_prepared(file, prepare, **kwargs)
+
+    def __getstate__(self):
+        # the prepared rendering is a cache, leave it out of pickles;
+        ret = dict(self.__dict__)
+        ret['_snapshot'] = None
         return ret
 
     def __repr__(self):
         ret = "<RTF document of {ec} element(s) at {addr}>".format(
-            ec=len(self._element_cache),
+            ec=len(self._element_cache) + (self._base.count if self._base is not None else 0),
             addr="0x%x"%(id(self)),
         )
         return ret
@@ -0,0 +1,214 @@
+"""
+elements.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from .compat import unicode, basestring
+
+KEY_TYPE = 'type'
+KEY_VALUE = 'value'
+KEY_FONT = 'font'
+KEY_ADD_NEWLINE = 'append_newline'
+KEY_WIDTH = 'width'
+KEY_HEIGHT = 'height'
+
+
+class Element(object):
+    """base class of the document elements"""
+
+    __slots__ = ('value', 'font', 'append_newline')
+
+    TYPE = None
+
+    def __init__(self, value='', font=None, append_newline=False):
+        """
+        @param value content of the element
+        @param font CSS font directives (string)
+        @param append_newline whether a blank line follows the element (boolean)
+        """
+        if font is not None and not isinstance(font, (basestring, unicode)):
+            _msg = 'invalid font definition: {f!r}'.format(f=font)
+            raise ValueError(_msg)
+        self.value = value
+        self.font = font or None
+        self.append_newline = bool(append_newline)
+
+    @classmethod
+    def from_dict(cls, data):
+        """create the element from its dictionary representation
+
+        @param data (dict)
+        """
+        return cls(
+            data.get(KEY_VALUE, ''),
+            font=data.get(KEY_FONT, None),
+            append_newline=data.get(KEY_ADD_NEWLINE, False),
+        )
+
+    def __repr__(self):
+        return "<{c} element at {addr}>".format(
+            c=self.__class__.__name__,
+            addr="0x%x"%(id(self)),
+        )
+
+
+class Paragraph(Element):
+    """a paragraph of text"""
+
+    __slots__ = ()
+
+    TYPE = 'paragraph'
+
+
+class Run(object):
+    """a piece of text inside of a partial paragraph"""
+
+    __slots__ = ('value', 'font')
+
+    def __init__(self, value='', font=None):
+        if font is not None and not isinstance(font, (basestring, unicode)):
+            _msg = 'invalid font definition: {f!r}'.format(f=font)
+            raise ValueError(_msg)
+        self.value = value
+        self.font = font or None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get(KEY_VALUE, ''),
+            font=data.get(KEY_FONT, None),
+        )
+
+
+class Partial(Element):
+    """a paragraph assembled from several runs of text"""
+
+    __slots__ = ()
+
+    TYPE = 'partial'
+
+    def __init__(self, value=(), font=None, append_newline=False):
+        """
+        @param value runs of the paragraph, `None` marks an empty slot (list,tuple)
+        """
+        if not isinstance(value, (list, tuple)):
+            _msg = 'invalid value for partial element: {v!r}'.format(v=value)
+            raise ValueError(_msg)
+        runs = list()
+        for a_run in value:
+            if isinstance(a_run, dict):
+                a_run = Run.from_dict(a_run)
+            elif a_run is not None and not isinstance(a_run, Run):
+                _msg = 'invalid run in partial element: {v!r}'.format(v=a_run)
+                raise ValueError(_msg)
+            runs.append(a_run)
+        super(Partial, self).__init__(
+            tuple(runs),
+            font=font,
+            append_newline=append_newline,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get(KEY_VALUE, ()),
+            font=data.get(KEY_FONT, None),
+            append_newline=data.get(KEY_ADD_NEWLINE, False),
+        )
+
+
+class Table(Element):
+    """a table, given as HTML, as a dict of `head`, `body` and `foot` cells,
+    or as a dict of `columns` (arrays or sequences) with the `formats` of
+    the columns and the optional `head`; a cell may span several columns or
+    rows with its `colspan` and `rowspan`, the slots it covers hold None
+    """
+
+    __slots__ = ()
+
+    TYPE = 'table'
+
+
+class List(Element):
+    """a list, given as HTML or as a dict of `items` and `formats`"""
+
+    __slots__ = ()
+
+    TYPE = 'list'
+
+
+class Image(Element):
+    """a PNG or JPEG picture, given as a file name or as the image data"""
+
+    __slots__ = ('width', 'height')
+
+    TYPE = 'image'
+
+    def __init__(self, value=None, font=None, append_newline=False, width=None, height=None):
+        """
+        @param value file name (string) or image data (bytes)
+        @param width display width in pixels, the width of the image when omitted (integer)
+        @param height display height in pixels, follows the width when omitted (integer)
+        """
+        if not value or not isinstance(value, (basestring, unicode, bytes)):
+            _msg = 'invalid value for image element: {v!r}'.format(v=type(value))
+            raise ValueError(_msg)
+        for a_size in (width, height):
+            if a_size is not None and (not isinstance(a_size, int) or a_size <= 0):
+                _msg = 'invalid image size: {s!r}'.format(s=a_size)
+                raise ValueError(_msg)
+        super(Image, self).__init__(value, font=font, append_newline=append_newline)
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get(KEY_VALUE, None),
+            font=data.get(KEY_FONT, None),
+            append_newline=data.get(KEY_ADD_NEWLINE, False),
+            width=data.get(KEY_WIDTH, None),
+            height=data.get(KEY_HEIGHT, None),
+        )
+
+
+ELEMENT_CLASS_HUB = dict([ (i.TYPE, i) for i in (Paragraph, Partial, Table, List, Image) ])
+
+
+def make_element(data, **kwargs):
+    """convert the dictionary representation of an element into element object
+
+    @param data (dict or `Element`)
+
+    @return None for an unknown element type, unless `use_exc` is set (`Element`)
+    """
+    if isinstance(data, Element):
+        return data
+    if not isinstance(data, dict):
+        _msg = 'invalid element: {d!r}'.format(d=data)
+        raise ValueError(_msg)
+    e_type = data.get(KEY_TYPE, None)
+    e_cls = ELEMENT_CLASS_HUB.get(e_type, None)
+    if e_cls is None:
+        if not kwargs.get('use_exc', False):
+            return None
+        _msg = 'unknown element type: {t!r}'.format(t=e_type)
+        raise ValueError(_msg)
+    return e_cls.from_dict(data)
+
+
+#--eof--#
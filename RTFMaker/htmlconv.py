@@ -17,11 +17,53 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from .compat import unicode, basestring
+
+
 class _empty(object):
     """special placeholder"""
     pass
 
 
+# translator, parsed page and options of the forked worker process;
+_FORKED = dict()
+
+
+def _init_forked(state):
+    _FORKED.update(state)
+
+
+def _translate_target(idx):
+    """
+    @param idx index of the target in the tag set (integer)
+
+    @return the detached element dicts of the target (list)
+    """
+    translator = _FORKED['translator']
+    kw = _FORKED['kw']
+    return list(translator._iter_elements(_FORKED['dom'], _FORKED['tag_set'][idx:idx + 1], **kw))
+
+
+def _get_fork_context():
+    """
+    @return the multiprocessing module/context that forks the workers, None
+    when forking is not available
+    """
+    import sys
+    import multiprocessing
+
+    if multiprocessing.current_process().daemon:
+        # pool workers can not have children;
+        return None
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return None if sys.platform == 'win32' else multiprocessing
+    try:
+        return get_context('fork')
+    except ValueError:
+        return None
+
+
 def get_html_translator(base_cls, **kwargs):
     '''
     factory method for HTML-to-RTF translator class
@@ -35,6 +77,13 @@ def get_html_translator(base_cls, **kwargs):
 
     class HTMLRTF(base_cls):
         ATTR_FONT_DEF = 'FONT_HUB'
+        # properties of each class in FONT_HUB, and the font resolved for each tuple of classes;
+        ATTR_FONT_CASCADE = 'FONT_CASCADE'
+        # most tuples of classes with the resolved font kept, least recently used dropped first;
+        FONT_CASCADE_SIZE = 1024
+
+        # properties in the order they are written in a composed font definition;
+        FONT_PROPERTY_ORDER = ('font-family', 'font-size', 'font-weight', 'font-style')
 
         DEFAULT_FONT_DEF = (
             ('med-font',   'font-family:Arial;font-size:9pt;'),
@@ -48,6 +97,14 @@ def get_html_translator(base_cls, **kwargs):
         DEFAULT_NOPARENTCLS_DIRECTIVE_LABEL = 'maskparentclass'
         DEFAULT_HTML_ATTR_NAME = 'data-rtf-directive'
 
+        STAGE_PARSE = 'parse'
+        STAGE_EXTRACT = 'extract'
+        STAGE_FILTER = 'filter'
+        STAGE_TEXT = 'text'
+
+        # format version of the intermediate representation made by `compile`;
+        IR_VERSION = 1
+
         @staticmethod
         def _span_wrap(inner_html, **kw):
             outer_html = '<span>{x}</span>'.format(x=inner_html)
@@ -57,12 +114,17 @@ def get_html_translator(base_cls, **kwargs):
         @staticmethod
         def _collect_cls(*args):
             '''
+            @note the classes repeated down the tree are kept once, at their
+            first position
+
             @return combined list or None
             '''
             cache  = list()
             for a_cls in args:
                 if isinstance(a_cls, (list,tuple)):
-                    cache.extend(a_cls)
+                    for a_name in a_cls:
+                        if a_name not in cache:
+                            cache.append(a_name)
             if len(cache) > 0:
                 return cache
             return None
@@ -72,8 +134,13 @@ def get_html_translator(base_cls, **kwargs):
             '''
             extract tags from the HTML document
 
+            @note the targets are all looked up before the first one is
+            given, the later stages change the classes of the tags
+
             @param doc ()
             @param tag_list (list,tuple)
+
+            @return iterator of the tags
             '''
             ret = list()
 
@@ -89,8 +156,10 @@ def get_html_translator(base_cls, **kwargs):
                     tag_obj = doc.findAll(attrs=a_attr)
                     if len(tag_obj) == 0 and _add_na:
                         tag_obj.append(placeholder)
-                    ret.extend(tag_obj)
-            return ret
+                    ret.append(tag_obj)
+            for tag_obj in ret:
+                for a_tag in tag_obj:
+                    yield a_tag
 
         @staticmethod
         def _font_def_validator(font_def, **kw):
@@ -155,34 +224,105 @@ def get_html_translator(base_cls, **kwargs):
 
             if isinstance(user_font_def, (list,tuple)):
                 if len(user_font_def):
-                    for font_cls, font_def in user_font_def:
-                        font_hub[font_cls] = font_def
-                    _update_hub = True
+                    user_font_def = dict(user_font_def)
+                else:
+                    user_font_def = None
             if isinstance(user_font_def, dict):
                 if len(user_font_def):
-                    font_hub.update(user_font_def)
-                    _update_hub = True
-            else:
+                    for font_cls, font_def in user_font_def.items():
+                        if font_hub.get(font_cls, _empty) != font_def:
+                            font_hub[font_cls] = font_def
+                            _update_hub = True
+                    if getattr(self, self.ATTR_FONT_DEF, None) is not font_hub:
+                        _update_hub = True
+            elif user_font_def is not None:
                 if kw.get('debug.use.exc', False):
                     _msg = 'invalid data type: {c}'.format(c=type(user_font_def))
                     raise ValueError(_msg)
             if _update_hub:
                 setattr(self, self.ATTR_FONT_DEF, font_hub)
+                # recompiled on the next lookup;
+                setattr(self, self.ATTR_FONT_CASCADE, None)
             return font_hub
 
         def _load_default_font_def(self, **kw):
             font_hub = self._load_font_def(self.DEFAULT_FONT_DEF, **kw)
             return font_hub
 
+        @staticmethod
+        def _parse_font_def(font_def):
+            '''
+            @param font_def CSS font directives (string)
+
+            @return list of (property, value)
+            '''
+            ret = list()
+            for a_rule in font_def.split(';'):
+                if a_rule.find(':') == -1:
+                    continue
+                prop, value = [ i.strip() for i in a_rule.split(':', 1) ]
+                if len(prop) > 0 and len(value) > 0:
+                    ret.append((prop.lower(), value))
+            return ret
+
+        def _get_font_cascade(self):
+            '''
+            @return (properties of each class, resolved font of each tuple of classes)
+            '''
+            from collections import OrderedDict
+
+            cascade = getattr(self, self.ATTR_FONT_CASCADE, None)
+            if cascade is None:
+                font_hub = getattr(self, self.ATTR_FONT_DEF, None) or dict()
+                cls_props = dict()
+                for a_cls_name, font_def in font_hub.items():
+                    if font_def and isinstance(font_def, (basestring, unicode)):
+                        cls_props[a_cls_name] = (font_def, dict(self._parse_font_def(font_def)))
+                cascade = (cls_props, OrderedDict())
+                setattr(self, self.ATTR_FONT_CASCADE, cascade)
+            return cascade
+
         def _map_css_cls_to_font(self, names, default=None, **kw):
-            ret = default
+            '''
+            @note each property comes from the first class defining it, in the
+            order of `names` (the classes of the node, then the inherited ones),
+            so that `small-font bold-font` is small and bold; a font equal to the
+            definition of one class is given as that definition
 
-            font_hub = getattr(self, self.ATTR_FONT_DEF, None)
-            if names:
-                for a_cls_name in names:
-                    ret = font_hub.get(a_cls_name, None)
-                    if ret:
-                        break
+            @param names CSS classes (list)
+
+            @return CSS font directives (string)
+            '''
+            if not names:
+                return default
+            cls_props, resolved = self._get_font_cascade()
+            key = tuple(names)
+            ret = resolved.pop(key, _empty)
+            if ret is _empty:
+                ret = None
+                merged = dict()
+                first_def = None
+                for a_cls_name in key:
+                    a_def = cls_props.get(a_cls_name, None)
+                    if a_def is None:
+                        continue
+                    if first_def is None:
+                        first_def = a_def
+                    for prop, value in a_def[1].items():
+                        merged.setdefault(prop, value)
+                if first_def is not None:
+                    if merged == first_def[1]:
+                        ret = first_def[0]
+                    else:
+                        ordered = [ i for i in self.FONT_PROPERTY_ORDER if i in merged ]
+                        ordered += sorted([ i for i in merged if i not in self.FONT_PROPERTY_ORDER ])
+                        ret = ''.join([ '{p}:{v};'.format(p=i, v=merged[i]) for i in ordered ])
+                # the class tuples come from the input, keep the memo bounded;
+                while len(resolved) >= self.FONT_CASCADE_SIZE:
+                    resolved.popitem(last=False)
+            resolved[key] = ret
+            if ret is None:
+                return default
             return ret
 
         def _get_extraction_directive(self, node, **kw):
@@ -226,7 +366,7 @@ def get_html_translator(base_cls, **kwargs):
             else:
                 if isinstance(tag, NavigableString):
                     decision = False
-                elif str(getattr(tag, 'name')).lower() in ('u', 'i', 'br', 'hr', 'ul', 'ol'):
+                elif str(getattr(tag, 'name')).lower() in ('u', 'i', 'br', 'hr', 'ul', 'ol', 'img'):
                     decision = False
                 else:
                     pass
@@ -240,17 +380,12 @@ def get_html_translator(base_cls, **kwargs):
             '''
             ret = list()
 
-            EXEMPT_COUNT = -1
-            _parent_cls = kw.get('parent.cls', None)
+            from bs4.element import Tag
 
-            cnt_children = EXEMPT_COUNT
-            try:
-                children = getattr(node, 'children')
-                cnt_children = children.__length_hint__()
-            except:
-                pass
+            _parent_cls = kw.get('parent.cls', None)
 
-            if cnt_children > EXEMPT_COUNT:
+            # the children iterator has no length hint on Python 3;
+            if isinstance(node, Tag):
                 _idx = 0
                 for child in node.children:
                     child_name = child.name
@@ -275,16 +410,26 @@ def get_html_translator(base_cls, **kwargs):
 
             @param recursive (bool)
             @param parent.cls (list)
+
+            @return iterator of the tags, expanded as they are taken
             '''
+            flat_tags = self._iter_flat_tags(tag, **kw)
+            if kw.get('depth', 0) == 0:
+                flat_tags = self._merge_tag(flat_tags, **kw)
+            return flat_tags
+
+        def _iter_flat_tags(self, tag, **kw):
             ROOT_LEVEL = 0
             STEP = 1
             PARAM_DEPTH = 'depth'
             PARAM_PARENT_CLASS = 'parent.cls'
 
-            flat_list = list()
-
             _recursive = kw.get('recursive', True)
             _depth = kw.get(PARAM_DEPTH, ROOT_LEVEL)
+            _guard = kw.get('limit.guard', None)
+            if _guard is not None:
+                _guard.check('limit.depth', _depth)
+                _guard.check_deadline()
 
             expand_param = dict()
             expand_param.update(**kw)
@@ -299,7 +444,6 @@ def get_html_translator(base_cls, **kwargs):
             except:
                 pass
 
-            expanded = list()
             this_tag_do_expand = self._get_node_expand_policy(tag, **kw)
             if this_tag_do_expand == True:
                 children = self._expand_tag(tag, **expand_param)
@@ -311,73 +455,127 @@ def get_html_translator(base_cls, **kwargs):
                         call_param[PARAM_DEPTH] = _depth + STEP
 
                         for child_tag in children:
-                            child_expand = self._flatten_tag(child_tag, **call_param)
-                            expanded.extend(child_expand)
+                            for a_tag in self._iter_flat_tags(child_tag, **call_param):
+                                yield a_tag
                     else:
-                        expanded.extend(children)
+                        for a_tag in children:
+                            yield a_tag
                 else:
-                    expanded.append(tag)
+                    yield tag
             else:
-                expanded.append(tag)
-            flat_list.extend(expanded)
-
-            if _depth == ROOT_LEVEL:
-                flat_list = self._merge_tag(flat_list, **kw)
-            return flat_list
+                yield tag
 
         @staticmethod
         def _merge_tag(tags, **kw):
-            new_tags = list()
+            '''
+            group the tags between line breaks and blank strings, a group of
+            one stays a tag; nothing is grouped when there is no break at all
+
+            @note the tags before the first break are held back until it
+            comes, or until the last tag
+
+            @param tags (iterable)
 
+            @return iterator of tags and lists of tags
+            '''
             MARK = 1
 
             def _detect_br_blank(tag, **kw):
                 ret = 0
                 if str(tag.name).lower() == 'br':
                     ret = MARK
-                elif len(unicode(tag).strip()) == 0:
+                elif tag.name is None and len(unicode(tag).strip()) == 0:
+                    # a tag is never blank, no need to serialize it;
                     ret = MARK
                 return ret
 
-            def _rollover(stack, callback=None, **kw):
-                cnt = len(stack)
-                if callable(callback):
-                    if cnt == 1:
-                        callback(stack[0])
-                    elif cnt > 1:
-                        callback(stack[:])
-                    else:
-                        pass
-                return list()
-
-            flag = [ _detect_br_blank(i, **kw) for i in tags ]
-            cnt_flag = sum(flag)
-            _cb = new_tags.append
-            if cnt_flag > 0:
-                if cnt_flag < len(flag):
+            has_mark = False
+            stak = list()
+            for tag in tags:
+                if _detect_br_blank(tag, **kw) == MARK:
+                    has_mark = True
+                    if len(stak) == 1:
+                        yield stak[0]
+                    elif len(stak) > 1:
+                        yield stak
                     stak = list()
-                    for i in range(len(flag)):
-                        if flag[i] == MARK:
-                            stak = _rollover(stak, callback=_cb)
-                        else:
-                            stak.append(tags[i])
-                        pass
-                    stak = _rollover(stak, callback=_cb)
-            else:
-                new_tags.extend(tags)
-            return new_tags
+                else:
+                    stak.append(tag)
+            if not has_mark:
+                for tag in stak:
+                    yield tag
+            elif len(stak) == 1:
+                yield stak[0]
+            elif len(stak) > 1:
+                yield stak
 
         def _filter_tag(self, tags, **kw):
             '''
             process extracted tags
 
             @param tags ()
+
+            @return iterator of the tags
             '''
-            tag_cache = list()
             for tag in tags:
-                new_tags = self._flatten_tag(tag, **kw)
-                tag_cache.extend(new_tags)
-            return tag_cache
+                for a_tag in self._flatten_tag(tag, **kw):
+                    yield a_tag
+
+        @staticmethod
+        def _get_image_size(tag, name):
+            '''
+            @return the size given in pixels, None otherwise (integer)
+            '''
+            value = (tag.get(name) or '').strip().lower()
+            if value.endswith('px'):
+                value = value[:-2].strip()
+            if value.isdigit() and int(value) > 0:
+                return int(value)
+            return None
+
+        def _load_image(self, src, **kw):
+            '''
+            locate the image data of the img tag
+
+            @param src value of the src attribute (string)
+            @param image.root folder of the relative file names, the current folder by default (string)
+            @param callback.image.loader called with the src value, returns the
+            file name or the data of the image, or None when not found (callable)
+
+            @return file name or image data, None when not found, or when it
+            is not PNG/JPEG, or when the file is outside of the image folder
+            '''
+            from .utils import is_image_data, get_image_path
+
+            _loader = kw.get('callback.image.loader', None)
+            if callable(_loader):
+                return _loader(src, **kw)
+
+            src = (src or '').strip()
+            if src.startswith('data:'):
+                import base64
+                import binascii
+                header, _sep, payload = src[5:].partition(',')
+                if not header.endswith(';base64'):
+                    return None
+                try:
+                    data = base64.b64decode(payload.encode('ascii'))
+                except (binascii.Error, TypeError, ValueError):
+                    return None
+                return data if is_image_data(data) else None
+            if len(src) == 0 or '://' in src:
+                # no download;
+                return None
+            path = get_image_path(src, kw.get('image.root', None))
+            if path is None:
+                # absolute name, or '..' leading out of the image folder;
+                return None
+            try:
+                with open(path, 'rb') as fh:
+                    head = fh.read(8)
+            except (IOError, OSError):
+                return None
+            return path if is_image_data(head) else None
 
         def _get_text_from_tag(self, tag, **kw):
             '''
@@ -453,6 +651,24 @@ def get_html_translator(base_cls, **kwargs):
                         tmp_dic = _func(tmp_dic, **kw)
                     txt_obj[1] = tmp_dic
                     txt_obj[0] = 1
+                elif t_name in ('img',):
+                    img_value = self._load_image(tag.get('src'), **kw)
+                    if img_value:
+                        t_cls = tag.get('class')
+                        tmp_dic = {
+                            'type': 'image',
+                            'value': img_value,
+                            'font': self._map_css_cls_to_font(t_cls, None, **kw),
+                            'width': self._get_image_size(tag, 'width'),
+                            'height': self._get_image_size(tag, 'height'),
+                            #
+                            'append_newline': True,
+                        }
+                        txt_obj[1] = tmp_dic
+                        txt_obj[0] = 1
+                    elif _use_exc:
+                        _msg = "cannot load image:{s}".format(s=tag.get('src'))
+                        raise RuntimeError(_msg)
                 elif t_name in ('br',):
                     pass
                 elif t_name in (None,'u','i',):
@@ -478,40 +694,360 @@ def get_html_translator(base_cls, **kwargs):
             '''
             convert tag into text object
 
-            @param tags (list)
+            @param tags (iterable)
+
+            @return iterator of the element dicts
             '''
-            txt_list = list()
+            cnt = 0
+            _guard = kw.get('limit.guard', None)
 
             for tag in tags:
                 txt = self._get_text_from_tag(tag, **kw)
                 txt_def = txt[1]
                 if txt_def is not None:
-                    txt_list.append(txt_def)
-            return txt_list
+                    cnt += 1
+                    if _guard is not None:
+                        _guard.check('limit.elements', cnt)
+                        _guard.check_deadline()
+                    yield txt_def
 
-        def translate(self, raw_html, tag_set, **kw):
+        def _detach_element(self, element, **kw):
+            '''
+            replace the parsed HTML in the element dict with plain data, the
+            result renders the same and can be passed between processes
+
+            @param element (dict)
+
+            @rtype dict
+            '''
+            from bs4.element import PageElement
+            from .utils import RTable, RList, _text_strip
+
+            if not isinstance(element, dict):
+                return element
+            value = element.get('value', None)
+            e_type = element.get('type', None)
+            if e_type == 'partial' and isinstance(value, (list, tuple)):
+                value = [ self._detach_element(i, **kw) for i in value ]
+            elif isinstance(value, PageElement):
+                if e_type == 'table':
+                    value = RTable(value).get_elements(**kw)
+                elif e_type == 'list':
+                    value = RList(value).get_elements(**kw)
+                else:
+                    value = _text_strip(value)
+            else:
+                return element
+            ret = dict(element)
+            ret['value'] = value
+            return ret
+
+        def _translate_targets(self, dom, tag_set, jobs, **kw):
+            '''
+            run the extract, filter and text stages of each target of the tag
+            set in forked worker processes
+
+            @note every worker works on its own copy of the page, the targets
+            are expected not to overlap
+
+            @param dom parsed page
+            @param tag_set (list)
+            @param jobs number of worker processes (integer)
+
+            @return element dicts in the order of the tag set (list), None when
+            the workers can not be forked
+            '''
+            context = _get_fork_context()
+            if context is None:
+                return None
+            state = {
+                'translator': self,
+                'dom': dom,
+                'tag_set': list(tag_set),
+                # the guard goes along, its deadline counts from the parent;
+                'kw': dict((k, v) for k, v in kw.items() if k not in ('callback.stage', 'memory.tracker')),
+            }
+            # handed over by the fork, never pickled;
+            pool = context.Pool(min(jobs, len(tag_set)), _init_forked, (state,))
+            try:
+                chunk_size = max(1, len(tag_set) // (jobs * 4))
+                results = pool.map(_translate_target, range(len(tag_set)), chunk_size)
+            finally:
+                pool.close()
+                pool.join()
+            ret = list()
+            for txt_list in results:
+                ret.extend(txt_list)
+            return ret
+
+        def compile_stylesheet(self, **kw):
+            '''
+            compile the styles of all the known CSS classes once, the result
+            can be passed to `translate` as `stylesheet` for any number of pages
+
+            @param css_font_def (dict/list)
+
+            @return `RTFMaker.core.CompiledStyleSheet`
+            '''
+            self._load_default_font_def(**kw)
+            user_font = kw.pop('css_font_def', None)
+            font_hub = self._load_font_def(user_font, **kw)
+
+            from . import RTFDocument
+            return RTFDocument.compile_stylesheet(font_hub, **kw)
+
+        def _iter_elements(self, dom, tag_set, **kw):
+            '''
+            run the extract, filter and text stages one tag at a time
+
+            @param dom parsed page
+            @param tag_set (list)
+
+            @return iterator of the element dicts free of the parsed HTML
             '''
+            raw_tags = self._extract_tag(dom, tag_set, **kw)
+            final_tags = self._filter_tag(raw_tags, **kw)
+            for txt_def in self._tag2txt(final_tags, **kw):
+                yield self._detach_element(txt_def, **kw)
+
+        @staticmethod
+        def _release_page(dom, element_iter):
+            try:
+                for a_element in element_iter:
+                    yield a_element
+            finally:
+                # nothing refers to the parsed page any more;
+                dom.decompose()
+
+        def _open_elements(self, raw_html, tag_set, **kw):
+            '''
+            parse the page, the targets of the tag set are turned into
+            element dicts free of the parsed HTML as they are taken, and the
+            parsed page is released after the last one
+
+            @note the extract stage covers the filter and text stages
+
             @param raw_html (string)
             @param tag_set (list)
             @param css_font_def (dict/list)
+            @param parallel.jobs number of worker processes translating the
+            targets of the tag set, all of them are translated before the
+            first one is given (integer)
 
-            @return RTF stream (string)
+            @return iterator of the element dicts
             '''
+            _stage_cb = kw.get('callback.stage', None)
+            if not callable(_stage_cb):
+                _stage_cb = lambda stage: None
+
             self._load_default_font_def(**kw)
             user_font = kw.pop('css_font_def', None)
             self._load_font_def(user_font, **kw)
 
+            _guard = kw.get('limit.guard', None)
+            if _guard is not None:
+                _guard.check('limit.input.bytes', len(raw_html))
+
+            _stage_cb(self.STAGE_PARSE)
             dom = BeautifulSoup(raw_html, 'html.parser')
+            if _guard is not None:
+                _guard.check_dom(dom)
+
+            _stage_cb(self.STAGE_EXTRACT)
+            _jobs = kw.get('parallel.jobs', 1) or 1
+            if _jobs > 1 and len(tag_set) > 1:
+                txt_cache = self._translate_targets(dom, tag_set, _jobs, **kw)
+                if txt_cache is not None:
+                    dom.decompose()
+                    if _guard is not None:
+                        _guard.check('limit.elements', len(txt_cache))
+                    return iter(txt_cache)
+            return self._release_page(dom, self._iter_elements(dom, tag_set, **kw))
+
+        def _compile_elements(self, raw_html, tag_set, **kw):
+            '''
+            turn the targets of the tag set into element dicts free of the
+            parsed HTML, the parsed page is released before returning
 
-            raw_tags = self._extract_tag(dom, tag_set, **kw)
-            final_tags = self._filter_tag(raw_tags, **kw)
+            @param raw_html (string)
+            @param tag_set (list)
+            @param css_font_def (dict/list)
+            @param parallel.jobs number of worker processes translating the
+            targets of the tag set (integer)
+
+            @return element dicts (list)
+            '''
+            txt_cache = list(self._open_elements(raw_html, tag_set, **kw))
+            _tracker = kw.get('memory.tracker', None)
+            if _tracker is not None:
+                _tracker.check()
+            return txt_cache
+
+        @staticmethod
+        def _compact_element(element):
+            '''
+            leave out the keys holding the default value
+
+            @param element (dict)
+
+            @rtype dict
+            '''
+            if not isinstance(element, dict):
+                return element
+            ret = dict()
+            for a_key, a_value in element.items():
+                if a_value is None or (a_key == 'append_newline' and not a_value):
+                    continue
+                ret[a_key] = a_value
+            if ret.get('type', None) == 'partial' and isinstance(ret.get('value', None), (list, tuple)):
+                # the runs only have a value and a font;
+                ret['value'] = [
+                    (dict([ (k, v) for k, v in i.items() if k in ('value', 'font') and v is not None ])
+                     if isinstance(i, dict) else i)
+                    for i in ret['value']
+                ]
+            return ret
+
+        def compile(self, raw_html, tag_set, **kw):
+            '''
+            translate the HTML page into the intermediate representation: a
+            dict of the format 'version' and of the 'elements', the element
+            dicts of `RTFMaker.RTFDocument.append` with text, table cells, list
+            items and CSS fonts already resolved; it holds nothing of the
+            parsed page, and can be cached, pickled, or dumped to JSON when
+            there is no image data in it
+
+            @param raw_html (string)
+            @param tag_set (list)
+            @param css_font_def (dict/list)
 
-            txt_cache = self._tag2txt(final_tags, **kw)
+            @return (dict)
+            '''
+            from .memory import open_tracker
+            from .limits import open_guard
+            tracker, own_tracker, kw = open_tracker(kw)
+            guard, kw = open_guard(kw)
+            try:
+                elements = self._compile_elements(raw_html, tag_set, **kw)
+            finally:
+                if own_tracker:
+                    tracker.stop(kw.get('memory.report', None))
+            ret = {
+                'version': self.IR_VERSION,
+                'elements': [ self._compact_element(i) for i in elements ],
+            }
+            return ret
+
+        def _document_from_ir(self, ir, **kw):
+            '''
+            @param ir the return value of `compile` (dict)
+
+            @return `RTFMaker.RTFDocument`
+            '''
+            if not isinstance(ir, dict) or ir.get('version', None) != self.IR_VERSION:
+                _msg = 'unsupported intermediate representation, version {v} is expected'.format(v=self.IR_VERSION)
+                raise ValueError(_msg)
             from . import RTFDocument
             r = RTFDocument(**kw)
-            for i in txt_cache:
+            for i in ir['elements']:
                 r.append(i)
-            return r.to_string(**kw)
+            return r
+
+        def render(self, ir, **kw):
+            '''
+            render the intermediate representation, same options as `translate`
+
+            @param ir the return value of `compile` (dict)
+
+            @return RTF stream (string)
+            '''
+            kw.pop('css_font_def', None)
+            return self._document_from_ir(ir, **kw).to_string(**kw)
+
+        def render_to_file(self, ir, file, **kw):
+            '''
+            same as `render`, but the RTF stream is written into the file
+
+            @param file file name or file object (string/file)
+            '''
+            kw.pop('css_font_def', None)
+            return self._document_from_ir(ir, **kw).to_file(file, **kw)
+
+        def _stream_document(self, raw_html, tag_set, file, **kw):
+            '''
+            translate the HTML page, each target goes through the stages and
+            is written as soon as it is found, no list of the tags or of the
+            elements is ever built
+
+            @param raw_html (string)
+            @param tag_set (list)
+            @param file file name or file object (string/file)
+            @param css_font_def (dict/list)
+            '''
+            elements = self._open_elements(raw_html, tag_set, **kw)
+            kw.pop('css_font_def', None)
+            from . import RTFDocument
+            return RTFDocument(**kw).stream_to_file(elements, file, **kw)
+
+        def translate(self, raw_html, tag_set, **kw):
+            '''
+            @param raw_html (string)
+            @param tag_set (list)
+            @param css_font_def (dict/list)
+            @param stylesheet (`RTFMaker.core.CompiledStyleSheet`)
+            @param image.root folder of the image files referred to by relative names (string)
+            @param parallel.jobs number of worker processes for the targets of the tag set (integer)
+            @param callback.stage called with the name of each stage before it starts,
+            the stages of the document rendering included (callable)
+            @param memory.report filled with the peak memory of each stage (dict)
+            @param memory.budget memory allowed for the translation in bytes,
+            `RTFMaker.memory.MemoryBudgetError` is raised when it is exceeded (integer)
+            @param limit.* resource limits for untrusted pages, see `RTFMaker.limits`;
+            `RTFMaker.limits.LimitExceeded` is raised when one is exceeded (number)
+            @param stream.spool.size body of the document kept in memory
+            before it goes to a temporary file, in bytes (integer)
+            @param profile.threshold keep the `cProfile` dump of the
+            translation when it takes longer, in seconds, see `RTFMaker.profiling` (number)
+
+            @return RTF stream (string)
+            '''
+            from io import BytesIO
+            cache = BytesIO()
+            self.translate_to_file(raw_html, tag_set, cache, **kw)
+            return cache.getvalue()
+
+        def translate_to_file(self, raw_html, tag_set, file, **kw):
+            '''
+            same as `translate`, but the RTF stream is written into the file
+            while it is generated
+
+            @param file file name or file object (string/file)
+            '''
+            from .profiling import open_profiler, fingerprint
+            profiler, own_profiler, kw = open_profiler(kw, name='translate')
+            failed = True
+            try:
+                ret = self._translate_limited(raw_html, tag_set, file, **kw)
+                failed = False
+                return ret
+            finally:
+                if own_profiler:
+                    profiler.stop(
+                        lambda: fingerprint(raw_html, tag_set, kw.get('css_font_def', None)),
+                        kw.get('profile.report', None),
+                        failed=failed,
+                    )
+
+        def _translate_limited(self, raw_html, tag_set, file, **kw):
+            from .memory import open_tracker
+            from .limits import open_guard
+            tracker, own_tracker, kw = open_tracker(kw)
+            guard, kw = open_guard(kw)
+            try:
+                return self._stream_document(raw_html, tag_set, file, **kw)
+            finally:
+                if own_tracker:
+                    tracker.stop(kw.get('memory.report', None))
 
         def demo(self, **kw):
             '''
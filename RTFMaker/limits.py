@@ -0,0 +1,250 @@
+"""
+limits.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+resource limits for untrusted input, given as rendering options:
+
+    rtf = translator.translate(raw_html, tag_set, **{
+        'limit.input.bytes': 5 * 1024 * 1024,
+        'limit.dom.nodes': 200000,
+        'limit.depth': 200,
+        'limit.table.rows': 10000,
+        'limit.table.columns': 64,
+        'limit.elements': 50000,
+        'limit.output.bytes': 20 * 1024 * 1024,
+        'limit.deadline': 30,  # seconds
+    })
+
+each limit raises its own subclass of `LimitExceeded` as soon as it is
+exceeded.
+"""
+
+import time
+
+KEY_GUARD = 'limit.guard'
+KEY_STAGE_CALLBACK = 'callback.stage'
+
+
+class LimitExceeded(RuntimeError):
+    """a resource limit is exceeded"""
+
+    def __init__(self, name, limit, value):
+        """
+        @param name the option of the limit (string)
+        @param limit (number)
+        @param value the value found (number)
+        """
+        _msg = '{n} exceeded: {v} > {l}'.format(n=name, v=value, l=limit)
+        super(LimitExceeded, self).__init__(_msg)
+        self.name = name
+        self.limit = limit
+        self.value = value
+
+    def __reduce__(self):
+        # raised in the worker processes too;
+        return (self.__class__, (self.name, self.limit, self.value))
+
+
+class InputTooLarge(LimitExceeded):
+    pass
+
+
+class TooManyNodes(LimitExceeded):
+    pass
+
+
+class NestingTooDeep(LimitExceeded):
+    pass
+
+
+class TableTooLarge(LimitExceeded):
+    pass
+
+
+class TooManyElements(LimitExceeded):
+    pass
+
+
+class OutputTooLarge(LimitExceeded):
+    pass
+
+
+class DeadlineExceeded(LimitExceeded):
+    pass
+
+
+LIMIT_INPUT_BYTES = 'limit.input.bytes'
+LIMIT_DOM_NODES = 'limit.dom.nodes'
+LIMIT_DEPTH = 'limit.depth'
+LIMIT_TABLE_ROWS = 'limit.table.rows'
+LIMIT_TABLE_COLUMNS = 'limit.table.columns'
+LIMIT_ELEMENTS = 'limit.elements'
+LIMIT_OUTPUT_BYTES = 'limit.output.bytes'
+LIMIT_DEADLINE = 'limit.deadline'
+
+LIMIT_ERRORS = {
+    LIMIT_INPUT_BYTES: InputTooLarge,
+    LIMIT_DOM_NODES: TooManyNodes,
+    LIMIT_DEPTH: NestingTooDeep,
+    LIMIT_TABLE_ROWS: TableTooLarge,
+    LIMIT_TABLE_COLUMNS: TableTooLarge,
+    LIMIT_ELEMENTS: TooManyElements,
+    LIMIT_OUTPUT_BYTES: OutputTooLarge,
+    LIMIT_DEADLINE: DeadlineExceeded,
+}
+
+
+class Guard(object):
+    """the limits of one rendering, the deadline counts from its creation"""
+
+    # output written between two checks of the deadline, in bytes;
+    CHECK_INTERVAL = 65536
+
+    def __init__(self, limits, callback=None, **kwargs):
+        """
+        @param limits limit of each option, see `LIMIT_ERRORS` (dict)
+        @param callback the stage callback to call after the checks (callable)
+        """
+        from numbers import Real
+
+        self.limits = dict()
+        for a_name, a_limit in limits.items():
+            if a_name not in LIMIT_ERRORS:
+                _msg = 'unknown limit: {n}'.format(n=a_name)
+                raise ValueError(_msg)
+            if a_limit is None:
+                continue
+            if isinstance(a_limit, bool) or not isinstance(a_limit, Real) or a_limit <= 0:
+                _msg = 'invalid value for {n}: {v!r}'.format(n=a_name, v=a_limit)
+                raise ValueError(_msg)
+            self.limits[a_name] = a_limit
+        self._callback = callback if callable(callback) else None
+        self.started = time.time()
+        self._deadline_at = None
+        if LIMIT_DEADLINE in self.limits:
+            self._deadline_at = self.started + self.limits[LIMIT_DEADLINE]
+
+    def get(self, name):
+        return self.limits.get(name, None)
+
+    def check(self, name, value):
+        """
+        @param name the option of the limit (string)
+        @param value the amount found so far (number)
+        """
+        limit = self.limits.get(name, None)
+        if limit is not None and value > limit:
+            raise LIMIT_ERRORS[name](name, limit, value)
+
+    def check_deadline(self):
+        if self._deadline_at is not None and time.time() > self._deadline_at:
+            raise DeadlineExceeded(
+                LIMIT_DEADLINE, self.limits[LIMIT_DEADLINE], round(time.time() - self.started, 3)
+            )
+
+    def check_dom(self, dom):
+        """count the nodes and measure the nesting of the parsed page, without recursion
+
+        @param dom parsed page (`bs4.BeautifulSoup`)
+        """
+        node_limit = self.limits.get(LIMIT_DOM_NODES, None)
+        depth_limit = self.limits.get(LIMIT_DEPTH, None)
+        if node_limit is None and depth_limit is None:
+            return
+        depth_of = {id(dom): 0}
+        cnt_nodes = 0
+        for a_node in dom.descendants:
+            cnt_nodes += 1
+            if node_limit is not None and cnt_nodes > node_limit:
+                self.check(LIMIT_DOM_NODES, cnt_nodes)
+            if depth_limit is not None and getattr(a_node, 'name', None) is not None:
+                depth = depth_of.get(id(a_node.parent), 0) + 1
+                depth_of[id(a_node)] = depth
+                self.check(LIMIT_DEPTH, depth)
+            if cnt_nodes % 1024 == 0:
+                self.check_deadline()
+
+    def stage(self, name):
+        """drop-in `callback.stage`
+
+        @param name name of the stage about to start (string)
+        """
+        self.check_deadline()
+        if self._callback is not None:
+            self._callback(name)
+
+    def wrap(self, fout):
+        """
+        @param fout output stream
+
+        @return output stream that checks the output size and the deadline
+        """
+        if LIMIT_OUTPUT_BYTES not in self.limits and self._deadline_at is None:
+            return fout
+        return _LimitedOutput(fout, self)
+
+
+class _LimitedOutput(object):
+
+    def __init__(self, fout, guard):
+        self._fout = fout
+        self._guard = guard
+        self._size = 0
+        self._pending = 0
+
+    def write(self, data):
+        self._size += len(data)
+        self._guard.check(LIMIT_OUTPUT_BYTES, self._size)
+        self._fout.write(data)
+        self._pending += len(data)
+        if self._pending >= self._guard.CHECK_INTERVAL:
+            self._pending = 0
+            self._guard.check_deadline()
+
+    def flush(self):
+        if hasattr(self._fout, 'flush'):
+            self._fout.flush()
+
+
+def get_guard(kwargs):
+    """
+    @return the guard of the rendering, None when no limit is given
+    """
+    return kwargs.get(KEY_GUARD, None)
+
+
+def open_guard(kwargs):
+    """set up the limits given in the rendering options
+
+    @param kwargs rendering options (dict)
+
+    @return (guard or None, options to pass on, with the guard as the stage callback)
+    """
+    guard = kwargs.get(KEY_GUARD, None)
+    if guard is not None:
+        return (guard, kwargs)
+    limits = dict([ (k, v) for k, v in kwargs.items() if k in LIMIT_ERRORS ])
+    if len(limits) == 0:
+        return (None, kwargs)
+    guard = Guard(limits, callback=kwargs.get(KEY_STAGE_CALLBACK, None))
+    ret = dict(kwargs)
+    ret[KEY_GUARD] = guard
+    ret[KEY_STAGE_CALLBACK] = guard.stage
+    return (guard, ret)
+
+
+#--eof--#
@@ -0,0 +1,470 @@
+"""
+loadtest.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+load test replaying a corpus of jobs from many threads or processes at once:
+
+    python -m RTFMaker.loadtest -c config.json -m thread -n 8 -d 60 -o report.json corpus/
+    python -m RTFMaker.loadtest -c config.json -m process -n 4 -r 50 -d 60 corpus/ jobs.jsonl
+
+the corpus is made of HTML pages, translated with the 'tag_set' of the
+config file, and of jobs in the JSON format of `RTFMaker.server`, one per
+'.json' file (or a list of them) or one per line of a '.jsonl' file:
+
+    {"html": "...", "tag_set": [...], "options": {...}}
+    {"elements": [...], "options": {...}}
+
+without a rate (-r), every worker starts a new job as soon as the last one
+is done; with a rate, the jobs arrive at that pace whether the workers keep
+up or not, and the latency includes the wait. the JSON report has the
+throughput, the latency percentiles overall and by input size, the error
+counts and the resident size over time; its keys are sorted so that the
+reports of two versions can be diffed.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import sys
+import threading
+import time
+
+MODE_THREAD = 'thread'
+MODE_PROCESS = 'process'
+
+JOB_EXTENSIONS = ('.json', '.jsonl')
+
+# upper bound of the input size of each class, in bytes;
+SIZE_CLASSES = (
+    ('small', 16 * 1024),
+    ('medium', 256 * 1024),
+    ('large', None),
+)
+
+REPORT_VERSION = 1
+# length of the error messages counted apart;
+ERROR_MESSAGE_LENGTH = 200
+
+# the corpus of the worker process, as (kind, payload);
+_CORPUS = list()
+
+
+def _read_jobs(path):
+    """
+    @param path '.json' file of a job or of a list of jobs, or '.jsonl' file of a job per line (string)
+
+    @return list of the posted jobs (dict)
+    """
+    with open(path, 'r') as fh:
+        if path.lower().endswith('.jsonl'):
+            ret = [ json.loads(i) for i in fh if len(i.strip()) > 0 ]
+        else:
+            ret = json.load(fh)
+    if isinstance(ret, dict):
+        ret = [ ret ]
+    if not isinstance(ret, list):
+        _msg = 'invalid job file, a job or a list of jobs is expected: {p}'.format(p=path)
+        raise ValueError(_msg)
+    return ret
+
+
+def load_corpus(paths, config=None):
+    """
+    @param paths HTML pages, job files and directories of them (list)
+    @param config the config file, 'tag_set' is needed for the HTML pages (dict)
+
+    @return list of (name, kind, payload, input size)
+    """
+    from .__main__ import HTML_EXTENSIONS
+    from .server import JOB_TRANSLATE, JOB_RENDER, _check_job
+
+    files = list()
+    for a_path in paths:
+        if os.path.isdir(a_path):
+            for dir_path, dir_names, file_names in os.walk(a_path):
+                dir_names.sort()
+                for a_name in sorted(file_names):
+                    if os.path.splitext(a_name)[1].lower() in HTML_EXTENSIONS + JOB_EXTENSIONS:
+                        files.append(os.path.join(dir_path, a_name))
+        else:
+            files.append(a_path)
+
+    tag_set = (config or {}).get('tag_set', None)
+    ret = list()
+    for a_file in files:
+        if os.path.splitext(a_file)[1].lower() in JOB_EXTENSIONS:
+            for idx, a_job in enumerate(_read_jobs(a_file)):
+                kind = JOB_TRANSLATE if isinstance(a_job, dict) and 'html' in a_job else JOB_RENDER
+                _check_job(kind, a_job)
+                if kind == JOB_TRANSLATE:
+                    size = len(a_job['html'])
+                else:
+                    size = len(json.dumps(a_job['elements']))
+                ret.append(('{f}#{i}'.format(f=a_file, i=idx), kind, a_job, size))
+            continue
+        if not isinstance(tag_set, list):
+            _msg = "'tag_set' of the config file is required for the HTML pages: {p}".format(p=a_file)
+            raise ValueError(_msg)
+        with open(a_file, 'rb') as fh:
+            raw_html = fh.read()
+        ret.append((a_file, JOB_TRANSLATE, {'html': raw_html, 'tag_set': tag_set}, len(raw_html)))
+    if len(ret) == 0:
+        _msg = 'no job in the corpus'
+        raise ValueError(_msg)
+    return ret
+
+
+def _init_process(config, corpus):
+    from .server import _init_worker
+    _init_worker(config)
+    _CORPUS[:] = corpus
+
+
+def _timed_job(idx):
+    """
+    @param idx index of the job in the corpus (integer)
+
+    @return (index, start time, end time, output size, error message, process id, resident size)
+    """
+    from .server import _run_job
+    from .memory import _get_rss
+
+    started = time.time()
+    try:
+        output, error = _run_job(_CORPUS[idx])
+    except Exception as e:
+        output, error = (None, '{c}: {m}'.format(c=e.__class__.__name__, m=e))
+    finished = time.time()
+    return (idx, started, finished, len(output or b''), error, os.getpid(), _get_rss())
+
+
+def _get_size_class(size):
+    for a_name, a_limit in SIZE_CLASSES:
+        if a_limit is None or size <= a_limit:
+            return a_name
+    return SIZE_CLASSES[-1][0]
+
+
+def _get_percentiles(values):
+    """
+    @param values latencies in seconds (list)
+
+    @return count, mean and percentiles in milliseconds (dict)
+    """
+    from .server import _Stats
+
+    ordered = sorted(values)
+    ret = {
+        'count': len(ordered),
+        'min': None,
+        'mean': None,
+        'max': None,
+    }
+    for pct in (50, 95, 99):
+        ret['p{p}'.format(p=pct)] = _Stats._percentile(ordered, pct)
+    if len(ordered) > 0:
+        ret['min'] = round(ordered[0] * 1000.0, 3)
+        ret['mean'] = round(sum(ordered) / len(ordered) * 1000.0, 3)
+        ret['max'] = round(ordered[-1] * 1000.0, 3)
+    return ret
+
+
+class LoadTest(object):
+    """replay of the corpus, and the figures of the replay"""
+
+    def __init__(self, corpus, config=None, mode=MODE_THREAD, concurrency=1, rate=None,
+                 duration=None, requests=None, sample_interval=0.5, seed=0, **kwargs):
+        """
+        @param corpus the return value of `load_corpus` (list)
+        @param config the config file, 'css_font_def' and 'options' (dict)
+        @param mode run the jobs in threads of this process or in worker processes (string)
+        @param concurrency number of threads or processes (integer)
+        @param rate jobs started per second, as many as the workers take when omitted (number)
+        @param duration seconds during which jobs are started (number)
+        @param requests number of jobs to run, the size of the corpus when
+        neither it nor the duration is given (integer)
+        @param sample_interval seconds between two samples of the resident size (number)
+        @param seed of the order the corpus is replayed in (integer)
+        """
+        if mode not in (MODE_THREAD, MODE_PROCESS):
+            _msg = 'invalid mode: {m!r}'.format(m=mode)
+            raise ValueError(_msg)
+        if concurrency < 1:
+            _msg = 'invalid concurrency: {n!r}'.format(n=concurrency)
+            raise ValueError(_msg)
+        if rate is not None and rate <= 0:
+            _msg = 'invalid rate: {r!r}'.format(r=rate)
+            raise ValueError(_msg)
+        if requests is None and duration is None:
+            requests = len(corpus)
+        self.corpus = corpus
+        self.config = config or {}
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self.sample_interval = sample_interval
+        self.seed = seed
+        self._lock = threading.Lock()
+        # (time the job was submitted, the return value of `_timed_job`);
+        self._results = list()
+        # latest resident size of each worker process;
+        self._worker_rss = dict()
+        self._rss_samples = list()
+
+    def _iter_indexes(self):
+        """the corpus over and over, shuffled each time"""
+        import random
+        shuffler = random.Random(self.seed)
+        order = list(range(len(self.corpus)))
+        while True:
+            shuffler.shuffle(order)
+            for idx in order:
+                yield idx
+
+    def _current_rss(self):
+        from .memory import _get_rss
+        ret = _get_rss()
+        if self.mode == MODE_PROCESS:
+            with self._lock:
+                ret += sum(self._worker_rss.values())
+        return ret
+
+    def _sample_rss(self, started, stop_event):
+        while True:
+            self._rss_samples.append((round(time.time() - started, 3), self._current_rss()))
+            if stop_event.wait(self.sample_interval):
+                break
+        self._rss_samples.append((round(time.time() - started, 3), self._current_rss()))
+
+    def _open_pool(self):
+        from .__main__ import _prepare_worker
+        from .server import _get_worker_config
+
+        config = _get_worker_config(self.config)
+        corpus = [ (i[1], i[2]) for i in self.corpus ]
+        # an invalid config fails here, not in each of the workers; and
+        # one translator is shared by all the threads, as in a threaded server;
+        _prepare_worker(config)
+        _CORPUS[:] = corpus
+        if self.mode == MODE_PROCESS:
+            import multiprocessing
+            return multiprocessing.Pool(self.concurrency, _init_process, (config, corpus))
+        from multiprocessing.pool import ThreadPool
+        return ThreadPool(self.concurrency)
+
+    def run(self):
+        """
+        @return the report (dict)
+        """
+        pool = self._open_pool()
+        # closed loop: no more jobs in flight than workers;
+        slots = threading.Semaphore(self.concurrency) if self.rate is None else None
+
+        def _done():
+            if slots is not None:
+                slots.release()
+
+        stop_event = threading.Event()
+        started = time.time()
+        sampler = threading.Thread(target=self._sample_rss, args=(started, stop_event))
+        sampler.daemon = True
+        sampler.start()
+        cnt = 0
+        try:
+            for idx in self._iter_indexes():
+                if self.requests is not None and cnt >= self.requests:
+                    break
+                if self.rate is not None:
+                    due = started + cnt / float(self.rate)
+                    time.sleep(max(due - time.time(), 0))
+                else:
+                    slots.acquire()
+                if self.duration is not None and time.time() - started >= self.duration:
+                    if slots is not None:
+                        slots.release()
+                    break
+                submitted = time.time()
+                pool.apply_async(_timed_job, (idx,), callback=self._make_callback(submitted, _done))
+                cnt += 1
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+            stop_event.set()
+            sampler.join()
+        return self._build_report(started, time.time(), cnt)
+
+    def _make_callback(self, submitted, done):
+        """
+        @param submitted time the job is submitted (float)
+        @param done called once the result is recorded (callable)
+        """
+        def _callback(result):
+            with self._lock:
+                self._results.append((submitted, result))
+                self._worker_rss[result[5]] = result[6]
+            done()
+        return _callback
+
+    def _build_report(self, started, finished, submitted):
+        import platform
+        from . import __version__
+
+        elapsed = max(finished - started, 1e-6)
+        latency = list()
+        service = list()
+        by_class = dict()
+        errors = dict()
+        bytes_in = 0
+        bytes_out = 0
+        for t_submit, (idx, t_start, t_end, out_size, error, pid, rss) in self._results:
+            if error is not None:
+                a_key = error[:ERROR_MESSAGE_LENGTH]
+                errors[a_key] = errors.get(a_key, 0) + 1
+                continue
+            size = self.corpus[idx][3]
+            bytes_in += size
+            bytes_out += out_size
+            latency.append(t_end - t_submit)
+            service.append(t_end - t_start)
+            by_class.setdefault(_get_size_class(size), list()).append(t_end - t_submit)
+
+        rss = [ i[1] for i in self._rss_samples ]
+        completed = len(latency)
+        ret = {
+            'version': REPORT_VERSION,
+            'rtfmaker': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {
+                'mode': self.mode,
+                'concurrency': self.concurrency,
+                'rate': self.rate,
+                'duration': self.duration,
+                'requests': self.requests,
+                'seed': self.seed,
+                'corpus.jobs': len(self.corpus),
+                'corpus.bytes': sum([ i[3] for i in self.corpus ]),
+            },
+            'elapsed': round(elapsed, 3),
+            'jobs': {
+                'submitted': submitted,
+                'completed': completed,
+                'failed': sum(errors.values()),
+            },
+            'errors': errors,
+            'throughput': {
+                'jobs.per.second': round(completed / elapsed, 3),
+                'bytes.in.per.second': round(bytes_in / elapsed, 1),
+                'bytes.out.per.second': round(bytes_out / elapsed, 1),
+            },
+            'latency.ms': _get_percentiles(latency),
+            'service.ms': _get_percentiles(service),
+            'latency.ms.by.size': dict([ (k, _get_percentiles(v)) for k, v in by_class.items() ]),
+            'rss': {
+                'start': rss[0] if rss else None,
+                'end': rss[-1] if rss else None,
+                'peak': max(rss) if rss else None,
+                'growth': (rss[-1] - rss[0]) if rss else None,
+                'samples': [ list(i) for i in self._rss_samples ],
+            },
+        }
+        return ret
+
+
+def _print_summary(report, out=sys.stdout):
+    latency = report['latency.ms']
+    print(
+        '{c} completed, {f} failed in {t:.2f}s ({m} x{n}): {jps:.1f} jobs/s, '
+        'latency p50 {p50} ms, p95 {p95} ms, p99 {p99} ms, rss growth {g:.1f} MB'.format(
+            c=report['jobs']['completed'],
+            f=report['jobs']['failed'],
+            t=report['elapsed'],
+            m=report['settings']['mode'],
+            n=report['settings']['concurrency'],
+            jps=report['throughput']['jobs.per.second'],
+            p50=latency['p50'],
+            p95=latency['p95'],
+            p99=latency['p99'],
+            g=(report['rss']['growth'] or 0) / (1024.0 * 1024.0),
+        ),
+        file=out,
+    )
+    for a_error, a_count in sorted(report['errors'].items()):
+        print('error x{n}: {e}'.format(n=a_count, e=a_error), file=out)
+
+
+def main(argv=None):
+    import argparse
+    from .__main__ import CONFIG_ERRORS, _config_error, _load_config
+
+    parser = argparse.ArgumentParser(
+        prog='python -m RTFMaker.loadtest',
+        description='replay a corpus of jobs concurrently and report throughput, latency and memory',
+    )
+    parser.add_argument('inputs', nargs='+', help='HTML pages, JSON job files or directories of them')
+    parser.add_argument('-c', '--config', default=None, help='JSON or YAML file with tag_set, css_font_def and options')
+    parser.add_argument('-m', '--mode', choices=(MODE_THREAD, MODE_PROCESS), default=MODE_THREAD,
+                        help='run the jobs in threads or in worker processes')
+    parser.add_argument('-n', '--concurrency', type=int, default=1, help='number of threads or processes')
+    parser.add_argument('-r', '--rate', type=float, default=None, help='jobs started per second')
+    parser.add_argument('-d', '--duration', type=float, default=None, help='seconds during which jobs are started')
+    parser.add_argument('-N', '--requests', type=int, default=None, help='number of jobs to run')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between two samples of the resident size')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the order of the jobs')
+    parser.add_argument('-o', '--output', default=None, help='file of the JSON report, - for the standard output')
+    args = parser.parse_args(argv)
+
+    config = dict()
+    if args.config is not None:
+        try:
+            config = _load_config(args.config, **{'tag_set.required': False})
+        except CONFIG_ERRORS as e:
+            return _config_error(args.config, e)
+    corpus = load_corpus(args.inputs, config)
+    test = LoadTest(
+        corpus,
+        config=config,
+        mode=args.mode,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        duration=args.duration,
+        requests=args.requests,
+        sample_interval=args.interval,
+        seed=args.seed,
+    )
+    report = test.run()
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+        _print_summary(report, out=sys.stderr)
+    else:
+        if args.output is not None:
+            with open(args.output, 'w') as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
+        _print_summary(report)
+    return 1 if report['jobs']['failed'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+#--eof--#
@@ -0,0 +1,286 @@
+"""
+memory.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+opt-in memory accounting of the rendering stages, for example:
+
+    report = dict()
+    rtf = translator.translate(raw_html, tag_set, **{
+        'memory.report': report,
+        'memory.budget': 512 * 1024 * 1024,
+    })
+    # report['peak'] = {'parse': ..., 'extract': ..., 'write': ...}
+
+the figures come from `tracemalloc` when it is available (Python 3), from
+the resident size of the process otherwise.
+
+the budget is checked at each stage boundary and after every megabyte of
+output, `MemoryBudgetError` is raised at the first check that finds more
+memory in use; with the resident size, the budget is compared with the
+memory of the whole process, not only the one of this rendering.
+
+both are figures of the whole process: renderings tracked at the same time
+(threads of a server, executor jobs) share the tracing, which stops with the
+last of them; the peaks of a rendering that overlapped with another one are
+taken at the stage boundaries and at the budget checks, they include the
+memory of the other renderings, and the report says 'concurrent'.
+"""
+
+import os
+import sys
+import threading
+
+KEY_REPORT = 'memory.report'
+KEY_BUDGET = 'memory.budget'
+KEY_TRACKER = 'memory.tracker'
+KEY_STAGE_CALLBACK = 'callback.stage'
+
+# trackers using `tracemalloc`, the number of them started so far, and
+# whether one of them started the tracing;
+_TRACING_LOCK = threading.Lock()
+_TRACING = {'trackers': 0, 'starts': 0, 'started': False}
+
+
+class MemoryBudgetError(MemoryError):
+    """the rendering does not fit in the memory budget"""
+    pass
+
+
+def _get_rss():
+    """
+    @return resident size of the process in bytes, the peak one when the
+    current one is not available (integer)
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere;
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryTracker(object):
+    """peak memory of each rendering stage, and the check of the budget
+
+    the `stage` method is a drop-in `callback.stage`, the callback it
+    replaces is still called.
+    """
+
+    METHOD_TRACEMALLOC = 'tracemalloc'
+    METHOD_RSS = 'rss'
+
+    # output written between two checks of the budget, in bytes;
+    CHECK_INTERVAL = 1024 * 1024
+
+    def __init__(self, budget=None, callback=None, **kwargs):
+        """
+        @param budget memory allowed for the rendering in bytes, no limit when omitted (integer)
+        @param callback the stage callback to call after the accounting (callable)
+        """
+        from numbers import Integral
+        if budget is not None and (not isinstance(budget, Integral) or budget <= 0):
+            _msg = 'invalid memory budget: {b!r}'.format(b=budget)
+            raise ValueError(_msg)
+        self.budget = budget
+        self._callback = callback if callable(callback) else None
+        self._tracemalloc = None
+        self._tracing = False
+        self._starts = 0
+        self._stage = None
+        self.concurrent = False
+        self._stage_peak = 0
+        self.peaks = dict()
+        self.stages = list()
+
+    @property
+    def method(self):
+        return self.METHOD_TRACEMALLOC if self._tracemalloc is not None else self.METHOD_RSS
+
+    def start(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+        if tracemalloc is not None:
+            with _TRACING_LOCK:
+                if _TRACING['trackers'] == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _TRACING['started'] = True
+                _TRACING['trackers'] += 1
+                _TRACING['starts'] += 1
+                self._tracemalloc = tracemalloc
+                self._tracing = True
+                self._starts = _TRACING['starts']
+                self._reset_peak()
+        self._stage_peak = self.current()
+        return self
+
+    def _reset_peak(self):
+        """start a new peak, only when no other tracker is running: the
+        peak of `tracemalloc` is the one of the process
+
+        @note called with `_TRACING_LOCK` held
+
+        @return whether the peak of `tracemalloc` is the one of this tracker (boolean)
+        """
+        if _TRACING['trackers'] > 1 or _TRACING['starts'] != self._starts:
+            # another tracker is running, or ran since the last reset;
+            self.concurrent = True
+        if self.concurrent:
+            return False
+        reset_peak = getattr(self._tracemalloc, 'reset_peak', None)
+        if reset_peak is not None:
+            reset_peak()
+        return True
+
+    def current(self):
+        """
+        @return memory in use now, in bytes (integer)
+        """
+        if self._tracemalloc is not None:
+            return self._tracemalloc.get_traced_memory()[0]
+        return _get_rss()
+
+    def _close_stage(self):
+        if self._tracemalloc is not None:
+            with _TRACING_LOCK:
+                current, peak = self._tracemalloc.get_traced_memory()
+                if not self._reset_peak():
+                    peak = max(self._stage_peak, current)
+        else:
+            peak = max(self._stage_peak, self.current())
+        if self._stage is not None:
+            self.peaks[self._stage] = max(self.peaks.get(self._stage, 0), peak)
+        self._stage_peak = self.current()
+
+    def stage(self, name):
+        """account the stage that ends, check the budget, then start the new one
+
+        @param name name of the stage about to start (string)
+        """
+        self._close_stage()
+        self._stage = name
+        if name not in self.stages:
+            self.stages.append(name)
+        self.check()
+        if self._callback is not None:
+            self._callback(name)
+
+    def over_budget(self):
+        """
+        @return whether the memory in use exceeds the budget (boolean)
+        """
+        if self.budget is None:
+            return False
+        usage = self.current()
+        self._stage_peak = max(self._stage_peak, usage)
+        return usage > self.budget
+
+    def check(self):
+        """raise `MemoryBudgetError` when the memory in use exceeds the budget"""
+        if self.over_budget():
+            _msg = 'memory budget of {b} bytes exceeded at stage {s!r}: {u} bytes in use'.format(
+                b=self.budget,
+                s=self._stage,
+                u=self.current(),
+            )
+            raise MemoryBudgetError(_msg)
+
+    def wrap(self, fout):
+        """
+        @param fout output stream
+
+        @return output stream that checks the budget while it is written
+        """
+        if self.budget is None:
+            return fout
+        return _BudgetedOutput(fout, self)
+
+    def stop(self, report=None):
+        """close the last stage and stop tracing
+
+        @param report filled with the 'method', the 'peak' of each stage, the
+        overall 'peak.total', the 'budget', and whether other renderings
+        were tracked at the same time ('concurrent') (dict)
+        """
+        self._close_stage()
+        self._stage = None
+        if self._tracing:
+            with _TRACING_LOCK:
+                _TRACING['trackers'] -= 1
+                if _TRACING['trackers'] == 0 and _TRACING['started']:
+                    self._tracemalloc.stop()
+                    _TRACING['started'] = False
+            self._tracing = False
+        if isinstance(report, dict):
+            report['method'] = self.method
+            report['budget'] = self.budget
+            report['stages'] = list(self.stages)
+            report['peak'] = dict(self.peaks)
+            report['peak.total'] = max(self.peaks.values()) if self.peaks else 0
+            report['concurrent'] = self.concurrent
+
+
+class _BudgetedOutput(object):
+
+    def __init__(self, fout, tracker):
+        self._fout = fout
+        self._tracker = tracker
+        self._pending = 0
+
+    def write(self, data):
+        self._fout.write(data)
+        self._pending += len(data)
+        if self._pending >= self._tracker.CHECK_INTERVAL:
+            self._pending = 0
+            self._tracker.check()
+
+    def flush(self):
+        if hasattr(self._fout, 'flush'):
+            self._fout.flush()
+
+
+def open_tracker(kwargs):
+    """set up the memory tracking asked for by the rendering options
+
+    @param kwargs rendering options, with `memory.report` and/or `memory.budget` (dict)
+
+    @return (tracker or None, whether the caller has to stop it, options to
+    pass on, with the tracker as the stage callback)
+    """
+    tracker = kwargs.get(KEY_TRACKER, None)
+    if tracker is not None:
+        return (tracker, False, kwargs)
+    report = kwargs.get(KEY_REPORT, None)
+    budget = kwargs.get(KEY_BUDGET, None)
+    if report is None and budget is None:
+        return (None, False, kwargs)
+    tracker = MemoryTracker(budget=budget, callback=kwargs.get(KEY_STAGE_CALLBACK, None)).start()
+    ret = dict(kwargs)
+    ret[KEY_TRACKER] = tracker
+    ret[KEY_STAGE_CALLBACK] = tracker.stage
+    return (tracker, True, ret)
+
+
+#--eof--#
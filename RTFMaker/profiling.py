@@ -0,0 +1,215 @@
+"""
+profiling.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+opt-in profiling of the slow renderings, for example:
+
+    rtf = translator.translate(raw_html, tag_set, **{
+        'profile.threshold': 2.0,  # seconds
+        'profile.dir': '/var/tmp/rtf-profiles',
+    })
+
+or, without touching the code, with the environment variables
+RTFMAKER_PROFILE_THRESHOLD and RTFMAKER_PROFILE_DIR; the options win over
+the environment.
+
+each rendering runs under `cProfile`, and only the ones that take longer
+than the threshold are kept: `<name>.prof`, the `pstats` dump, and
+`<name>.json`, with the SHA-1 fingerprint of the input and the duration.
+"""
+
+import os
+import time
+
+KEY_THRESHOLD = 'profile.threshold'
+KEY_DIR = 'profile.dir'
+KEY_REPORT = 'profile.report'
+KEY_PROFILER = 'profile.profiler'
+
+ENV_THRESHOLD = 'RTFMAKER_PROFILE_THRESHOLD'
+ENV_DIR = 'RTFMAKER_PROFILE_DIR'
+
+
+def _feed(digest, part):
+    """add the part to the digest, the same content always gives the same bytes"""
+    from .compat import unicode, basestring
+
+    if part is None or isinstance(part, (bool, int, float)):
+        digest.update(repr(part).encode('ascii'))
+    elif isinstance(part, bytes):
+        digest.update(('b{n}:'.format(n=len(part))).encode('ascii'))
+        digest.update(part)
+    elif isinstance(part, (basestring, unicode)):
+        data = part.encode('utf-8')
+        digest.update(('u{n}:'.format(n=len(data))).encode('ascii'))
+        digest.update(data)
+    elif isinstance(part, dict):
+        digest.update(('d{n}:'.format(n=len(part))).encode('ascii'))
+        for a_key in sorted(part.keys(), key=repr):
+            _feed(digest, a_key)
+            _feed(digest, part[a_key])
+    elif isinstance(part, (list, tuple)):
+        digest.update(('l{n}:'.format(n=len(part))).encode('ascii'))
+        for a_item in part:
+            _feed(digest, a_item)
+    else:
+        slots = list()
+        for a_cls in type(part).__mro__:
+            slots.extend(getattr(a_cls, '__slots__', ()))
+        if not slots:
+            _feed(digest, repr(part))
+            return
+        _feed(digest, type(part).__name__)
+        for a_slot in slots:
+            _feed(digest, getattr(part, a_slot, None))
+
+
+def fingerprint(*parts):
+    """
+    @param parts strings, bytes, numbers, and the dicts, lists and elements of them
+
+    @return SHA-1 of the parts (hex string)
+    """
+    import hashlib
+    digest = hashlib.sha1()
+    for a_part in parts:
+        _feed(digest, a_part)
+    return digest.hexdigest()
+
+
+class RenderProfiler(object):
+    """profile of one rendering, kept only when it is slow"""
+
+    def __init__(self, threshold, directory=None, name='render', **kwargs):
+        """
+        @param threshold duration from which the profile is kept, in seconds (number)
+        @param directory where the profiles are written, the temporary folder when omitted (string)
+        @param name what is profiled, the start of the file names (string)
+        """
+        from numbers import Real
+        if isinstance(threshold, bool) or not isinstance(threshold, Real) or threshold < 0:
+            _msg = 'invalid profile threshold: {t!r}'.format(t=threshold)
+            raise ValueError(_msg)
+        if directory is None:
+            import tempfile
+            directory = tempfile.gettempdir()
+        self.threshold = threshold
+        self.directory = directory
+        self.name = name
+        self._profile = None
+        self.started = None
+
+    def start(self):
+        import cProfile
+        self.started = time.time()
+        try:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        except ValueError:
+            # another profiler is running in this thread;
+            self._profile = None
+        return self
+
+    def _dump(self, elapsed, fingerprint, failed):
+        """
+        @return path of the `pstats` dump (string)
+        """
+        import json
+
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))
+        base_name = '{n}-{s}-{p}-{f}'.format(
+            n=self.name,
+            s=stamp,
+            p=os.getpid(),
+            f=(fingerprint or 'unknown')[:12],
+        )
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        ret = os.path.join(self.directory, base_name + '.prof')
+        self._profile.dump_stats(ret)
+        info = {
+            'name': self.name,
+            'fingerprint': fingerprint,
+            'started': self.started,
+            'elapsed': elapsed,
+            'threshold': self.threshold,
+            'failed': failed,
+            'pid': os.getpid(),
+        }
+        with open(os.path.join(self.directory, base_name + '.json'), 'w') as fh:
+            json.dump(info, fh, indent=2, sort_keys=True)
+        return ret
+
+    def stop(self, fingerprint=None, report=None, failed=False):
+        """stop profiling, and keep the profile when the rendering was slow
+
+        @param fingerprint called for the fingerprint of the input, only
+        when the profile is kept (callable)
+        @param report filled with the 'elapsed' seconds, and the 'path' of
+        the profile when it is kept (dict)
+        @param failed whether the rendering raised an exception (boolean)
+
+        @return path of the profile, None when it is not kept (string)
+        """
+        elapsed = time.time() - self.started
+        if self._profile is not None:
+            self._profile.disable()
+        ret = None
+        if self._profile is not None and elapsed >= self.threshold:
+            digest = fingerprint() if callable(fingerprint) else None
+            try:
+                ret = self._dump(elapsed, digest, failed)
+            except (IOError, OSError) as e:
+                import warnings
+                _msg = 'profile of a slow rendering not written: {e}'.format(e=e)
+                warnings.warn(_msg, RuntimeWarning)
+        self._profile = None
+        if isinstance(report, dict):
+            report['elapsed'] = elapsed
+            report['path'] = ret
+        return ret
+
+
+def open_profiler(kwargs, name='render'):
+    """set up the profiling asked for by the rendering options or by the
+    environment, a rendering inside of a profiled one is not profiled again
+
+    @param kwargs rendering options (dict)
+    @param name what is profiled (string)
+
+    @return (profiler or None, whether the caller has to stop it, options to pass on)
+    """
+    if kwargs.get(KEY_PROFILER, None) is not None:
+        return (kwargs[KEY_PROFILER], False, kwargs)
+    threshold = kwargs.get(KEY_THRESHOLD, None)
+    if threshold is None:
+        env_threshold = os.environ.get(ENV_THRESHOLD, '').strip()
+        if len(env_threshold) == 0:
+            return (None, False, kwargs)
+        try:
+            threshold = float(env_threshold)
+        except ValueError:
+            _msg = 'invalid value of {e}: {v!r}'.format(e=ENV_THRESHOLD, v=env_threshold)
+            raise ValueError(_msg)
+    directory = kwargs.get(KEY_DIR, None) or os.environ.get(ENV_DIR, None) or None
+    profiler = RenderProfiler(threshold, directory=directory, name=name).start()
+    ret = dict(kwargs)
+    ret[KEY_PROFILER] = profiler
+    return (profiler, True, ret)
+
+
+#--eof--#
@@ -0,0 +1,622 @@
+"""
+server.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+long-lived render daemon, the worker processes are forked once and keep
+the translator, the compiled stylesheet and the font caches warm:
+
+    python -m RTFMaker.server -c config.json -j 4 --socket /tmp/rtfmaker.sock
+    python -m RTFMaker.server -c config.json -j 4 --port 8765
+
+the config file is the one of the batch converter, without 'tag_set';
+the jobs are posted in JSON:
+
+    POST /translate  {"html": "...", "tag_set": [...], "options": {...}}
+    POST /render     {"elements": [...], "options": {...}}
+    GET  /stats
+
+a job is answered with the RTF stream, the statistics (queue depth,
+latency percentiles) in JSON; `RenderClient` talks to the daemon, and
+renders in its own process when the daemon can not be reached.
+
+the image files are read from 'image.root' of the config options, the
+current folder of the daemon by default; a job can not change it.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import TCPServer, ThreadingMixIn
+    import httplib
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import TCPServer, ThreadingMixIn
+    import http.client as httplib
+
+from .compat import unicode, basestring
+
+JOB_TRANSLATE = 'translate'
+JOB_RENDER = 'render'
+
+CONTENT_TYPE_RTF = 'application/rtf'
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_TEXT = 'text/plain; charset=utf-8'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_JOB_TIMEOUT = 300
+
+# number of the latest jobs the latency percentiles are computed from;
+LATENCY_WINDOW = 1000
+
+# options holding objects of the worker, or reaching the files and the
+# processes of the daemon, a job can not give them;
+RESERVED_OPTIONS = (
+    'stylesheet', 'css_font_def', 'callback.stage', 'memory.tracker', 'limit.guard',
+    'image.root', 'parallel.jobs',
+    'profile.dir', 'profile.threshold', 'profile.profiler',
+)
+
+# resource limits, a job can lower the ones set in the config of the daemon
+# but can not raise or remove them;
+CAPPED_OPTIONS = (
+    'limit.input.bytes', 'limit.dom.nodes', 'limit.depth', 'limit.table.rows',
+    'limit.table.columns', 'limit.elements', 'limit.output.bytes', 'limit.deadline',
+    'memory.budget',
+)
+
+
+# queue the worker process reports the jobs it starts into;
+_STARTED = dict()
+
+
+def _get_worker_config(config):
+    """
+    @param config 'css_font_def' and 'options' (dict)
+
+    @return the config of the workers, with the image folder set (dict)
+    """
+    ret = dict(config or {})
+    options = dict(ret.get('options', None) or {})
+    options['image.root'] = os.path.realpath(options.get('image.root', None) or os.curdir)
+    ret['options'] = options
+    return ret
+
+
+def _init_worker(config, started=None):
+    """the worker process is the one of the batch converter
+
+    @param config the return value of `_get_worker_config` (dict)
+    @param started queue of (job number, process id) of the jobs as they
+    start, for the daemon to stop the ones that time out (`multiprocessing.Queue`)
+    """
+    from .__main__ import _init_worker as _init_batch_worker
+    _init_batch_worker(config)
+    _STARTED['queue'] = started
+
+
+def _get_ceilings(config):
+    """
+    @param config the return value of `_get_worker_config` (dict)
+
+    @return the capped options set in the config (dict)
+    """
+    options = config.get('options', None) or {}
+    return dict([ (k, options[k]) for k in CAPPED_OPTIONS if options.get(k, None) is not None ])
+
+
+def _check_job(kind, payload, ceilings=None):
+    """
+    @param kind `JOB_TRANSLATE` or `JOB_RENDER` (string)
+    @param payload the posted job (dict)
+    @param ceilings the return value of `_get_ceilings` (dict)
+    """
+    from numbers import Real
+
+    if not isinstance(payload, dict):
+        _msg = 'invalid job, a JSON object is expected'
+        raise ValueError(_msg)
+    if kind == JOB_TRANSLATE:
+        if not isinstance(payload.get('html', None), (basestring, unicode)):
+            _msg = "invalid job, 'html' (string) is required"
+            raise ValueError(_msg)
+        if not isinstance(payload.get('tag_set', None), list):
+            _msg = "invalid job, 'tag_set' (list) is required"
+            raise ValueError(_msg)
+    elif kind == JOB_RENDER:
+        if not isinstance(payload.get('elements', None), list):
+            _msg = "invalid job, 'elements' (list) is required"
+            raise ValueError(_msg)
+    else:
+        _msg = 'unknown job type: {k!r}'.format(k=kind)
+        raise ValueError(_msg)
+    options = payload.get('options', None) or {}
+    if not isinstance(options, dict):
+        _msg = "invalid job, 'options' has to be a JSON object"
+        raise ValueError(_msg)
+    for a_key in options:
+        if a_key in RESERVED_OPTIONS:
+            _msg = 'option not allowed: {k}'.format(k=a_key)
+            raise ValueError(_msg)
+        ceiling = (ceilings or {}).get(a_key, None)
+        if ceiling is None:
+            continue
+        value = options[a_key]
+        if isinstance(value, bool) or not isinstance(value, Real) or value > ceiling:
+            _msg = 'invalid value for {k}: {v!r}, the daemon allows at most {c!r}'.format(k=a_key, v=value, c=ceiling)
+            raise ValueError(_msg)
+
+
+def _run_job(job):
+    """
+    @param job (kind, payload)
+
+    @return (RTF stream (bytes), error message)
+    """
+    from .__main__ import _get_worker
+
+    kind, payload = job
+    try:
+        worker = _get_worker()
+        options = dict(worker['options'])
+        options.update(payload.get('options', None) or {})
+        if kind == JOB_TRANSLATE:
+            ret = worker['translator'].translate(payload['html'], payload['tag_set'], **options)
+        else:
+            from . import RTFDocument
+            doc = RTFDocument(**options)
+            for an_element in payload['elements']:
+                doc.append(an_element, **options)
+            ret = doc.to_string(**options)
+        if not isinstance(ret, bytes):
+            ret = ret.encode('utf-8')
+        return (ret, None)
+    except Exception as e:
+        return (None, '{c}: {m}'.format(c=e.__class__.__name__, m=e))
+
+
+def _run_server_job(job_id, job, expires=None):
+    """run the job of the daemon, once its start is reported
+
+    @param job_id number of the job in the daemon (integer)
+    @param job (kind, payload)
+    @param expires time the daemon stops waiting for the job, a job still
+    queued then is dropped (float)
+    """
+    if expires is not None and time.time() >= expires:
+        # the client has been answered already;
+        return (None, 'job timed out in the queue')
+    started = _STARTED.get('queue', None)
+    if started is not None:
+        started.put((job_id, os.getpid()))
+    return _run_job(job)
+
+
+class _Stats(object):
+    """job counters and latency of the daemon"""
+
+    def __init__(self, workers):
+        from collections import deque
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=LATENCY_WINDOW)
+        self.workers = workers
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.started = time.time()
+
+    def begin(self):
+        with self._lock:
+            self.pending += 1
+
+    def end(self, elapsed, success, timed_out=False):
+        with self._lock:
+            self.pending -= 1
+            if success:
+                self.completed += 1
+                self._latency.append(elapsed)
+            else:
+                self.failed += 1
+            if timed_out:
+                self.timed_out += 1
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        if len(ordered) == 0:
+            return None
+        import math
+        idx = max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)
+        return round(ordered[idx] * 1000.0, 3)
+
+    def get(self):
+        """
+        @return the statistics, the latencies in milliseconds (dict)
+        """
+        with self._lock:
+            ordered = sorted(self._latency)
+            ret = {
+                'workers': self.workers,
+                'jobs.pending': self.pending,
+                'queue.depth': max(self.pending - self.workers, 0),
+                'jobs.completed': self.completed,
+                'jobs.failed': self.failed,
+                'jobs.timed.out': self.timed_out,
+                'latency.samples': len(ordered),
+                'latency.p50': self._percentile(ordered, 50),
+                'latency.p99': self._percentile(ordered, 99),
+                'uptime': round(time.time() - self.started, 3),
+            }
+        return ret
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def address_string(self):
+        if not isinstance(self.client_address, tuple):
+            # unix socket;
+            return 'local'
+        return BaseHTTPRequestHandler.address_string(self)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _reply(self, code, body, content_type):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/stats':
+            return self._reply(404, 'not found', CONTENT_TYPE_TEXT)
+        self._reply(200, json.dumps(self.server.stats.get(), sort_keys=True), CONTENT_TYPE_JSON)
+
+    def do_POST(self):
+        kind = self.path.strip('/')
+        if kind not in (JOB_TRANSLATE, JOB_RENDER):
+            return self._reply(404, 'not found', CONTENT_TYPE_TEXT)
+        try:
+            size = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(size).decode('utf-8'))
+            _check_job(kind, payload, self.server.ceilings)
+        except ValueError as e:
+            return self._reply(400, str(e), CONTENT_TYPE_TEXT)
+        import multiprocessing
+        try:
+            data, error = self.server.submit(kind, payload)
+        except multiprocessing.TimeoutError:
+            _msg = 'job timed out after {t} seconds'.format(t=self.server.job_timeout)
+            return self._reply(504, _msg, CONTENT_TYPE_TEXT)
+        except Exception as e:
+            return self._reply(503, '{c}: {m}'.format(c=e.__class__.__name__, m=e), CONTENT_TYPE_TEXT)
+        if error is not None:
+            return self._reply(500, error, CONTENT_TYPE_TEXT)
+        self._reply(200, data, CONTENT_TYPE_RTF)
+
+
+class RenderServer(ThreadingMixIn, HTTPServer):
+    """HTTP server on a local TCP port or a unix socket, with a pool of
+    worker processes forked before the first request
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, config=None, jobs=1, job_timeout=DEFAULT_JOB_TIMEOUT, quiet=False):
+        """
+        @param address unix socket path (string) or (host, port)
+        @param config 'css_font_def' and 'options' of the workers (dict)
+        @param jobs number of worker processes (integer)
+        @param job_timeout seconds a job can take, the worker running a job
+        that takes longer is stopped and replaced (integer)
+        @param quiet whether to leave out the request log (boolean)
+        """
+        import multiprocessing
+        from .__main__ import _prepare_worker
+
+        if jobs < 1:
+            _msg = 'invalid number of workers: {j!r}'.format(j=jobs)
+            raise ValueError(_msg)
+        self.quiet = quiet
+        self.job_timeout = job_timeout
+        self.stats = _Stats(jobs)
+        self._socket_path = None
+        self._job_lock = threading.Lock()
+        self._job_count = 0
+        # job number -> process id of the worker running it, for the jobs
+        # the daemon waits for;
+        self._job_pids = dict()
+        self._job_waiting = set()
+        config = _get_worker_config(config)
+        self.ceilings = _get_ceilings(config)
+        # an invalid config fails here, not in each of the workers;
+        _prepare_worker(config)
+        if not isinstance(address, tuple):
+            self.address_family = socket.AF_UNIX
+            self._socket_path = address
+            if os.path.exists(address):
+                # left over by a daemon that was killed;
+                os.remove(address)
+        self._started = multiprocessing.Queue()
+        # fork the workers before any thread is started;
+        self._pool = multiprocessing.Pool(jobs, _init_worker, (config, self._started))
+        try:
+            HTTPServer.__init__(self, address, _RequestHandler)
+        except Exception:
+            self._pool.terminate()
+            raise
+
+    def server_bind(self):
+        if self.address_family != socket.AF_UNIX:
+            return HTTPServer.server_bind(self)
+        TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def _pop_job_pid(self, job_id):
+        """
+        @return process id of the worker that started the job, None when
+        it has not started (integer)
+        """
+        try:
+            from Queue import Empty
+        except ImportError:
+            from queue import Empty
+        with self._job_lock:
+            while True:
+                try:
+                    a_job_id, a_pid = self._started.get_nowait()
+                except Empty:
+                    break
+                if a_job_id in self._job_waiting:
+                    self._job_pids[a_job_id] = a_pid
+            self._job_waiting.discard(job_id)
+            return self._job_pids.pop(job_id, None)
+
+    def _stop_worker(self, job_id):
+        """stop the worker running the job, the pool starts another one"""
+        import signal
+        pid = self._pop_job_pid(job_id)
+        if pid is None:
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            # the job ended in the meantime;
+            pass
+
+    def submit(self, kind, payload):
+        """run the job in a worker process
+
+        @return (RTF stream (bytes), error message)
+        """
+        import multiprocessing
+
+        with self._job_lock:
+            self._job_count += 1
+            job_id = self._job_count
+            self._job_waiting.add(job_id)
+        self.stats.begin()
+        time_start = time.time()
+        ret = (None, None)
+        timed_out = False
+        try:
+            result = self._pool.apply_async(
+                _run_server_job, (job_id, (kind, payload), time_start + self.job_timeout),
+            )
+            try:
+                ret = result.get(self.job_timeout)
+            except multiprocessing.TimeoutError:
+                timed_out = True
+                self._stop_worker(job_id)
+                raise
+            self._pop_job_pid(job_id)
+        finally:
+            self.stats.end(time.time() - time_start, ret[0] is not None, timed_out=timed_out)
+        return ret
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self._pool.terminate()
+        self._pool.join()
+        self._started.close()
+        if self._socket_path is not None and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+
+
+class _UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self._socket_path)
+        self.sock = sock
+
+
+class RenderClient(object):
+    """client of the render daemon
+
+    the job is rendered in the calling process when the daemon can not be
+    reached, with the same config as the daemon; an error of the job itself
+    is raised as `RuntimeError` in both cases.
+    """
+
+    def __init__(self, address=None, config=None, timeout=DEFAULT_JOB_TIMEOUT, fallback=True):
+        """
+        @param address unix socket path (string) or (host, port), the default port when omitted
+        @param config 'css_font_def' and 'options' for rendering in this process (dict)
+        @param timeout seconds to wait for the daemon (integer)
+        @param fallback whether to render in this process when the daemon can not be reached (boolean)
+        """
+        self._address = address if address is not None else (DEFAULT_HOST, DEFAULT_PORT)
+        self._config = dict(config or {})
+        self._timeout = timeout
+        self._fallback = fallback
+
+    def _connect(self):
+        if isinstance(self._address, tuple):
+            return httplib.HTTPConnection(self._address[0], self._address[1], timeout=self._timeout)
+        return _UnixHTTPConnection(self._address, timeout=self._timeout)
+
+    def _request(self, method, path, payload=None):
+        """
+        @return (HTTP status, body (bytes))
+        """
+        conn = self._connect()
+        try:
+            body = None
+            headers = dict()
+            if payload is not None:
+                body = json.dumps(payload).encode('utf-8')
+                headers['Content-Type'] = CONTENT_TYPE_JSON
+            conn.request(method, path, body, headers)
+            resp = conn.getresponse()
+            return (resp.status, resp.read())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_str(data):
+        if isinstance(data, str):
+            return data
+        return data.decode('utf-8')
+
+    def _submit(self, kind, payload):
+        """
+        @return RTF stream (bytes)
+        """
+        try:
+            status, body = self._request('POST', '/' + kind, payload)
+        except (socket.error, IOError, OSError, httplib.HTTPException):
+            if not self._fallback:
+                raise
+            return self._render_locally(kind, payload)
+        if status != 200:
+            _msg = 'render daemon error {s}: {m}'.format(s=status, m=self._to_str(body))
+            raise RuntimeError(_msg)
+        return body
+
+    def _render_locally(self, kind, payload):
+        from .__main__ import _WORKER, _prepare_worker
+
+        config = _get_worker_config(self._config)
+        _check_job(kind, payload, _get_ceilings(config))
+        if len(_WORKER) == 0:
+            # kept warm for the next fallback;
+            _prepare_worker(config)
+        data, error = _run_job((kind, payload))
+        if error is not None:
+            raise RuntimeError(error)
+        return data
+
+    def translate(self, raw_html, tag_set, **options):
+        """
+        same as `RTFMaker.htmlconv.HTMLRTF.translate`, the options have to be JSON values
+
+        @return RTF stream (bytes)
+        """
+        payload = {
+            'html': raw_html,
+            'tag_set': list(tag_set),
+            'options': options,
+        }
+        return self._submit(JOB_TRANSLATE, payload)
+
+    def render(self, elements, **options):
+        """
+        render the element dicts, same as `RTFMaker.RTFDocument.to_string`
+
+        @return RTF stream (bytes)
+        """
+        payload = {
+            'elements': list(elements),
+            'options': options,
+        }
+        return self._submit(JOB_RENDER, payload)
+
+    def stats(self):
+        """
+        @return the statistics of the daemon (dict)
+        """
+        status, body = self._request('GET', '/stats')
+        if status != 200:
+            _msg = 'render daemon error {s}: {m}'.format(s=status, m=self._to_str(body))
+            raise RuntimeError(_msg)
+        return json.loads(self._to_str(body))
+
+
+def main(argv=None):
+    import argparse
+    from .__main__ import CONFIG_ERRORS, _config_error, _load_config
+
+    parser = argparse.ArgumentParser(
+        prog='python -m RTFMaker.server',
+        description='render daemon for HTML pages and element lists',
+    )
+    parser.add_argument('-c', '--config', default=None, help='JSON or YAML file with css_font_def and options')
+    parser.add_argument('-s', '--socket', default=None, help='unix socket path, instead of the TCP port')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='TCP address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('-t', '--timeout', type=int, default=DEFAULT_JOB_TIMEOUT, help='seconds a job can take')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args(argv)
+
+    config = dict()
+    if args.config is not None:
+        try:
+            config = _load_config(args.config, **{'tag_set.required': False})
+        except CONFIG_ERRORS as e:
+            return _config_error(args.config, e)
+    address = args.socket if args.socket is not None else (args.host, args.port)
+    server = RenderServer(address, config=config, jobs=args.jobs, job_timeout=args.timeout, quiet=args.quiet)
+    print('listening on {a}, {j} worker(s)'.format(
+        a=args.socket if args.socket is not None else 'http://{h}:{p}'.format(h=args.host, p=server.server_port),
+        j=args.jobs,
+    ))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+#--eof--#
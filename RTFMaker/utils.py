@@ -19,6 +19,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from PyRTF.PropertySets import AttributedList
 
+from .compat import unicode, basestring
+
 class StyleSet(AttributedList):
     """generic style object pool"""
     def __init__(self, *args):
@@ -54,6 +56,12 @@ class StyleSet(AttributedList):
                 continue
             self.append(value)
 
+    def copy(self):
+        """shallow copy, the style objects are shared with this pool"""
+        ret = self.__class__(self.AcceptedType)
+        ret.append(*self)
+        return ret
+
     def get_names(self, **kwargs):
         names = list()
         for i in self:
@@ -66,20 +74,26 @@ def _text_strip(x, **kwargs):
     """
     @param x text object (string or obj)
     """
-    LINE_SEP = ' '
-    sep_char = unicode(kwargs.get('', LINE_SEP))
     ret = unicode(x)
     if not isinstance(x, (basestring, unicode)):
-        cache = list()
-        lines = x.get_text(strip=True).splitlines()
-        for line in lines:
-            striped_line = line.strip()
-            if len(striped_line) > 0:
-                cache.append(unicode(striped_line))
-        ret = sep_char.join(cache)
+        ret = _join_lines(x.get_text(strip=True), **kwargs)
     return ret
 
 
+def _join_lines(x, **kwargs):
+    """
+    @param x multi-line text (string)
+    """
+    LINE_SEP = ' '
+    sep_char = unicode(kwargs.get('', LINE_SEP))
+    cache = list()
+    for line in x.splitlines():
+        striped_line = line.strip()
+        if len(striped_line) > 0:
+            cache.append(unicode(striped_line))
+    return sep_char.join(cache)
+
+
 def _htmlify(x, **kwargs):
     """
     @param x text object (string)
@@ -105,33 +119,54 @@ class RPar(object):
         else:
             self._text_elements = _text_strip(self._html_content)
 
-    def append(self, *values):
+    def append(self, *values, **kwargs):
+        """
+        @note neighbouring runs of the same text style are merged into one
+
+        @param values runs of text (`RTFMaker.elements.Run`)
+        @param styles paragraph style of each run, in the same order as `values` (list)
+        """
         self._text_elements = list()
         from PyRTF.document.character import Text
 
-        _idx = 0
-        for value in values:
-            if value is not None:
-                a_text = _text_strip(value['value'])
-                a_style = value.get('style', self._style)
-                new_item = Text()
-                if isinstance(a_style, type(self._style)):
-                    new_item.Style = a_style.TextStyle
-                else:
-                    #from PyRTF.Styles import ParagraphStyle
-                    #from PyRTF.PropertySets import ParagraphPropertySet
-                    # TODO: parse and get the actual text_style here, wrapped with ParagraphStyle object;
-                    pass
-                if _idx > 0:
-                    new_item.SetData(unicode(self.DELIMITER_INLINE))
-                new_item.SetData(a_text)
-                self._text_elements.append(new_item)
-            _idx += 1
+        styles = kwargs.get('styles', None) or [None] * len(values)
+        # (text style, pieces of text) of each run;
+        runs = list()
+        for value, a_style in zip(values, styles):
+            if value is None:
+                continue
+            a_text = _text_strip(value.value)
+            if a_style is None:
+                a_style = self._style
+            text_style = None
+            if isinstance(a_style, type(self._style)):
+                text_style = a_style.TextStyle
+            else:
+                #from PyRTF.Styles import ParagraphStyle
+                #from PyRTF.PropertySets import ParagraphPropertySet
+                # TODO: parse and get the actual text_style here, wrapped with ParagraphStyle object;
+                pass
+            if len(runs) > 0 and runs[-1][0] is text_style:
+                runs[-1][1].append(a_text)
+            else:
+                runs.append((text_style, [ a_text ]))
+
+        for text_style, pieces in runs:
+            new_item = Text()
+            if text_style is not None:
+                new_item.Style = text_style
+            new_item.SetData(u''.join(pieces))
+            self._text_elements.append(new_item)
 
     def getParagraph(self, **kwargs):
+        """
+        @param prefix element placed before the text (string or obj)
+        @param prefix.delimiter text between the prefix and the text (string)
+        """
         from PyRTF.document.paragraph import Paragraph
 
         prefix_element = kwargs.pop('prefix', None)
+        prefix_delimiter = kwargs.pop('prefix.delimiter', self.DELIMITER_PREFIX)
 
         self._convert_text(**kwargs)
 
@@ -140,7 +175,8 @@ class RPar(object):
             element_obj.Style = self._style
         if prefix_element:
             element_obj.append(prefix_element)
-            element_obj.append(unicode(self.DELIMITER_PREFIX))
+            if prefix_delimiter:
+                element_obj.append(unicode(prefix_delimiter))
         if isinstance(self._text_elements, (list, tuple)):
             for atext in self._text_elements:
                 element_obj.append(atext)
@@ -168,6 +204,19 @@ class RTable(object):
     }
     TEXT_WIDTH = 9420 # 1270*6+1800=9420; 1270*7+7*90=9520; left_offset=108;
 
+    CELL_TAGS = ('td', 'th')
+    # the largest spans taken by browsers;
+    MAX_COLSPAN = 1000
+    MAX_ROWSPAN = 65534
+
+    MERGE_FIRST = 'first'
+    MERGE_NEXT = 'next'
+    NO_MERGE = (None, None)
+
+    ALIGN_LEFT = 'left'
+    ALIGN_RIGHT = 'right'
+    ALIGN_CENTER = 'center'
+
     def __init__(self, content, style=None, header_style=None, foot_style=None, **kwargs):
         self._html_content = content
         self._cell_style = style
@@ -182,43 +231,27 @@ class RTable(object):
             'foot': list(),
             'col.cnt': 0,
         }
+        from .limits import get_guard, LIMIT_TABLE_ROWS, LIMIT_TABLE_COLUMNS
+        _guard = get_guard(kwargs)
         # parse HTML here;
-        if isinstance(self._html_content, dict):
+        if isinstance(self._html_content, dict) and 'columns' in self._html_content:
+            self._convert_columns(**kwargs)
+        elif isinstance(self._html_content, dict):
             self._table_elements.update(self._html_content)
         else:
             obj = self._html_content
             if isinstance(self._html_content, (basestring, unicode)):
                 obj = _htmlify(self._html_content, **kwargs)
-            html_head = getattr(obj, 'thead')
-            if html_head:
-                for a_col in html_head.find_all('th'):
-                    tmp_col_head = {
-                        'value': _text_strip(a_col),
-                    }
-                    self._table_elements['head'].append(tmp_col_head)
-            html_body = getattr(obj, 'tbody')
-            if html_body:
-                for a_row in html_body.find_all('tr'):
-                    new_row = list()
-                    for a_cell in a_row.find_all('td'):
-                        tmp_cell = {
-                            'value': _text_strip(a_cell),
-                        }
-                        new_row.append(tmp_cell)
-                    self._table_elements['body'].append(new_row)
-            html_foot = getattr(obj, 'tfoot')
-            if html_foot:
-                for a_foot in html_foot.find_all('td'):
-                    foot_cell = {
-                        'value': _text_strip(a_foot),
-                    }
-                    self._table_elements['foot'].append(foot_cell)
+            self._convert_html(obj, **kwargs)
 
         # normalize the header and body;
         hdr_cnt = len(self._table_elements['head'])
         row_cnt_set = [ len(row) for row in self._table_elements['body'] ]
         assert len(row_cnt_set) > 0, 'empty table'
         self._table_elements['col.cnt'] = max(hdr_cnt, max(row_cnt_set))
+        if _guard is not None:
+            _guard.check(LIMIT_TABLE_ROWS, len(row_cnt_set))
+            _guard.check(LIMIT_TABLE_COLUMNS, self._table_elements['col.cnt'])
         #
         col_count = self._table_elements['col.cnt']
         trailing = [ {'value': self.EMPTY_CELL,}, ] * col_count
@@ -226,6 +259,188 @@ class RTable(object):
             self._table_elements['head'] = (self._table_elements['head'] + trailing[:])[:col_count]
         self._table_elements['body'] = [ (row+trailing[:])[:col_count] for row in self._table_elements['body'] ]
 
+    @staticmethod
+    def _get_span(tag, name, limit):
+        """
+        @param tag table cell (`bs4.element.Tag`)
+        @param name 'colspan' or 'rowspan' (string)
+        @param limit the largest span taken, as in browsers (integer)
+
+        @return the span, 1 when it is missing or invalid (integer)
+        """
+        try:
+            ret = int(tag.get(name, 1))
+        except (TypeError, ValueError):
+            return 1
+        return min(max(ret, 1), limit)
+
+    def _convert_rows(self, rows, **kwargs):
+        """place the cells of the rows of one table section on the grid
+
+        @note a cell spanning several columns or rows is kept at its first
+        slot, with its 'colspan' and 'rowspan'; the slots it covers hold None;
+        a span does not go beyond the last row of the section
+
+        @param rows the `tr` tags of the section (iterable)
+
+        @return rows of the section (list of lists)
+        """
+        from .limits import get_guard, LIMIT_TABLE_ROWS, LIMIT_TABLE_COLUMNS
+        _guard = get_guard(kwargs)
+        ret = list()
+        # rows still covered by a cell above, for each column;
+        covered = list()
+        # cells spanning several rows -> index of their row;
+        tall_cells = list()
+        for a_row in rows:
+            new_row = list()
+            col_idx = 0
+            for a_cell in a_row.children:
+                if a_cell.name not in self.CELL_TAGS:
+                    continue
+                while col_idx < len(covered) and covered[col_idx] > 0:
+                    new_row.append(None)
+                    col_idx += 1
+                colspan = self._get_span(a_cell, 'colspan', self.MAX_COLSPAN)
+                rowspan = self._get_span(a_cell, 'rowspan', self.MAX_ROWSPAN)
+                tmp_cell = {
+                    'value': _text_strip(a_cell),
+                }
+                if colspan > 1:
+                    tmp_cell['colspan'] = colspan
+                if rowspan > 1:
+                    tmp_cell['rowspan'] = rowspan
+                    tall_cells.append((len(ret), tmp_cell))
+                new_row.append(tmp_cell)
+                new_row.extend([None] * (colspan - 1))
+                if len(covered) < col_idx + colspan:
+                    covered.extend([0] * (col_idx + colspan - len(covered)))
+                for i in range(col_idx, col_idx + colspan):
+                    covered[i] = rowspan
+                col_idx += colspan
+                if _guard is not None:
+                    _guard.check(LIMIT_TABLE_COLUMNS, col_idx)
+            # the columns covered after the last cell of the row;
+            while col_idx < len(covered):
+                if covered[col_idx] > 0:
+                    new_row.extend([ {'value': self.EMPTY_CELL,} ] * (col_idx - len(new_row)))
+                    new_row.append(None)
+                col_idx += 1
+            covered = [ max(i - 1, 0) for i in covered ]
+            ret.append(new_row)
+            if _guard is not None:
+                _guard.check(LIMIT_TABLE_ROWS, len(ret))
+        for row_idx, a_cell in tall_cells:
+            a_cell['rowspan'] = min(a_cell['rowspan'], len(ret) - row_idx)
+            if a_cell['rowspan'] == 1:
+                del a_cell['rowspan']
+        return ret
+
+    def _convert_html(self, obj, **kwargs):
+        """walk the rows of the table once, the rows of a nested table are
+        not taken
+
+        @note the first row of `thead` is the header, the other rows of it
+        come first in the body; the rows out of any section are in the body;
+        the cells of all the rows of `tfoot` are the footer
+
+        @param obj the table, or the HTML page of it (`bs4.element.Tag`)
+        """
+        table = obj
+        if getattr(table, 'name', None) != 'table':
+            table = obj.find('table')
+        if table is None:
+            return
+        for a_child in table.children:
+            if a_child.name == 'thead':
+                rows = self._convert_rows(self._iter_rows(a_child), **kwargs)
+                if len(rows) > 0 and len(self._table_elements['head']) == 0:
+                    self._table_elements['head'] = rows.pop(0)
+                self._table_elements['body'][:0] = rows
+            elif a_child.name == 'tbody':
+                self._table_elements['body'].extend(self._convert_rows(self._iter_rows(a_child), **kwargs))
+            elif a_child.name == 'tfoot':
+                for a_row in self._convert_rows(self._iter_rows(a_child), **kwargs):
+                    self._table_elements['foot'].extend([ i for i in a_row if i is not None ])
+        # rows right in the table make up a section of their own;
+        loose = self._convert_rows(self._iter_rows(table), **kwargs)
+        self._table_elements['body'].extend(loose)
+
+    @staticmethod
+    def _iter_rows(section):
+        for a_child in section.children:
+            if a_child.name == 'tr':
+                yield a_child
+
+    def _get_column_formatter(self, spec, **kwargs):
+        """
+        @param spec 'decimals' (integer), 'thousands' (boolean), 'percent'
+        (boolean), 'format' (format spec, instead of the three before), 'na'
+        (text of the missing values) and 'align' (string) of a column (dict)
+
+        @return (function formatting a list of values, alignment)
+        """
+        if spec is None:
+            return (lambda values: [ self.EMPTY_CELL if i is None else unicode(i) for i in values ], None)
+        if not isinstance(spec, dict):
+            _msg = 'invalid column format: {s!r}'.format(s=spec)
+            raise ValueError(_msg)
+        align = spec.get('align', self.ALIGN_RIGHT)
+        if align not in (None, self.ALIGN_LEFT, self.ALIGN_RIGHT, self.ALIGN_CENTER):
+            _msg = 'invalid column alignment: {a!r}'.format(a=align)
+            raise ValueError(_msg)
+        format_spec = spec.get('format', None)
+        if format_spec is None:
+            decimals = spec.get('decimals', None)
+            percent = spec.get('percent', False)
+            if percent and decimals is None:
+                decimals = 0
+            format_spec = '{t}{d}{p}'.format(
+                t=',' if spec.get('thousands', False) else '',
+                d='.{n}'.format(n=int(decimals)) if decimals is not None else '',
+                p='%' if percent else ('f' if decimals is not None else ''),
+            )
+        formatter = u'{0:' + format_spec + u'}'
+        na_text = unicode(spec.get('na', self.EMPTY_CELL))
+
+        def _format(values):
+            # NaN is the only value not equal to itself;
+            return [ na_text if i is None or i != i else formatter.format(i) for i in values ]
+        return (_format, align)
+
+    def _convert_columns(self, **kwargs):
+        """fill the table from column arrays, each column is formatted at once"""
+        from .limits import get_guard, LIMIT_TABLE_ROWS, LIMIT_TABLE_COLUMNS
+        content = self._html_content
+        columns = content['columns']
+        _guard = get_guard(kwargs)
+        if _guard is not None:
+            # before any value is formatted;
+            _guard.check(LIMIT_TABLE_COLUMNS, len(columns))
+            _guard.check(LIMIT_TABLE_ROWS, max([ len(i) for i in columns ] or [0]))
+        formats = list(content.get('formats', None) or [])
+        formats += [None] * (len(columns) - len(formats))
+
+        cells = list()
+        aligns = list()
+        for a_column, a_spec in zip(columns, formats):
+            # array.array and numpy arrays give the python numbers;
+            values = a_column.tolist() if hasattr(a_column, 'tolist') else list(a_column)
+            formatter, align = self._get_column_formatter(a_spec, **kwargs)
+            cells.append([ {'value': i,} for i in formatter(values) ])
+            aligns.append(align)
+
+        row_cnt = max([ len(i) for i in cells ] or [0])
+        blank = {'value': self.EMPTY_CELL,}
+        self._table_elements['body'] = [
+            [ (i[idx] if idx < len(i) else blank) for i in cells ] for idx in range(row_cnt)
+        ]
+        self._table_elements['head'] = [
+            (i if isinstance(i, dict) else {'value': unicode(i),}) for i in (content.get('head', None) or [])
+        ]
+        self._table_elements['foot'] = list(content.get('foot', None) or [])
+        self._table_elements['align'] = aligns
+
     def _get_column_layout(self, colcnt, **kwargs):
         """
         @param colcnt column count (positive integer)
@@ -242,6 +457,70 @@ class RTable(object):
         ret = HUB.get(colcnt, evenly_split)
         return ret
 
+    def _get_merges(self, rows, col_count):
+        """
+        @param rows the header row and the body rows (list of lists)
+        @param col_count (integer)
+
+        @return (row index, column index) -> (horizontal merging, vertical
+        merging) of each merged slot, each one is `MERGE_FIRST`, `MERGE_NEXT`
+        or None (dict)
+        """
+        ret = dict()
+        for r_idx, row in enumerate(rows):
+            for c_idx, a_cell in enumerate(row[:col_count]):
+                if not isinstance(a_cell, dict):
+                    continue
+                colspan = min(int(a_cell.get('colspan', 1) or 1), col_count - c_idx)
+                rowspan = min(int(a_cell.get('rowspan', 1) or 1), len(rows) - r_idx)
+                if colspan <= 1 and rowspan <= 1:
+                    continue
+                for i in range(rowspan):
+                    v_merge = None
+                    if rowspan > 1:
+                        v_merge = self.MERGE_FIRST if i == 0 else self.MERGE_NEXT
+                    for j in range(colspan):
+                        h_merge = None
+                        if colspan > 1:
+                            h_merge = self.MERGE_FIRST if j == 0 else self.MERGE_NEXT
+                        ret[(r_idx + i, c_idx + j)] = (h_merge, v_merge)
+        return ret
+
+    def _get_cell(self, content, style, props, merge):
+        """
+        @param content the cell, None for a slot covered by a merged cell (dict)
+        @param style paragraph style of the text
+        @param props paragraph properties of the column
+        @param merge (horizontal merging, vertical merging) of the slot (tuple)
+
+        @rtype `PyRTF.document.paragraph.Cell`
+        """
+        from PyRTF.document.paragraph import Paragraph, Cell
+
+        h_merge, v_merge = merge
+        ret = Cell(
+            start_vertical_merge=(v_merge == self.MERGE_FIRST),
+            vertical_merge=(v_merge == self.MERGE_NEXT),
+        )
+        if h_merge is not None:
+            ret.StartHorizontalMerge = (h_merge == self.MERGE_FIRST)
+            ret.HorizontalMerge = (h_merge == self.MERGE_NEXT)
+        if content is not None:
+            cell_p = Paragraph(content['value'])
+            if style:
+                cell_p.Style = style
+            if props is not None:
+                cell_p.Properties = props
+            ret.append(cell_p)
+        return ret
+
+    def get_elements(self, **kwargs):
+        """
+        @return the parsed cells, can be the content of another `RTable` (dict)
+        """
+        self._convert_table(**kwargs)
+        return dict(self._table_elements)
+
     def getTable(self, **kwargs):
         """
         @param table_left_offset (integer)
@@ -249,34 +528,43 @@ class RTable(object):
         @param space_before_footer insert blank line before the merged footer paragraph (boolean)
         """
         from PyRTF.document.paragraph import Paragraph, Table, Cell
-        #from PyRTF.PropertySets import ParagraphPropertySet
+        from PyRTF.PropertySets import ParagraphPropertySet
 
         self._convert_table(**kwargs)
         col_count = self._table_elements['col.cnt']
 
+        # one property set per aligned column, shared by its cells;
+        align_hub = {
+            self.ALIGN_LEFT: ParagraphPropertySet.LEFT,
+            self.ALIGN_RIGHT: ParagraphPropertySet.RIGHT,
+            self.ALIGN_CENTER: ParagraphPropertySet.CENTER,
+        }
+        col_props = [
+            (ParagraphPropertySet(alignment=align_hub[i]) if i is not None else None)
+            for i in self._table_elements.get('align', None) or []
+        ]
+        col_props = (col_props + [None] * col_count)[:col_count]
+
         tbl_left_offset = kwargs.get('table_left_offset', 108)
         ret = Table(left_offset=tbl_left_offset)
         tbl_layout = self._get_column_layout(col_count, **kwargs)
         ret.SetColumnWidths(*(tbl_layout))
 
+        rows = list()
         if len(self._table_elements['head']) > 0:
-            header_row = list()
-            for a_head in self._table_elements['head'][:col_count]:
-                head_p = Paragraph(a_head['value'])
-                if self._head_style:
-                    head_p.Style = self._head_style
-                rhead = Cell(head_p)
-                header_row.append(rhead)
-            ret.AddRow(*header_row)
-
-        for row in self._table_elements['body']:
-            single_row = list()
-            for a_cell in row[:col_count]:
-                cell_p = Paragraph(a_cell['value'])
-                if self._cell_style:
-                    cell_p.Style = self._cell_style
-                rcell = Cell(cell_p)
-                single_row.append(rcell)
+            rows.append(self._table_elements['head'])
+        rows.extend(self._table_elements['body'])
+        # the cells spanning several columns or rows;
+        merges = self._get_merges(rows, col_count)
+
+        for row_idx, row in enumerate(rows):
+            style = self._cell_style
+            if row_idx == 0 and len(self._table_elements['head']) > 0:
+                style = self._head_style
+            single_row = [
+                self._get_cell(a_cell, style, col_props[col_idx], merges.get((row_idx, col_idx), self.NO_MERGE))
+                for col_idx, a_cell in enumerate(row[:col_count])
+            ]
             ret.AddRow(*single_row)
 
         if len(self._table_elements['foot']) > 0:
@@ -310,27 +598,138 @@ class RList(object):
     ITEM_TYPE_NORMAL = 'li'
     ITEM_TYPE_PLAIN = 'plain'
 
+    LIST_TAGS = ('ul', 'ol')
+    LEVEL_BULLET = 'bullet'
+    LEVEL_DECIMAL = 'decimal'
+    LEVEL_FORMAT = {
+        'ul': LEVEL_BULLET,
+        'ol': LEVEL_DECIMAL,
+    }
+    MAX_LEVEL = 9
+    LEVEL_INDENT = 360  # left indentation added by each level, in twips;
+    HANGING_INDENT = 180
+
     def __init__(self, content, style=None, **kwargs):
         self._html_content = content
         self._style = style
 
     def _convert_list(self, **kwargs):
+        """walk the HTML once, in document order
+
+        each item is a dict of 'text', 'type', 'level' (nesting depth, 0 for
+        the outermost list) and 'list' (index of the outermost list); the
+        numbering format of every level of each outermost list is kept in
+        `_list_formats`; a dict of 'items' and 'formats' (see `get_elements`)
+        is taken as it is
+        """
+        if getattr(self, '_list_elements', None) is not None:
+            return
+        if isinstance(self._html_content, dict):
+            self._list_elements = [
+                i if i['level'] < self.MAX_LEVEL else dict(i, level=self.MAX_LEVEL - 1)
+                for i in self._html_content['items']
+            ]
+            self._list_formats = [ tuple(i)[:self.MAX_LEVEL] for i in self._html_content['formats'] ]
+            return
+        from bs4.element import Comment
+
         self._list_elements = list()
+        self._list_formats = list()
         # parse HTML here;
         obj = self._html_content
         if isinstance(self._html_content, (basestring, unicode)):
             obj = _htmlify(self._html_content, **kwargs)
-        for item in obj.find_all():
-            item_name = getattr(item, 'name', None)
-            item_type = self.ITEM_TYPE_PLAIN
-            if str(item_name).lower() in ('li',):
-                item_type = self.ITEM_TYPE_NORMAL
-            item_text = _text_strip(item)
-            tmp_dic = {
-                'text': item_text,
-                'type': item_type,
-            }
-            self._list_elements.append(tmp_dic)
+
+        def _text_of(item):
+            # text of the item itself, nested lists excluded;
+            cache = list()
+            for child in item.children:
+                child_name = getattr(child, 'name', None)
+                if child_name is None:
+                    piece = unicode(child).strip()
+                elif str(child_name).lower() in self.LIST_TAGS:
+                    continue
+                else:
+                    piece = child.get_text(strip=True)
+                if len(piece) > 0:
+                    cache.append(piece)
+            return _join_lines(u''.join(cache))
+
+        def _walk(node, level, list_idx, nested_only=False):
+            for child in node.children:
+                child_name = getattr(child, 'name', None)
+                if child_name is None:
+                    # stray text between the items, comments excluded;
+                    if nested_only or isinstance(child, Comment):
+                        continue
+                    item_text = _join_lines(unicode(child))
+                    if len(item_text) > 0:
+                        self._list_elements.append({
+                            'text': item_text,
+                            'type': self.ITEM_TYPE_PLAIN,
+                            'level': level,
+                            'list': list_idx,
+                        })
+                    continue
+                child_name = str(child_name).lower()
+                if child_name in self.LIST_TAGS:
+                    if list_idx is None:
+                        # new outermost list;
+                        self._list_formats.append([ self.LEVEL_FORMAT[child_name] ])
+                        _walk(child, 0, len(self._list_formats) - 1)
+                    else:
+                        # RTF has no more than `MAX_LEVEL` levels, deeper lists share the last one;
+                        sub_level = min(level + 1, self.MAX_LEVEL - 1)
+                        formats = self._list_formats[list_idx]
+                        if len(formats) <= sub_level:
+                            formats.append(self.LEVEL_FORMAT[child_name])
+                        _walk(child, sub_level, list_idx)
+                elif child_name == self.ITEM_TYPE_NORMAL and list_idx is not None:
+                    self._list_elements.append({
+                        'text': _text_of(child),
+                        'type': self.ITEM_TYPE_NORMAL,
+                        'level': level,
+                        'list': list_idx,
+                    })
+                    # nested lists come right after the item;
+                    _walk(child, level, list_idx, nested_only=True)
+                elif child.find(self.LIST_TAGS) is not None:
+                    # other container, look into it at the same level;
+                    _walk(child, level, list_idx, nested_only=nested_only)
+                elif not nested_only:
+                    item_text = _text_strip(child)
+                    if len(item_text) > 0:
+                        self._list_elements.append({
+                            'text': item_text,
+                            'type': self.ITEM_TYPE_PLAIN,
+                            'level': level,
+                            'list': list_idx,
+                        })
+
+        obj_name = str(getattr(obj, 'name', None)).lower()
+        if obj_name in self.LIST_TAGS:
+            self._list_formats.append([ self.LEVEL_FORMAT[obj_name] ])
+            _walk(obj, 0, 0)
+        else:
+            _walk(obj, 0, None)
+        self._list_formats = [ tuple(i) for i in self._list_formats ]
+
+    def get_formats(self, **kwargs):
+        """
+        @return numbering format of the levels in use, for each outermost list (list of tuples)
+        """
+        self._convert_list(**kwargs)
+        return list(self._list_formats)
+
+    def get_elements(self, **kwargs):
+        """
+        @return the parsed items and formats, can be the content of another `RList` (dict)
+        """
+        self._convert_list(**kwargs)
+        return {
+            'items': list(self._list_elements),
+            'formats': list(self._list_formats),
+        }
 
     def _bullet_point(self, **kwargs):
         from PyRTF.document.base import RawCode
@@ -345,35 +744,211 @@ class RList(object):
 
     def getList(self, **kwargs):
         """
+        @param list_ids RTF list number (\\ls) of each outermost list, the
+        items carry a literal prefix symbol instead when omitted (list)
         @param list_symbol_name (string)
         """
-        #from PyRTF.document.paragraph import Enumerate, Item
+        from PyRTF.document.base import RawCode
+        from PyRTF.PropertySets import ParagraphPropertySet
 
         self._convert_list(**kwargs)
 
+        list_ids = kwargs.pop('list_ids', None)
         symbol_name = kwargs.get('list_symbol_name', 'bullet')
         prefix_symbol = self._bullet_point(**kwargs)[symbol_name]
 
-        #ret = Enumerate()
         ret = list()
         for item in self._list_elements:
             tmp_dic = dict()
             if item['type'] == self.ITEM_TYPE_NORMAL:
-                tmp_dic['prefix'] = prefix_symbol
+                if list_ids is None:
+                    tmp_dic['prefix'] = prefix_symbol
+                else:
+                    tmp_dic['prefix'] = RawCode(r'\ls{ls}\ilvl{lv} '.format(
+                        ls=list_ids[item['list']], lv=item['level']
+                    ))
+                    tmp_dic['prefix.delimiter'] = None
             tmp_dic.update(kwargs)
             item_par = RPar(item['text'], style=self._style, **kwargs).getParagraph(**tmp_dic)
+            if list_ids is not None and item['type'] == self.ITEM_TYPE_NORMAL:
+                # same indentation as the list level;
+                item_par.Properties = ParagraphPropertySet(
+                    first_line_indent=-self.HANGING_INDENT,
+                    left_indent=self.LEVEL_INDENT * (item['level'] + 1),
+                )
+            elif item['level'] > 0:
+                item_par.Properties = ParagraphPropertySet(
+                    left_indent=self.LEVEL_INDENT * item['level'],
+                )
             ret.append(item_par)
         return ret
 
 
-#class RFigure(object):
-#    def __init__(self, content, style=None, **kwargs):
-#        self._html_content = content
-#        self._style = style
-#
-#    def getFigure(self, **kwargs):
-#        from PyRTF.document.base import TAB, LINE
-#        from PyRTF.object.picture import Image
+IMAGE_FORMAT_PNG = 'png'
+IMAGE_FORMAT_JPEG = 'jpeg'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIGNATURE = b'\xff\xd8'
+
+# start of frame markers, the others of 0xC0-0xCF (DHT, JPG, DAC) carry no size;
+JPEG_SOF_MARKERS = frozenset([
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+])
+
+
+def is_image_data(data):
+    """
+    @param data image data, or only its first bytes (bytes)
+
+    @return whether the data starts like PNG or JPEG data (boolean)
+    """
+    return isinstance(data, bytes) and (data.startswith(PNG_SIGNATURE) or data.startswith(JPEG_SIGNATURE))
+
+
+def get_image_path(name, root=None):
+    """locate an image file inside of the image folder, symbolic links
+    and '..' are followed before the check
+
+    @param name file name, relative to the root folder (string)
+    @param root the image folder, the current folder when omitted (string)
+
+    @return the real path of the file, None when it is not in the folder (string)
+    """
+    import os
+
+    root = os.path.realpath(root or os.curdir)
+    ret = os.path.realpath(os.path.join(root, name))
+    if not ret.startswith(os.path.join(root, '')):
+        return None
+    return ret
+
+
+def _get_image_info(data, **kwargs):
+    """read the format and the size from the header of PNG/JPEG data
+
+    @param data image data (bytes)
+
+    @return (format, width, height), the size in pixels
+    """
+    import struct
+
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR':
+        width, height = struct.unpack_from('>II', data, 16)
+        return (IMAGE_FORMAT_PNG, width, height)
+
+    if data[:2] == JPEG_SIGNATURE:
+        pos = 2
+        size = len(data)
+        while pos + 4 <= size:
+            prefix, marker = struct.unpack_from('>BB', data, pos)
+            if prefix != 0xFF:
+                break
+            if marker == 0xFF:
+                # fill byte;
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+                # markers without segment;
+                pos += 2
+                continue
+            seg_length = struct.unpack_from('>H', data, pos + 2)[0]
+            if marker in JPEG_SOF_MARKERS:
+                if pos + 9 > size:
+                    break
+                height, width = struct.unpack_from('>HH', data, pos + 5)
+                return (IMAGE_FORMAT_JPEG, width, height)
+            pos += 2 + seg_length
+        _msg = 'invalid JPEG data, no frame header found'
+        raise ValueError(_msg)
+
+    _msg = 'unsupported image format, only PNG and JPEG are supported'
+    raise ValueError(_msg)
+
+
+class RImage(object):
+    """image data shared by every occurrence of the same picture"""
+
+    __slots__ = ('data', 'digest', 'format', 'width', 'height')
+
+    def __init__(self, data, digest=None, **kwargs):
+        """
+        @param data PNG or JPEG data (bytes)
+        @param digest SHA-1 of the data, computed when omitted (string)
+        """
+        import hashlib
+
+        self.format, self.width, self.height = _get_image_info(data)
+        self.data = data
+        self.digest = digest or hashlib.sha1(data).hexdigest()
+
+
+class RPicture(object):
+    """picture placed in a paragraph, written by `RTFMaker.writer.RTFWriter`"""
+
+    __slots__ = ('image', 'width', 'height')
+
+    def __init__(self, image, width, height):
+        """
+        @param image (`RImage`)
+        @param width display width in twips (integer)
+        @param height display height in twips (integer)
+        """
+        self.image = image
+        self.width = width
+        self.height = height
+
+
+class RFigure(object):
+    """internal representation of the figure"""
+
+    TWIPS_PER_PIXEL = 15 # 96 dpi;
+
+    def __init__(self, content, style=None, width=None, height=None, **kwargs):
+        """
+        @param content (`RImage`)
+        @param width display width in pixels (integer)
+        @param height display height in pixels (integer)
+        """
+        self._image = content
+        self._style = style
+        self._width = width
+        self._height = height
+
+    def get_size(self, **kwargs):
+        """display size, the aspect ratio is kept when only one side is
+        given, and the figure is scaled down to fit the text width
+
+        @param max_width (integer, in twips)
+
+        @return (width, height) in twips
+        """
+        max_width = kwargs.get('max_width', RTable.TEXT_WIDTH)
+        img_width = max(self._image.width, 1)
+        img_height = max(self._image.height, 1)
+        width = self._width
+        height = self._height
+        if width is None and height is None:
+            width, height = img_width, img_height
+        elif width is None:
+            width = int(round(img_width * height / float(img_height)))
+        elif height is None:
+            height = int(round(img_height * width / float(img_width)))
+        width *= self.TWIPS_PER_PIXEL
+        height *= self.TWIPS_PER_PIXEL
+        if max_width and width > max_width:
+            height = int(round(height * max_width / float(width)))
+            width = max_width
+        return (width, max(height, 1))
+
+    def getFigure(self, **kwargs):
+        from PyRTF.document.paragraph import Paragraph
+
+        width, height = self.get_size(**kwargs)
+        element_obj = Paragraph()
+        if self._style is not None:
+            element_obj.Style = self._style
+        element_obj.append(RPicture(self._image, width, height))
+        return element_obj
 
 
 #--eof--#
@@ -0,0 +1,549 @@
+"""
+writer.py is part of RTFMaker, a simple RTF document generation package
+
+Copyright (C) 2019, 2020  Liang Chen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+from PyRTF.Renderer import Renderer, Settings, TableAlignmentMap, CellAlignmentMap, CellFlowMap
+
+from .compat import unicode, basestring, to_bytes, unicode_escape
+
+
+class RTFWriter(Renderer):
+    """renderer that writes the document part by part
+
+    the output is the same as `PyRTF.Elements.Document.write`, but the header
+    (document settings, colour/font tables, stylesheet and the section
+    preamble), the body and the trailer are written by separate calls, so
+    that the body can be written in several pieces and a previously rendered
+    piece can be reused.
+
+    in compact mode, consecutive paragraphs of the same formatting share one
+    group instead of resetting the formatting for each of them, neighbouring
+    runs of the same formatting share one group, and the text is written
+    with the code page escapes (\\'xx) where possible.
+
+    the output stream takes bytes, the text is collected and encoded one
+    chunk at a time, and the pieces rendered before are written as they are.
+    """
+
+    CODEPAGE = 'cp1252'  # (\\ansicpg1252)
+
+    PICT_TYPES = {
+        'png': 'pngblip',
+        'jpeg': 'jpegblip',
+    }
+    # image data hex-encoded at once, one line of the output each;
+    PICT_CHUNK_SIZE = 32768
+    # text collected before it is encoded and written, in characters;
+    FLUSH_SIZE = 65536
+
+    def __init__(self, fout, compact=False, **kwargs):
+        """
+        @param fout output stream
+        @param compact whether to write the body in compact mode (boolean)
+        """
+        Renderer.__init__(self, write_custom_element_callback=_write_custom_element)
+        self._fout = fout
+        self._pending = list()
+        self._pending_size = 0
+        self._doc = None
+        self._CurrentStyle = None
+        self._has_body = False
+        self._compact = compact
+        # formatting of the paragraph group left open, compact mode only;
+        self._open_head = None
+        # bytes saved by the compact mode;
+        self.saved = {
+            'resets': 0,
+            'escapes': 0,
+        }
+
+    def write_header(self, document, lists=(), **kwargs):
+        """write everything that comes before the first element of the document
+
+        @param document (`PyRTF.Elements.Document`)
+        @param lists numbering format of the levels of each RTF list (list of tuples)
+        """
+        self._doc = document
+        self._WriteDocument()
+        self._WriteColours()
+        self._WriteFonts()
+        self._WriteStyleSheet()
+        if len(lists) > 0:
+            self._WriteListTable(lists)
+
+        section = document.Sections[0]
+        settings = Settings()
+        self._RendPageProperties(section, settings, in_section=False)
+        self._write(repr(settings))
+
+        self._WriteSection(_get_preamble(section), is_first=True, add_header=False)
+        self.flush()
+
+    def write_section_break(self, section, break_type=None):
+        """end the section written so far and start a new one
+
+        @param section the section of the page settings (`PyRTF.document.section.Section`)
+        @param break_type where the new section starts, the one of the section when omitted
+        (`PyRTF.document.section.Section.PAGE` etc.)
+        """
+        preamble = _get_preamble(section)
+        if break_type is not None:
+            preamble.BreakType = break_type
+        self._write('\n')
+        self._WriteSection(preamble, is_first=False, add_header=True)
+        self._has_body = False
+        self.flush()
+
+    def write_page_break(self):
+        self._write('\n\\page')
+        self.flush()
+
+    def _write(self, data, *params):
+        if params:
+            data = data % params
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.FLUSH_SIZE:
+            self.flush()
+
+    def _write_bytes(self, data):
+        """write data already encoded, after the collected text"""
+        self.flush()
+        self._fout.write(data)
+
+    def flush(self):
+        """encode the collected text and write it"""
+        if self._pending_size > 0:
+            data = to_bytes(''.join(self._pending))
+            self._pending = list()
+            self._pending_size = 0
+            self._fout.write(data)
+
+    def _WriteListTable(self, lists):
+        """the list table and the list override table, list N is referred to
+        as \\lsN by the list item paragraphs
+        """
+        from .utils import RList
+
+        self._write('\n{\\*\\listtable')
+        for list_id, formats in enumerate(lists, 1):
+            self._write('\n{\\list\\listtemplateid%s', list_id)
+            for level, a_format in enumerate(formats):
+                indent = RList.LEVEL_INDENT * (level + 1)
+                if a_format == RList.LEVEL_DECIMAL:
+                    # "<number of this level>.";
+                    level_text = "{\\leveltext\\'02\\'%02x.;}{\\levelnumbers\\'01;}" % level
+                    nfc = 0
+                else:
+                    level_text = "{\\leveltext\\'01\\u9679 ?;}{\\levelnumbers;}"
+                    nfc = 23
+                self._write(
+                    '{\\listlevel\\levelnfc%s\\leveljc0\\levelfollow0\\levelstartat1%s\\fi-%s\\li%s}',
+                    nfc, level_text, RList.HANGING_INDENT, indent
+                )
+            self._write('{\\listname ;}\\listid%s}', list_id)
+        self._write('}\n{\\*\\listoverridetable')
+        for list_id in range(1, len(lists) + 1):
+            self._write('{\\listoverride\\listid%s\\listoverridecount0\\ls%s}', list_id, list_id)
+        self._write('}')
+
+    def get_state(self):
+        """the lookup tables built by `write_header`
+
+        @rtype dict
+        """
+        ret = {
+            'style.map': self.paragraph_style_map,
+            'font.map': self._font_map,
+            'colour.map': self._colour_map,
+            'current.style': self._CurrentStyle,
+        }
+        return ret
+
+    def set_state(self, state):
+        """continue with the lookup tables of a header written before
+
+        @param state the return value of `get_state` (dict)
+        """
+        self.paragraph_style_map = state['style.map']
+        self._font_map = state['font.map']
+        self._colour_map = state['colour.map']
+        self._CurrentStyle = state['current.style']
+
+    def write_elements(self, elements):
+        """write document elements, continuing the body written so far
+
+        @param elements (list)
+        """
+        if len(elements) == 0:
+            return
+        if self._has_body:
+            self._write('\n')
+        self._WriteElements(elements)
+        self._has_body = True
+        self.flush()
+
+    def write_segment(self, text, current_style):
+        """write a piece of body rendered before
+
+        @param text rendered elements (bytes)
+        @param current_style the paragraph style in effect at the end of the piece
+        """
+        if len(text) == 0:
+            return
+        if self._has_body:
+            self._write('\n')
+        self._write_bytes(text)
+        self._CurrentStyle = current_style
+        self._has_body = True
+
+    def write_trailer(self):
+        self._write('}')
+        self.flush()
+
+    def _close_group(self):
+        if self._open_head is not None:
+            self._write('}')
+            self._open_head = None
+
+    def _WriteElements(self, elements):
+        if not self._compact:
+            return Renderer._WriteElements(self, elements)
+        from PyRTF.document.paragraph import Paragraph
+        for idx, element in enumerate(elements):
+            if idx > 0:
+                self._write('\n')
+            if element.__class__ != Paragraph:
+                self._close_group()
+            Renderer._WriteElements(self, [ element ])
+        self._close_group()
+
+    def WriteParagraphElement(self, paragraph_elem, tag_prefix='', tag_suffix=r'\par', opening='{', closing='}'):
+        if not self._compact:
+            return Renderer.WriteParagraphElement(self, paragraph_elem, tag_prefix, tag_suffix, opening, closing)
+
+        overrides = Settings()
+        self._RendParagraphPropertySet(paragraph_elem.Properties, overrides)
+        self._RendFramePropertySet(paragraph_elem.Frame, overrides)
+        self._RendShadingPropertySet(paragraph_elem.Shading, overrides)
+        self._CurrentStyle = self.paragraph_style_map.get(paragraph_elem.Style, self._CurrentStyle)
+        head = r'\pard\plain%s %s%s ' % (tag_prefix, self._CurrentStyle, overrides)
+
+        # only the paragraphs outside of tables have their own group;
+        grouped = (opening == '{' and closing == '}')
+        if grouped and head == self._open_head:
+            # same formatting as the previous paragraph, carry on;
+            self.saved['resets'] += len(closing) + len(opening) + len(head)
+        else:
+            self._close_group()
+            self._write(opening + head)
+        self._WriteRuns(paragraph_elem)
+        self._write(tag_suffix)
+        if grouped:
+            self._open_head = head
+        else:
+            self._write(closing)
+
+    def _WriteRuns(self, paragraph_elem):
+        from PyRTF.document.base import TAB, LINE, RawCode
+        from PyRTF.document.character import Text, Inline
+
+        run_head = None
+        for element in paragraph_elem:
+            if isinstance(element, Text):
+                overrides = Settings()
+                self._RendTextPropertySet(element.Properties, overrides)
+                self._RendShadingPropertySet(element.Shading, overrides, 'ch')
+                head = repr(overrides)
+                if head != run_head:
+                    if run_head:
+                        self._write('}')
+                    if head:
+                        self._write('{' + head + ' ')
+                    run_head = head
+                elif head:
+                    self.saved['resets'] += len('}{') + len(head) + 1
+                if isinstance(element.Data, (basestring, unicode)):
+                    self._WriteText(element.Data)
+                elif element.Data == TAB:
+                    self._write(r'\tab ')
+                else:
+                    self.WriteCustomElement(self, element.Data)
+                continue
+            if run_head:
+                self._write('}')
+                run_head = None
+            if isinstance(element, (basestring, unicode)):
+                self._WriteText(element)
+            elif isinstance(element, RawCode):
+                self._write(element.Data)
+            elif isinstance(element, Inline):
+                self.WriteInlineElement(element)
+            elif element == TAB:
+                self._write(r'\tab ')
+            elif element == LINE:
+                self._write(r'\line ')
+            elif self.WriteCustomElement:
+                self.WriteCustomElement(self, element)
+            else:
+                raise Exception('Don\'t know how to handle %s' % element)
+        if run_head:
+            self._write('}')
+
+    def WriteTableElement(self, table_elem):
+        """same output as `PyRTF.Renderer.Renderer.WriteTableElement`, plus
+        the horizontal merging of cells; the merging of each cell is taken as
+        it is given, the first cell of a merge has `StartHorizontalMerge` or
+        `StartVerticalMerge` set (\\clmgf, \\clvmgf), the cells merged into
+        it have `HorizontalMerge` or `VerticalMerge` set (\\clmrg, \\clvmrg)
+        """
+        from PyRTF.document.paragraph import Paragraph
+
+        for height, cells in table_elem.Rows:
+            settings = Settings()
+            # the spec says it is mandatory, 108 is the default value;
+            settings.append(table_elem.GapBetweenCells or 108, 'trgaph%s')
+            settings.append(TableAlignmentMap[table_elem.Alignment])
+            settings.append(height, 'trrh%s')
+            settings.append(table_elem.LeftOffset, 'trleft%s')
+
+            # right edge of each cell, with the spans;
+            cell_x = table_elem.LeftOffset or 0
+            col_idx = 0
+            for cell in cells:
+                self._RendFramePropertySet(cell.Frame, settings, 'cl')
+                if getattr(cell, 'StartHorizontalMerge', False):
+                    settings.append('clmgf')
+                elif getattr(cell, 'HorizontalMerge', False):
+                    settings.append('clmrg')
+                if cell.StartVerticalMerge:
+                    settings.append('clvmgf')
+                elif cell.VerticalMerge:
+                    settings.append('clvmrg')
+                settings.append(CellAlignmentMap[cell.Alignment])
+                settings.append(CellFlowMap[cell.Flow])
+                cell_x += sum(table_elem.ColumnWidths[col_idx:col_idx + cell.Span])
+                col_idx += cell.Span
+                settings.append(cell_x, 'cellx%s')
+            self._write(r'{\trowd')
+            self._write(repr(settings))
+
+            for cell in cells:
+                if len(cell) == 0:
+                    self._write(r'\pard\intbl\cell')
+                    continue
+                last_idx = len(cell) - 1
+                for element_idx, element in enumerate(cell):
+                    if isinstance(element, (basestring, unicode)):
+                        element = Paragraph(element)
+                    # the last paragraph is ended by the cell;
+                    if element_idx == last_idx:
+                        self.WriteParagraphElement(element, tag_prefix=r'\intbl', tag_suffix='', opening='', closing='')
+                    else:
+                        self.WriteParagraphElement(element, tag_prefix=r'\intbl', opening='', closing='')
+                self._write(r'\cell')
+            self._write('\\row}\n')
+
+    def WritePicture(self, picture):
+        """write the picture group, the image data is hex-encoded piece by
+        piece instead of all at once
+
+        @param picture (`RTFMaker.utils.RPicture`)
+        """
+        import binascii
+
+        image = picture.image
+        self._write(
+            '{\\pict\\%s\\picw%s\\pich%s\\picwgoal%s\\pichgoal%s{\\*\\blipuid %s}',
+            self.PICT_TYPES[image.format], image.width, image.height,
+            picture.width, picture.height, image.digest[:32]
+        )
+        view = memoryview(image.data)
+        for offset in range(0, len(view), self.PICT_CHUNK_SIZE):
+            self._write('\n')
+            # already ASCII bytes;
+            self._write_bytes(binascii.hexlify(view[offset:offset + self.PICT_CHUNK_SIZE]))
+        self._write('}')
+
+    def _WriteText(self, text):
+        """write the text, with the code page escape of the characters that
+        have one, and the unicode escape for the others
+        """
+        if not isinstance(text, unicode):
+            return self._write(text)
+        try:
+            text.encode('ascii')
+            return self._write(text)
+        except UnicodeError:
+            pass
+        cache = list()
+        for c in text:
+            code = ord(c)
+            if code < 128:
+                cache.append(c)
+                continue
+            # the unicode escape written otherwise;
+            u_escape = unicode_escape(c)
+            try:
+                encoded = c.encode(self.CODEPAGE)
+            except UnicodeError:
+                cache.append(u_escape)
+                continue
+            escape = ''.join([ "\\'%02x" % i for i in bytearray(encoded) ])
+            self.saved['escapes'] += len(u_escape) - len(escape)
+            cache.append(escape)
+        self._write(''.join(cache))
+
+
+def _get_preamble(section):
+    """
+    @return the same section settings but without any element
+    """
+    from PyRTF.document.section import Section
+
+    ret = Section.__new__(Section)
+    ret.__dict__.update(section.__dict__)
+    return ret
+
+
+# control words referring to the style, font, list and colour tables, the
+# escaped backslash is matched first so that '\\s1' in text is left alone;
+_TABLE_REFERENCE = re.compile(
+    br'\\\\|\\(s|f|ls|cf|cb|highlight|brdrcf|chcfpat|chcbpat|cfpat|cbpat)(\d+)'
+)
+# control word -> table;
+_TABLE_OF_WORD = {
+    b's': 's',
+    b'f': 'f',
+    b'ls': 'ls',
+}
+
+
+def remap_tables(data, maps):
+    """renumber the references to the style, font, list and colour tables
+
+    @param data rendered body (bytes)
+    @param maps the new number by the old one, of the paragraph styles ('s'),
+    fonts ('f'), lists ('ls') and colours ('cf'), the numbers missing are kept (dict)
+
+    @rtype bytes
+    """
+    maps = dict([ (k, v) for k, v in maps.items() if v ])
+    if len(maps) == 0:
+        return data
+
+    def _replace(match):
+        word = match.group(1)
+        if word is None:
+            return match.group(0)
+        table = maps.get(_TABLE_OF_WORD.get(word, 'cf'), None)
+        if table is None:
+            return match.group(0)
+        new_number = table.get(int(match.group(2)), None)
+        if new_number is None:
+            return match.group(0)
+        return b'\\' + word + str(new_number).encode('ascii')
+    return _TABLE_REFERENCE.sub(_replace, data)
+
+
+def _write_custom_element(renderer, element):
+    """write the elements unknown to `PyRTF.Renderer.Renderer`"""
+    from .utils import RPicture
+
+    if isinstance(element, RPicture):
+        return renderer.WritePicture(element)
+    _msg = 'unknown document element: {e!r}'.format(e=element)
+    raise ValueError(_msg)
+
+
+class OutputFilter(object):
+    """file-like object that post-processes the output while it is written
+
+    the written data (bytes) is collected into chunks, each chunk goes through the
+    newline removal and the replacements one by one before reaching the
+    output; the tail of a chunk that may start a match is carried over to
+    the next chunk, the result is the same as processing the full output at
+    once.
+    """
+
+    DEBUG_LINE_BREAKS = (
+        (b'}\\paperw',      b'}\n\\paperw'),
+        (b'footer}{',       b'footer}\n{'),
+        (b'{\\colortbl',    b'\n{\\colortbl'),
+        (b'}{\\fonttbl',    b'}\n{\\fonttbl'),
+        (b'}{\\stylesheet', b'}\n{\\stylesheet'),
+    )
+
+    def __init__(self, fout, strip_newline=False, debug_output=False, chunk_size=65536, **kwargs):
+        """
+        @param fout output stream
+        @param strip_newline whether the newline character needs to be removed from the output (boolean)
+        @param debug_output whether to break the header into lines (boolean)
+        @param chunk_size size of the data collected before processing (integer)
+        """
+        self._fout = fout
+        self._strip_newline = strip_newline
+        self._replacements = self.DEBUG_LINE_BREAKS if debug_output else ()
+        self._carry = [ b'' for i in self._replacements ]
+        self._chunk_size = chunk_size
+        self._cache = list()
+        self._size = 0
+
+    def write(self, data):
+        self._cache.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self._process(final=False)
+
+    def _process(self, final):
+        text = b''.join(self._cache)
+        self._cache = list()
+        self._size = 0
+        if self._strip_newline:
+            text = text.replace(b'\n', b'')
+        for idx, (old, new) in enumerate(self._replacements):
+            text = self._carry[idx] + text
+            if final:
+                safe_end = len(text)
+            else:
+                # a match can not cross the end of the last match, nor start
+                # in the part that is too short to hold one;
+                safe_end = max(len(text) - len(old) + 1, 0)
+                last = text.rfind(old)
+                if last >= 0:
+                    safe_end = max(safe_end, last + len(old))
+            self._carry[idx] = text[safe_end:]
+            text = text[:safe_end].replace(old, new)
+        if len(text):
+            self._fout.write(text)
+
+    def flush(self):
+        """process the collected data, the carried over tail excluded"""
+        if self._size > 0:
+            self._process(final=False)
+
+    def finish(self):
+        """process everything written so far, call it at the end of the output"""
+        self._process(final=True)
+        if hasattr(self._fout, 'flush'):
+            self._fout.flush()
+
+
+#--eof--#
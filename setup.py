@@ -31,6 +31,8 @@ Topic :: Text Editors :: Text Processing
 Topic :: Software Development :: Libraries :: Python Modules
 Intended Audience :: Developers
 Programming Language :: Python
+Programming Language :: Python :: 2.7
+Programming Language :: Python :: 3
 Operating System :: OS Independent
 License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)
 """